@@ -1,40 +1,102 @@
 #!/usr/bin/env python3
 import os
 import json
+import sys
 
-import aws_cdk as cdk
+from mesh_vpccdk.constants import STACK_NAME
+from mesh_vpccdk.postprocess import clean_template, write_clean_template
+from mesh_vpccdk.profiling import StageTimer, maybe_profile, profiling_enabled
+from mesh_vpccdk.synth_cache import SynthCache, cache_enabled, compute_input_hash
+from mesh_vpccdk.synth_server import SynthServerError, request_synth
+from mesh_vpccdk.variants import (
+    VariantPool,
+    get_clean_template_path,
+    get_template_variants,
+    write_variants_manifest,
+)
 
-from mesh_vpccdk.mesh_vpc_cdk_stack import MeshVpcCDKStack
+OUTDIR = os.environ.get("CDK_OUTDIR", "cdk.out")
 
 
-app = cdk.App()
-MeshVpcCDKStack(app, "MeshVpcCDKStack")
+def main():
+    # When a synth server is running (see mesh_vpccdk/synth_server.py), it synthesizes with its
+    # CDK runtime already warm
+    if not profiling_enabled():
+        try:
+            report = request_synth(OUTDIR)
+        except SynthServerError as e:
+            print(f"Synth server failed:\n{e}", file=sys.stderr)
+            return 1
+        if report is not None:
+            print(
+                f"{report}\nSynthesized {STACK_NAME} by synth server", file=sys.stderr
+            )
+            return 0
 
-app.synth()
+    # If none of the synth inputs have changed since a previous build, restore its output
+    # rather than paying for the CDK runtime startup. Profiling always synthesizes, since
+    # that's the point
+    use_cache = cache_enabled() and not profiling_enabled()
+    synth_cache = SynthCache()
+    input_hash = compute_input_hash() if use_cache else None
+    if use_cache and synth_cache.restore(input_hash, OUTDIR):
+        print(
+            f"Inputs unchanged, restored {STACK_NAME} from synth cache", file=sys.stderr
+        )
+        return 0
 
-## Post process JSON to remove CDK specific stuff, since we're vending this as a
-# CloudFormation template:
-with open("cdk.out/MeshVpcCDKStack.template.json", "r") as f:
-    template_json = json.load(f)
-    del template_json["Rules"]
+    default_variant, *other_variants = get_template_variants()
 
-    router_object = [
-        obj
-        for name, obj in template_json["Resources"].items()
-        if name.startswith("VPNRouterInstance") and obj["Type"] == "AWS::EC2::Instance"
-    ][0]
+    timer = StageTimer()
+    with maybe_profile(OUTDIR, timer):
+        # The other variants are synthesized by worker processes while this one synthesizes
+        # the default variant, into OUTDIR itself, where the CDK CLI expects to find it
+        with timer.stage("start_variants"):
+            variant_pool = VariantPool(other_variants, OUTDIR)
 
-    router_object["Properties"][
-        "ImageId"
-    ] = "{{resolve:ssm:/aws/service/canonical/ubuntu/server/focal/stable/current/arm64/hvm/ebs-gp2/ami-id}}"
+        with timer.stage("import"):
+            import aws_cdk as cdk
 
-    params_to_remove = ["BootstrapVersion"]
-    for parameter in template_json["Parameters"]:
-        if parameter.startswith("SsmParameter"):
-            params_to_remove.append(parameter)
+            from mesh_vpccdk.mesh_vpc_cdk_stack import MeshVpcCDKStack
 
-    for parameter in params_to_remove:
-        del template_json["Parameters"][parameter]
+        with timer.stage("app"):
+            app = cdk.App(outdir=OUTDIR)
+        with timer.stage("stack"):
+            MeshVpcCDKStack(
+                app,
+                STACK_NAME,
+                max_wg_tunnels=default_variant["max_wg_tunnels"],
+                architecture=default_variant["architecture"],
+            )
 
-    with open("cdk.out/MeshVpcCDKStack.clean.template.json", "w") as of:
-        json.dump(template_json, of, indent=2)
+        with timer.stage("synth"):
+            app.synth()
+
+        ## Post process JSON to remove CDK specific stuff, since we're vending this as a
+        # CloudFormation template:
+        with timer.stage("postprocess"):
+            with open(f"{OUTDIR}/{STACK_NAME}.template.json", "r") as f:
+                template_json = clean_template(json.load(f))
+
+            print(
+                write_clean_template(
+                    template_json,
+                    get_clean_template_path(OUTDIR, default_variant["name"]),
+                    direct_upload=default_variant["direct_upload"],
+                ),
+                file=sys.stderr,
+            )
+
+        with timer.stage("wait_variants"):
+            for name, report in variant_pool.wait().items():
+                print(f"{name}:\n{report}", file=sys.stderr)
+            write_variants_manifest([default_variant, *other_variants], OUTDIR)
+
+    if use_cache:
+        synth_cache.store(input_hash, OUTDIR)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Times each stage of template synthesis across a range of tunnel counts, and records the size of
+the resulting template and user data:
+
+    python3 -m mesh_vpccdk.benchmark --tunnels 1 2 4 8 16 32 --output cdk.out/benchmark.json
+
+Pass --profile (or set MESH_VPC_PROFILE=1) to also write a cProfile report into --outdir
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from mesh_vpccdk.cloud_config import get_cloud_config
+from mesh_vpccdk.constants import STACK_NAME
+from mesh_vpccdk.fast_synth import DEFAULT_OUTDIR, render_clean_template
+from mesh_vpccdk.postprocess import clean_template
+from mesh_vpccdk.profiling import StageTimer, maybe_profile, profiling_enabled
+
+DEFAULT_TUNNEL_COUNTS = [1, 2, 4, 8, 16, 32]
+
+
+def benchmark_tunnel_count(
+    cdk, stack_class, render_multipart_user_data, max_wg_tunnels
+):
+    timer = StageTimer()
+
+    with timer.stage("cloud_config"):
+        cloud_config = get_cloud_config()
+    with timer.stage("multipart_render"):
+        user_data = render_multipart_user_data(cloud_config)
+
+    with tempfile.TemporaryDirectory() as outdir:
+        with timer.stage("app"):
+            app = cdk.App(outdir=outdir)
+        with timer.stage("stack"):
+            stack_class(app, STACK_NAME, max_wg_tunnels=max_wg_tunnels)
+        with timer.stage("synth"):
+            app.synth()
+        with timer.stage("postprocess"):
+            with open(os.path.join(outdir, f"{STACK_NAME}.template.json"), "r") as f:
+                template_str = json.dumps(clean_template(json.load(f)), indent=2)
+
+    with timer.stage("fast_synth"):
+        json.dumps(render_clean_template(max_wg_tunnels), indent=2)
+
+    return {
+        "max_wg_tunnels": max_wg_tunnels,
+        "timings": timer.timings,
+        "template_bytes": len(template_str.encode("utf-8")),
+        "user_data_bytes": len(user_data.encode("utf-8")),
+    }
+
+
+def run_benchmark(tunnel_counts, repeat=1):
+    timer = StageTimer()
+    with timer.stage("import_aws_cdk"):
+        import aws_cdk as cdk
+
+        from mesh_vpccdk.mesh_vpc_cdk_stack import MeshVpcCDKStack
+        from mesh_vpccdk.util import render_multipart_user_data
+
+    results = []
+    for max_wg_tunnels in tunnel_counts:
+        runs = [
+            benchmark_tunnel_count(
+                cdk, MeshVpcCDKStack, render_multipart_user_data, max_wg_tunnels
+            )
+            for _ in range(repeat)
+        ]
+
+        # Report the fastest run of each stage, which is the least affected by noise
+        result = runs[0]
+        result["timings"] = {
+            stage: min(run["timings"][stage] for run in runs)
+            for stage in result["timings"]
+        }
+        results.append(result)
+
+    return {"startup": timer.timings, "results": results}
+
+
+def format_results(benchmark: dict) -> str:
+    stages = list(benchmark["results"][0]["timings"].keys())
+    header = ["tunnels", *stages, "template_B", "user_data_B"]
+
+    rows = [
+        [
+            str(result["max_wg_tunnels"]),
+            *[f"{result['timings'][stage] * 1000:.1f}ms" for stage in stages],
+            str(result["template_bytes"]),
+            str(result["user_data_bytes"]),
+        ]
+        for result in benchmark["results"]
+    ]
+
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    lines = [
+        f"{name}: {seconds * 1000:.1f}ms"
+        for name, seconds in benchmark["startup"].items()
+    ]
+    for row in [header, *rows]:
+        lines.append("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time each stage of synthesis across a range of tunnel counts"
+    )
+    parser.add_argument("--tunnels", type=int, nargs="+", default=DEFAULT_TUNNEL_COUNTS)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--outdir", default=DEFAULT_OUTDIR)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=profiling_enabled(),
+        help="Write a cProfile report into --outdir",
+    )
+    args = parser.parse_args(argv)
+
+    profile_timer = StageTimer()
+    start = time.perf_counter()
+    with maybe_profile(args.outdir, profile_timer, enabled=args.profile):
+        with profile_timer.stage("benchmark"):
+            benchmark = run_benchmark(args.tunnels, args.repeat)
+
+    print(format_results(benchmark))
+    print(f"Finished in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(benchmark, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
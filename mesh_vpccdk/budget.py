@@ -0,0 +1,199 @@
+import json
+import re
+
+# EC2 rejects user data over 16 KB (before base64 encoding) at launch time, long after
+# CloudFormation has accepted the template, so we check for it at synth time instead
+USER_DATA_LIMIT_BYTES = 16 * 1024
+
+# Standard tier SSM parameters (which are free) can hold up to 4 KB
+SSM_PARAMETER_VALUE_LIMIT_BYTES = 4 * 1024
+
+# The console "magic link" deploys the template from S3, which allows templates up to 1 MB
+TEMPLATE_LIMIT_BYTES = 1_000_000
+
+# Uploading the template file directly (in the console, or with --template-body) is limited to
+# this, once minified. It's only enforced for templates built to be uploaded directly (see
+# DIRECT_UPLOAD_MAX_WG_TUNNELS in constants.py), and reported for the rest
+DIRECT_UPLOAD_LIMIT_BYTES = 51_200
+
+# The direct upload check fails this far short of the hard limit, so that a small change (a new
+# parameter, a longer description) to a template which only just fits is caught when it's made,
+# rather than leaving the next change with nowhere to go
+DIRECT_UPLOAD_HEADROOM_BYTES = 4 * 1024
+
+MAX_PARAMETERS = 200
+MAX_RESOURCES = 500
+MAX_OUTPUTS = 200
+
+PSEUDO_PARAMETER_MAX_LENGTHS = {
+    "AWS::Region": 20,
+    "AWS::AccountId": 12,
+    "AWS::Partition": 10,
+    "AWS::URLSuffix": 20,
+    "AWS::StackName": 128,
+}
+
+# Resource attributes which can be substituted into the user data or SSM parameters
+ATTRIBUTE_MAX_LENGTHS = {
+    "RouteTableId": len("rtb-") + 17,
+    # Of a transit gateway (tgw-...) or its attachment (tgw-attach-...)
+    "Id": len("tgw-attach-") + 17,
+}
+
+# The physical ID a Ref to one of the template's EC2 resources resolves to, at most (e.g. a
+# transit gateway route table's tgw-rtb-0123456789abcdef0)
+RESOURCE_ID_MAX_LENGTH = len("tgw-attach-") + 17
+
+SUB_VARIABLE_REGEX = re.compile(r"\$\{([^!}][^}]*)\}")
+
+
+class TemplateBudgetError(Exception):
+    pass
+
+
+def _max_length(value, variables: dict, parameters: dict, context: str) -> int:
+    """
+    Returns an upper bound on the length of the string value renders to once deployed
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+
+    if isinstance(value, dict) and "Ref" in value:
+        target = value["Ref"]
+        if target in PSEUDO_PARAMETER_MAX_LENGTHS:
+            return PSEUDO_PARAMETER_MAX_LENGTHS[target]
+        if target in parameters:
+            if "AllowedValues" in parameters[target]:
+                return max(
+                    len(allowed_value.encode("utf-8"))
+                    for allowed_value in parameters[target]["AllowedValues"]
+                )
+            if "MaxLength" not in parameters[target]:
+                raise TemplateBudgetError(
+                    f"Parameter {target} is substituted into {context} but has no MaxLength or AllowedValues, "
+                    f"so the size of {context} can't be bounded"
+                )
+            return int(parameters[target]["MaxLength"])
+        if target not in variables:
+            return RESOURCE_ID_MAX_LENGTH
+
+    if isinstance(value, dict) and "Fn::GetAtt" in value:
+        _, attribute = value["Fn::GetAtt"]
+        if attribute in ATTRIBUTE_MAX_LENGTHS:
+            return ATTRIBUTE_MAX_LENGTHS[attribute]
+
+    if isinstance(value, dict) and "Fn::If" in value:
+        _, if_true, if_false = value["Fn::If"]
+        return max(
+            _max_length(if_true, variables, parameters, context),
+            _max_length(if_false, variables, parameters, context),
+        )
+
+    raise TemplateBudgetError(
+        f"Can't bound the length of {json.dumps(value)} which is substituted into {context}"
+    )
+
+
+def max_substituted_bytes(value, parameters: dict, context: str) -> int:
+    """
+    Returns an upper bound on the size of a string or Fn::Sub value once deployed, with every
+    parameter at its maximum length
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict) and ("Ref" in value or "Fn::GetAtt" in value):
+        return _max_length(value, {}, parameters, context)
+    if isinstance(value, dict) and "Fn::Sub" in value:
+        sub = value["Fn::Sub"]
+        body, variables = (sub, {}) if isinstance(sub, str) else sub
+    else:
+        raise TemplateBudgetError(f"Can't bound the size of {context}")
+
+    total = len(SUB_VARIABLE_REGEX.sub("", body).replace("${!", "${").encode("utf-8"))
+    for match in SUB_VARIABLE_REGEX.finditer(body):
+        name = match.group(1)
+        if name in variables:
+            total += _max_length(variables[name], variables, parameters, context)
+        else:
+            total += _max_length({"Ref": name}, variables, parameters, context)
+
+    return total
+
+
+def check_template_budget(
+    template_json: dict, template_str: str, direct_upload: bool = False
+) -> str:
+    """
+    Checks the template against the CloudFormation and EC2 limits which are only otherwise
+    enforced at deploy time, including the direct upload limit if direct_upload is True.
+    Returns a report of how much of each budget is used, or raises a TemplateBudgetError
+    describing every limit which is exceeded
+    """
+    report = []
+    errors = []
+
+    def check(name: str, used: int, limit: int, unit: str, enforced: bool = True):
+        report.append(f"{name}: {used:,} / {limit:,} {unit} ({used / limit:.0%})")
+        if used > limit and enforced:
+            errors.append(f"{name} is {used:,} {unit}, over the limit of {limit:,}")
+
+    check("template", len(template_str.encode("utf-8")), TEMPLATE_LIMIT_BYTES, "bytes")
+    check(
+        f"template minified (direct upload, less {DIRECT_UPLOAD_HEADROOM_BYTES:,} bytes "
+        "of headroom)",
+        len(json.dumps(template_json, separators=(",", ":")).encode("utf-8")),
+        DIRECT_UPLOAD_LIMIT_BYTES - DIRECT_UPLOAD_HEADROOM_BYTES,
+        "bytes",
+        enforced=direct_upload,
+    )
+    check(
+        "parameters",
+        len(template_json.get("Parameters", {})),
+        MAX_PARAMETERS,
+        "parameters",
+    )
+    check(
+        "resources", len(template_json.get("Resources", {})), MAX_RESOURCES, "resources"
+    )
+    check("outputs", len(template_json.get("Outputs", {})), MAX_OUTPUTS, "outputs")
+
+    parameters = template_json.get("Parameters", {})
+    for resource_id, resource in template_json.get("Resources", {}).items():
+        properties = resource.get("Properties", {})
+        # The routers' user data is on their launch template
+        if resource["Type"] == "AWS::EC2::LaunchTemplate":
+            properties = properties.get("LaunchTemplateData", {})
+        if (
+            resource["Type"] in ("AWS::EC2::Instance", "AWS::EC2::LaunchTemplate")
+            and "UserData" in properties
+        ):
+            context = f"{resource_id} user data"
+            check(
+                f"{context} (worst case)",
+                max_substituted_bytes(
+                    properties["UserData"]["Fn::Base64"], parameters, context
+                ),
+                USER_DATA_LIMIT_BYTES,
+                "bytes",
+            )
+        elif resource["Type"] == "AWS::SSM::Parameter" and "Tier" not in properties:
+            context = f"{resource_id} value"
+            used = max_substituted_bytes(properties["Value"], parameters, context)
+            if used > SSM_PARAMETER_VALUE_LIMIT_BYTES:
+                check(
+                    f"{context} (worst case)",
+                    used,
+                    SSM_PARAMETER_VALUE_LIMIT_BYTES,
+                    "bytes",
+                )
+
+    if errors:
+        raise TemplateBudgetError(
+            "Template exceeds deployment limits:\n  "
+            + "\n  ".join(errors)
+            + "\nReduce MAX_WG_TUNNELS (or DIRECT_UPLOAD_MAX_WG_TUNNELS) in "
+            "mesh_vpccdk/constants.py, or trim the cloud-init fragments and parameter "
+            "descriptions in mesh_vpccdk/"
+        )
+
+    return "\n".join(report)
@@ -0,0 +1,253 @@
+import base64
+import functools
+import gzip
+import hashlib
+import json
+import os
+import textwrap
+
+from mesh_vpccdk.constants import (
+    ROUTER_CONFIG_PARAMETER_PATH,
+    ROUTER_FILES_PREFIX,
+    ROUTER_PACKAGES,
+    TEMPLATE_BUCKET,
+)
+from mesh_vpccdk.fragments import render_fragment
+
+THIS_DIRECTORY = os.path.join(os.path.dirname(__file__))
+CLOUD_INIT_FILE_PATH = os.path.join(THIS_DIRECTORY, "router_instance_cloud_init.yml")
+ROUTER_AGENTS_DIRECTORY = os.path.join(THIS_DIRECTORY, "router_agents")
+ROUTER_IMAGE_COMPONENT_FILE_PATH = os.path.join(
+    THIS_DIRECTORY, "router_image_component.yml"
+)
+
+ROUTER_TEMPLATE_DIRECTORY = "/etc/mesh-vpc/templates"
+
+# ROUTER_FILES are bundled into this file in the build's output directory. The stack publishes
+# it as a CDK asset, for `cdk deploy`, and upload.py publishes it to TEMPLATE_BUCKET alongside
+# the clean templates
+ROUTER_FILES_BUNDLE_FILENAME = "router-files.json.gz"
+
+# Files copied verbatim onto the router, as
+# (path relative to this directory, path on the router, permissions). Together these would put
+# the template far over the size limit for uploading it directly, let alone fit in EC2's 16 KB
+# user data limit, so only BOOT_FILES are embedded in the user data. mesh-router-fetch then
+# downloads ROUTER_FILES, including the first boot steps, from the bundle (see
+# ROUTER_FILES_BUNDLE_FILENAME), checking it against the hash in the global router config
+BOOT_FILES = [
+    (
+        "router_agents/mesh_router_fetch.py",
+        "/usr/local/bin/mesh-router-fetch",
+        "0755",
+    ),
+]
+
+ROUTER_FILES = [
+    (
+        "router_agents/mesh_router_boot.py",
+        "/usr/local/bin/mesh-router-boot",
+        "0755",
+    ),
+    (
+        "router_agents/mesh_router_first_boot.sh",
+        "/usr/local/bin/mesh-router-first-boot",
+        "0755",
+    ),
+    ("bird.conf", f"{ROUTER_TEMPLATE_DIRECTORY}/bird.conf", "0644"),
+    ("bfd.conf", f"{ROUTER_TEMPLATE_DIRECTORY}/bfd.conf", "0644"),
+    (
+        "mesh_aggregates.conf",
+        f"{ROUTER_TEMPLATE_DIRECTORY}/mesh_aggregates.conf",
+        "0644",
+    ),
+    ("ospf_interface.conf", f"{ROUTER_TEMPLATE_DIRECTORY}/ospf_interface.conf", "0644"),
+    ("nftables.conf", f"{ROUTER_TEMPLATE_DIRECTORY}/nftables.conf", "0644"),
+    (
+        "nftables_fast_path.conf",
+        f"{ROUTER_TEMPLATE_DIRECTORY}/nftables_fast_path.conf",
+        "0644",
+    ),
+    ("unbound.conf", f"{ROUTER_TEMPLATE_DIRECTORY}/unbound.conf", "0644"),
+    (
+        "wg_tunnel_config.yml",
+        f"{ROUTER_TEMPLATE_DIRECTORY}/wg_tunnel_config.yml",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_config.py",
+        "/usr/local/bin/mesh-router-config",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-config.service",
+        "/etc/systemd/system/mesh-router-config.service",
+        "0644",
+    ),
+    (
+        "router_agents/mesh-router-config.timer",
+        "/etc/systemd/system/mesh-router-config.timer",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_failover.py",
+        "/usr/local/bin/mesh-router-failover",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-failover.service",
+        "/etc/systemd/system/mesh-router-failover.service",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_telemetry.py",
+        "/usr/local/bin/mesh-router-telemetry",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-telemetry.service",
+        "/etc/systemd/system/mesh-router-telemetry.service",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_cost.py",
+        "/usr/local/bin/mesh-router-cost",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-cost.service",
+        "/etc/systemd/system/mesh-router-cost.service",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_accounting.py",
+        "/usr/local/bin/mesh-router-accounting",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-accounting.service",
+        "/etc/systemd/system/mesh-router-accounting.service",
+        "0644",
+    ),
+    (
+        "router_agents/mesh_router_tune.py",
+        "/usr/local/bin/mesh-router-tune",
+        "0755",
+    ),
+    (
+        "router_agents/mesh-router-tune.service",
+        "/etc/systemd/system/mesh-router-tune.service",
+        "0644",
+    ),
+]
+
+
+def encode_file_content(content: bytes) -> str:
+    # EC2 limits user data to 16 KB, so the files are embedded gzipped. A fixed mtime keeps the
+    # output identical between synths, since any change to the user data interrupts the router.
+    # Base64 also has no ${ sequences, so the router-side templates' ${} placeholders don't
+    # need escaping from the Fn::Sub the user data is passed through
+    return base64.encodebytes(gzip.compress(content, compresslevel=9, mtime=0)).decode(
+        "ascii"
+    )
+
+
+def get_write_file_config(
+    source_path: str, destination_path: str, permissions: str
+) -> dict:
+    """
+    Returns the context for one entry of the cloud-config's boot_files loop
+    """
+    with open(os.path.join(THIS_DIRECTORY, source_path), "rb") as f:
+        content = f.read()
+
+    return {
+        # Indented into the entry's content block scalar
+        "content": textwrap.indent(encode_file_content(content).rstrip("\n"), "    "),
+        "path": destination_path,
+        "permissions": permissions,
+    }
+
+
+def get_cloud_config() -> str:
+    """
+    Renders the cloud-config fragment (see fragments.py), with the BOOT_FILES embedded
+    """
+    return render_fragment(
+        CLOUD_INIT_FILE_PATH,
+        router_config_path=ROUTER_CONFIG_PARAMETER_PATH,
+        boot_files=[
+            get_write_file_config(source_path, destination_path, permissions)
+            for source_path, destination_path, permissions in BOOT_FILES
+        ],
+    )
+
+
+def get_router_files() -> dict:
+    """
+    Returns the content and permissions of each of ROUTER_FILES, by its path on the router
+    """
+    files = {}
+    for source_path, destination_path, permissions in ROUTER_FILES:
+        with open(os.path.join(THIS_DIRECTORY, source_path), "r") as f:
+            files[destination_path] = {"content": f.read(), "mode": permissions}
+
+    return files
+
+
+@functools.lru_cache(maxsize=None)
+def get_router_files_bundle() -> bytes:
+    """
+    Returns ROUTER_FILES as gzipped JSON (see get_router_files()), as mesh-router-fetch reads them
+    """
+    # A fixed mtime keeps the bundle, and so its hash and published URL, identical between builds
+    return gzip.compress(
+        json.dumps(get_router_files(), separators=(",", ":")).encode("utf-8"),
+        compresslevel=9,
+        mtime=0,
+    )
+
+
+def get_router_files_bundle_key(digest: str) -> str:
+    """
+    Returns the key the router files bundle with this SHA-256 hash is published to in
+    TEMPLATE_BUCKET. It's addressed by its hash, so routers launched from older templates keep
+    fetching the files they expect
+    """
+    return f"{ROUTER_FILES_PREFIX}/{digest}.json.gz"
+
+
+def get_router_files_bundle_digest() -> str:
+    return hashlib.sha256(get_router_files_bundle()).hexdigest()
+
+
+def get_published_router_files_location() -> dict:
+    """
+    Returns the bucket and key upload.py publishes the router files bundle to, which the clean
+    templates point the routers at
+    """
+    return {
+        "bucket": TEMPLATE_BUCKET,
+        "key": get_router_files_bundle_key(get_router_files_bundle_digest()),
+    }
+
+
+def write_router_files_bundle(outdir: str) -> str:
+    os.makedirs(outdir, exist_ok=True)
+    output_path = os.path.join(outdir, ROUTER_FILES_BUNDLE_FILENAME)
+    with open(output_path, "wb") as f:
+        f.write(get_router_files_bundle())
+    return output_path
+
+
+def get_router_packages_list(preinstalled: bool) -> str:
+    """
+    Returns the YAML flow sequence substituted for ${RouterPackages} in the cloud-config
+    """
+    # An empty list also stops cloud-init running apt-get update
+    return "[]" if preinstalled else f"[{', '.join(ROUTER_PACKAGES)}]"
+
+
+def get_router_image_component() -> str:
+    return render_fragment(
+        ROUTER_IMAGE_COMPONENT_FILE_PATH, router_packages=" ".join(ROUTER_PACKAGES)
+    )
@@ -1 +1,153 @@
 MESH_CIDRS = ["10.0.0.0/8", "199.167.59.0/24", "199.170.132.0/24"]
+
+SN3_VPN_SERVER_IP = "199.170.132.4"
+SN3_VPN_SERVER_PUBLIC_KEY = "FRjRFt/XnSa1tDqnH5g3Y6CikIar/bq3uwUh5vfU/UI="
+
+# The SN3 core router. The standby router of a high availability pair pings this via the active
+# router to check that it is still routing to the mesh, and with aggregate route filtering the
+# router's routes to MESH_CIDRS follow the OSPF route to it
+FAILOVER_HEALTH_CHECK_TARGET = "10.69.7.13"
+
+# With the RouterDNSResolver parameter enabled, the router's caching resolver forwards queries
+# for these zones to the mesh's resolvers (over the tunnels), and everything else to
+# AMAZON_DNS_SERVER
+MESH_DNS_SERVERS = ["10.10.10.10", "10.10.10.11"]
+MESH_DNS_ZONES = ["mesh", "mesh.nycmesh.net", "10.in-addr.arpa"]
+
+# The Amazon provided DNS server, at the same link-local address in every VPC
+AMAZON_DNS_SERVER = "169.254.169.253"
+
+CIDR_REGEX = r"^([0-9]{1,3}\.){3}[0-9]{1,3}(\/([0-9]|[1-2][0-9]|3[0-2]))?$"
+IPV4_ADDR_REGEX = r"^([0-9]{1,3}\.){3}[0-9]{1,3}$"
+PORT_NUMBER_REGEX = r"^[0-9]{1,5}$"
+WG_KEY_REGEX = r"^([A-z0-9\/\+]{43}\=)$"
+SUFFIX_TO_INDICATE_OPTIONAL = r"|^$"
+
+# Upper bounds on the length of values matching the regexes above. These are set as MaxLength on
+# the parameters, and let us bound the size of the user data once they are substituted in
+MAX_CIDR_LENGTH = 18
+MAX_IPV4_ADDR_LENGTH = 15
+MAX_PORT_NUMBER_LENGTH = 5
+WG_KEY_LENGTH = 44
+
+MAX_WG_TUNNELS = 16
+
+# WireGuard's own default, which fits its 80 bytes of (IPv6) encapsulation overhead into the
+# 1500 byte MTU of the internet path between the router and the mesh. It's also the largest a
+# tunnel's MTU can be: the VPC-side MTU doesn't matter, since the tunnels' packets leave AWS
+DEFAULT_WG_TUNNEL_MTU = "1420"
+# 576 (the smallest MTU IPv4 hosts must accept) to 1420
+WG_TUNNEL_MTU_REGEX = (
+    r"^(57[6-9]|5[89][0-9]|[6-9][0-9]{2}|1[0-3][0-9]{2}|14[01][0-9]|1420)$"
+)
+
+# OSPF hello intervals longer than bird's default of 10 seconds only slow down failure detection.
+# Capping them also keeps the template rule checking that the dead interval is longer small,
+# since CloudFormation rules can't compare numbers, so it lists the dead intervals too short for
+# each hello interval
+MAX_OSPF_HELLO_INTERVAL = 10
+OSPF_HELLO_INTERVAL_REGEX = r"^([1-9]|10)$"
+MAX_OSPF_HELLO_INTERVAL_LENGTH = 2
+# 2 to 65535 (the longest bird allows)
+OSPF_DEAD_INTERVAL_REGEX = (
+    r"^([2-9]|[1-9][0-9]{1,3}|[1-5][0-9]{4}|6[0-4][0-9]{3}|65[0-4][0-9]{2}|655[0-2][0-9]"
+    r"|6553[0-5])$"
+)
+
+# The MTU of the router's VPC-facing interface. AWS supports jumbo frames within a VPC
+VPC_MTUS = ["9001", "1500"]
+
+# With the multi-az MeshSubnetLayout, the mesh CIDR is split into this many subnets, each in its
+# own availability zone with its own route table, and (when any tunnels are assigned to it, see
+# router_config.get_tunnel_zone()) its own router
+MULTI_AZ_SUBNETS = 2
+
+# In us-east-1, subnets are placed by availability zone ID rather than name, since AZ names are
+# mapped to different zones in each account. use1-az1 is where the router has always run
+US_EAST_1_AVAILABILITY_ZONE_IDS = ["use1-az1", "use1-az2"]
+
+# The sizes a multi-az subnet can be, and the number of host bits Fn::Cidr needs for each
+MULTI_AZ_SUBNET_HOST_BITS = {str(32 - bits): bits for bits in range(4, 12)}
+
+# The first tunnel listens on 51811, the second on 51812, etc.
+WG_LISTEN_PORT_BASE = 51810
+
+# The stack publishes the router's tunnel config as parameters under this path, which the router
+# polls and applies in place (see router_agents/mesh_router_config.py)
+ROUTER_CONFIG_PARAMETER_PATH = "/MeshVPC/RouterConfig"
+
+# The WireGuard private key shared by a high availability router pair, which the first router to
+# boot generates (see router_agents/mesh_router_failover.py)
+SHARED_KEY_PARAMETER_NAME = "/MeshVPC/RouterPrivateKey"
+
+# The instance tag holding each router's initial role: "active", or "standby" on the standby
+# router of a high availability pair (see router_agents/mesh_router_failover.py)
+ROUTER_ROLE_TAG = "MeshRouterRole"
+
+# The instance tag holding the availability zone (numbered from 1) each router serves, which
+# decides the tunnels it brings up (see router_agents/mesh_router_config.py)
+ROUTER_ZONE_TAG = "MeshRouterZone"
+
+# The CloudWatch namespace the router's metrics are sent to (see
+# router_agents/mesh_router_telemetry.py)
+ROUTER_METRICS_NAMESPACE = "MeshVPC/Router"
+
+STACK_NAME = "MeshVpcCDKStack"
+
+# The public bucket the templates are published to (see upload.py), along with the router files
+# bundle, under ROUTER_FILES_PREFIX, which the routers download on first boot. A fork publishing
+# its own templates must change this to its bucket
+TEMPLATE_BUCKET = "nycmesh-cloudformation-templates"
+ROUTER_FILES_PREFIX = "router-files"
+
+# A stack with a TransitGatewaySpokeCIDR is a hub, whose router serves spoke VPCs attached to its
+# transit gateway. The hub publishes the transit gateway's IDs to these parameters, which the
+# spoke stack (see spoke_vpc_stack.py) reads by default
+SPOKE_STACK_NAME = "MeshSpokeVpcStack"
+TRANSIT_GATEWAY_ID_PARAMETER_NAME = "/MeshVPC/TransitGatewayId"
+TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME = "/MeshVPC/TransitGatewayRouteTableId"
+
+# The router architectures the template can be built for, each with its own stock router image
+ARCHITECTURES = ["arm64", "amd64"]
+DEFAULT_ARCHITECTURE = "arm64"
+
+# The RouterProfile stack parameter's values for each architecture, and the instance type each
+# one runs on. The last is the network optimized profile. The router tunes its kernel and NIC to
+# match (see router_agents/mesh_router_tune.py), which must be kept in step with this
+ROUTER_PROFILES = {
+    "arm64": {
+        "nano": "t4g.nano",
+        "small": "t4g.small",
+        "c7gn": "c7gn.large",
+    },
+    "amd64": {
+        "nano": "t3.nano",
+        "small": "t3.small",
+        "c6in": "c6in.large",
+    },
+}
+DEFAULT_ROUTER_PROFILE = "nano"
+
+# The instance type EC2 Image Builder bakes the router image on
+IMAGE_BUILD_INSTANCE_TYPES = {"arm64": "t4g.small", "amd64": "t3.small"}
+
+# Variants with at most this many tunnels (and the spoke stack's template) must fit the limit for
+# uploading a template directly (see budget.py), so the build fails if they don't. Larger
+# variants can't: their tunnel parameters, conditions and console metadata alone exceed it, so
+# they're only deployable from S3. Three tunnels (as many as the original template had) leaves
+# room under the limit for the stack's other features to grow
+DIRECT_UPLOAD_MAX_WG_TUNNELS = 3
+
+# The template variants app.py builds, by the number of WireGuard tunnels and router
+# architecture. The first is the default, which keeps the original template name
+TEMPLATE_VARIANT_WG_TUNNELS = [MAX_WG_TUNNELS, DIRECT_UPLOAD_MAX_WG_TUNNELS]
+TEMPLATE_VARIANT_ARCHITECTURES = ARCHITECTURES
+
+# Installed by cloud-init on the stock image, or preinstalled in the baked router image
+ROUTER_PACKAGES = ["bird", "wireguard", "awscli", "nftables", "unbound"]
+
+ROUTER_AMI_SSM_PARAMETERS = {
+    architecture: "/aws/service/canonical/ubuntu/server/focal/stable/current/"
+    f"{architecture}/hvm/ebs-gp2/ami-id"
+    for architecture in ARCHITECTURES
+}
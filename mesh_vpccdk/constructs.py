@@ -1,17 +1,49 @@
+import hashlib
+
 import aws_cdk as cdk
 from aws_cdk import (
     aws_ec2 as ec2,
     aws_iam as iam,
+    aws_imagebuilder as imagebuilder,
     aws_ssm as ssm,
 )
 from constructs import Construct
 
-from mesh_vpccdk.constants import MESH_CIDRS
-from mesh_vpccdk.util import name_tag, get_user_data
+from mesh_vpccdk.cloud_config import get_router_image_component
+from mesh_vpccdk.constants import (
+    MESH_CIDRS,
+    MULTI_AZ_SUBNETS,
+    ROUTER_CONFIG_PARAMETER_PATH,
+    ROUTER_METRICS_NAMESPACE,
+    ROUTER_ROLE_TAG,
+    ROUTER_ZONE_TAG,
+    SHARED_KEY_PARAMETER_NAME,
+    TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+    TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+    US_EAST_1_AVAILABILITY_ZONE_IDS,
+)
+from mesh_vpccdk.router_config import (
+    FAILOVER_CONFIG_PARAMETER_NAME,
+    GLOBAL_CONFIG_PARAMETER_NAME,
+    get_failover_config_template,
+    get_global_config_template,
+    get_router_files_arn_template,
+    get_tunnel_config_parameter_name,
+    get_tunnel_config_template,
+)
+from mesh_vpccdk.util import name_tag
 
 
 class CoreVPCInfrastructure(Construct):
-    def __init__(self, scope, id, vpc_cidr):
+    def __init__(
+        self,
+        scope,
+        id,
+        vpc_cidr,
+        multi_az_subnet_host_bits,
+        multi_az_condition,
+        us_east_1_condition,
+    ):
         super().__init__(scope, id)
 
         self.cfn_vpc = ec2.CfnVPC(
@@ -21,29 +53,6 @@ class CoreVPCInfrastructure(Construct):
             tags=[name_tag("MeshVPC")],
         )
 
-        self.cfn_subnet = ec2.CfnSubnet(
-            self,
-            "MeshSubnet",
-            vpc_id=self.cfn_vpc.attr_vpc_id,
-            cidr_block=vpc_cidr,
-            availability_zone_id="use1-az1",
-            map_public_ip_on_launch=True,
-            tags=[name_tag("MeshSubnet")],
-        )
-
-        self.cfn_route_table = ec2.CfnRouteTable(
-            self,
-            "MeshRouteTable",
-            vpc_id=self.cfn_vpc.attr_vpc_id,
-            tags=[name_tag("MeshVPCRouteTable")],
-        )
-        ec2.CfnSubnetRouteTableAssociation(
-            self,
-            "MeshRouteTableAttachment",
-            route_table_id=self.cfn_route_table.attr_route_table_id,
-            subnet_id=self.cfn_subnet.attr_subnet_id,
-        )
-
         self.igw = ec2.CfnInternetGateway(self, "MeshIGW", tags=[name_tag("MeshIGW")])
         ec2.CfnVPCGatewayAttachment(
             self,
@@ -51,13 +60,33 @@ class CoreVPCInfrastructure(Construct):
             vpc_id=self.cfn_vpc.attr_vpc_id,
             internet_gateway_id=self.igw.attr_internet_gateway_id,
         )
-        internet_route = ec2.CfnRoute(
-            self,
-            "InternetRoute",
-            route_table_id=self.cfn_route_table.attr_route_table_id,
-            destination_cidr_block="0.0.0.0/0",
-            gateway_id=self.igw.attr_internet_gateway_id,
+
+        self._multi_az_condition = multi_az_condition
+        self._us_east_1_condition = us_east_1_condition
+
+        # The first availability zone's subnet spans the whole mesh CIDR, unless it is split
+        # across several zones
+        multi_az_cidr_blocks = cdk.Fn.cidr(
+            vpc_cidr, MULTI_AZ_SUBNETS, multi_az_subnet_host_bits
         )
+        self.cfn_subnets = []
+        self.cfn_route_tables = []
+        for i in range(MULTI_AZ_SUBNETS):
+            self._add_availability_zone(
+                i,
+                (
+                    cdk.Fn.condition_if(
+                        multi_az_condition.logical_id,
+                        cdk.Fn.select(0, multi_az_cidr_blocks),
+                        vpc_cidr,
+                    ).to_string()
+                    if i == 0
+                    else cdk.Fn.select(i, multi_az_cidr_blocks)
+                ),
+            )
+
+        self.cfn_subnet = self.cfn_subnets[0]
+        self.cfn_route_table = self.cfn_route_tables[0]
 
         self.router_security_group = ec2.CfnSecurityGroup(
             self,
@@ -83,31 +112,444 @@ class CoreVPCInfrastructure(Construct):
             ],
         )
 
+    def _add_availability_zone(self, index, cidr_block):
+        # The first zone keeps the IDs it had before there were several
+        suffix = f"AZ{index + 1}" if index else ""
+        condition = self._multi_az_condition if index else None
+
+        subnet = ec2.CfnSubnet(
+            self,
+            f"MeshSubnet{suffix}",
+            vpc_id=self.cfn_vpc.attr_vpc_id,
+            cidr_block=cidr_block,
+            availability_zone_id=cdk.Fn.condition_if(
+                self._us_east_1_condition.logical_id,
+                US_EAST_1_AVAILABILITY_ZONE_IDS[index],
+                cdk.Aws.NO_VALUE,
+            ).to_string(),
+            availability_zone=cdk.Fn.condition_if(
+                self._us_east_1_condition.logical_id,
+                cdk.Aws.NO_VALUE,
+                cdk.Fn.select(index, cdk.Fn.get_azs()),
+            ).to_string(),
+            map_public_ip_on_launch=True,
+            tags=[name_tag(f"MeshSubnet{suffix}")],
+        )
+        route_table = ec2.CfnRouteTable(
+            self,
+            f"MeshRouteTable{suffix}",
+            vpc_id=self.cfn_vpc.attr_vpc_id,
+            tags=[name_tag(f"MeshVPCRouteTable{suffix}")],
+        )
+        route_table_association = ec2.CfnSubnetRouteTableAssociation(
+            self,
+            f"MeshRouteTableAttachment{suffix}",
+            route_table_id=route_table.attr_route_table_id,
+            subnet_id=subnet.attr_subnet_id,
+        )
+        internet_route = ec2.CfnRoute(
+            self,
+            f"InternetRoute{suffix}",
+            route_table_id=route_table.attr_route_table_id,
+            destination_cidr_block="0.0.0.0/0",
+            gateway_id=self.igw.attr_internet_gateway_id,
+        )
+
+        if condition:
+            for resource in [
+                subnet,
+                route_table,
+                route_table_association,
+                internet_route,
+            ]:
+                resource.cfn_options.condition = condition
+        else:
+            self.route_table_association = route_table_association
+            self.internet_route = internet_route
+
+        self.cfn_subnets.append(subnet)
+        self.cfn_route_tables.append(route_table)
+
+    def get_route_table_ids(self):
+        """
+        Returns the ID of each availability zone's route table, or of the first zone's in place
+        of those which don't exist (i.e. with the single subnet layout)
+        """
+        return [
+            (
+                cdk.Fn.condition_if(
+                    self._multi_az_condition.logical_id,
+                    route_table.attr_route_table_id,
+                    self.cfn_route_table.attr_route_table_id,
+                ).to_string()
+                if i
+                else route_table.attr_route_table_id
+            )
+            for i, route_table in enumerate(self.cfn_route_tables)
+        ]
+
+    def get_subnet_ids(self):
+        """
+        Returns the ID of each availability zone's subnet, leaving out those which don't exist
+        """
+        return [
+            (
+                cdk.Fn.condition_if(
+                    self._multi_az_condition.logical_id,
+                    subnet.attr_subnet_id,
+                    cdk.Aws.NO_VALUE,
+                ).to_string()
+                if i
+                else subnet.attr_subnet_id
+            )
+            for i, subnet in enumerate(self.cfn_subnets)
+        ]
+
+    def add_transit_gateway_routes(
+        self, name, transit_gateway_id, cidrs, attachment, conditions
+    ):
+        """
+        Routes each of cidrs to the transit gateway, from every availability zone's route
+        table. conditions holds the condition (or None) for each zone's routes
+        """
+        for az, route_table in enumerate(self.cfn_route_tables):
+            suffix = f" AZ{az + 1}" if az else ""
+            for i, cidr in enumerate(cidrs):
+                route = ec2.CfnRoute(
+                    self,
+                    f"{name} {i}{suffix}",
+                    route_table_id=route_table.attr_route_table_id,
+                    destination_cidr_block=cidr,
+                    transit_gateway_id=transit_gateway_id,
+                )
+                # A route to a transit gateway can only be created once the VPC is attached
+                route.add_dependency(attachment)
+                if conditions[az]:
+                    route.cfn_options.condition = conditions[az]
+
+    def add_dhcp_options(self, domain_name_servers, condition):
+        """
+        Points the VPC's instances at domain_name_servers (in order) in place of the Amazon
+        provided resolver. Without this (i.e. unless condition holds), the VPC keeps the
+        region's default DHCP options
+        """
+        dhcp_options = ec2.CfnDHCPOptions(
+            self,
+            "MeshDHCPOptions",
+            # The domain name the default DHCP options set, so instances' hostnames don't change
+            domain_name=cdk.Fn.condition_if(
+                self._us_east_1_condition.logical_id,
+                "ec2.internal",
+                cdk.Fn.sub("${AWS::Region}.compute.internal"),
+            ).to_string(),
+            domain_name_servers=domain_name_servers,
+            tags=[name_tag("MeshDHCPOptions")],
+        )
+        association = ec2.CfnVPCDHCPOptionsAssociation(
+            self,
+            "MeshDHCPOptionsAssociation",
+            vpc_id=self.cfn_vpc.attr_vpc_id,
+            dhcp_options_id=dhcp_options.ref,
+        )
+        for resource in [dhcp_options, association]:
+            resource.cfn_options.condition = condition
+
     def add_mesh_routes(
-        self, router_instance_id, vpn_endpoint_addrs, wg_server_provided_conditions
+        self,
+        router_instance_ids,
+        vpn_endpoint_addrs,
+        wg_server_provided_conditions,
+        multi_az_wg_server_provided_conditions,
     ):
-        # Add routes to the mesh
-        for i, cidr in enumerate(MESH_CIDRS):
-            ec2.CfnRoute(
+        """
+        Routes the mesh from each availability zone's route table via the router in
+        router_instance_ids (one per zone), so the mesh traffic stays within the zone
+        """
+        for az, route_table in enumerate(self.cfn_route_tables):
+            suffix = f" AZ{az + 1}" if az else ""
+
+            # Add routes to the mesh
+            for i, cidr in enumerate(MESH_CIDRS):
+                mesh_route = ec2.CfnRoute(
+                    self,
+                    f"Mesh CIDR {i}{suffix}",
+                    route_table_id=route_table.attr_route_table_id,
+                    destination_cidr_block=cidr,
+                    instance_id=router_instance_ids[az],
+                )
+                if az:
+                    mesh_route.cfn_options.condition = self._multi_az_condition
+
+            # Make sure we have a more specific route to each VPN server so its
+            # traffic goes directly out via the IGW
+            for i in range(len(wg_server_provided_conditions)):
+
+                vpn_server_route = ec2.CfnRoute(
+                    self,
+                    f"Mesh VPN Endpoint {i + 1} Goes via IGW{suffix}",
+                    route_table_id=route_table.attr_route_table_id,
+                    destination_cidr_block=cdk.Fn.join(
+                        "", [vpn_endpoint_addrs[i], "/32"]
+                    ),
+                    gateway_id=self.igw.attr_internet_gateway_id,
+                )
+                vpn_server_route.cfn_options.condition = (
+                    multi_az_wg_server_provided_conditions[i]
+                    if az
+                    else wg_server_provided_conditions[i]
+                )
+
+
+class TransitGatewayHub(Construct):
+    def __init__(self, scope, id, core_vpc_infra, condition):
+        super().__init__(scope, id)
+
+        # Attachments are associated with (and propagate their VPC's CIDR to) route_table
+        # explicitly, since the default route table's ID isn't available to spoke stacks
+        self.transit_gateway = ec2.CfnTransitGateway(
+            self,
+            "TransitGateway",
+            description="Connects spoke VPCs to the mesh via the mesh VPC's router",
+            auto_accept_shared_attachments="enable",
+            default_route_table_association="disable",
+            default_route_table_propagation="disable",
+            tags=[name_tag("MeshTransitGateway")],
+        )
+        self.route_table = ec2.CfnTransitGatewayRouteTable(
+            self,
+            "RouteTable",
+            transit_gateway_id=self.transit_gateway.attr_id,
+            tags=[name_tag("MeshTransitGatewayRouteTable")],
+        )
+        self.attachment = ec2.CfnTransitGatewayAttachment(
+            self,
+            "Attachment",
+            transit_gateway_id=self.transit_gateway.attr_id,
+            vpc_id=core_vpc_infra.cfn_vpc.attr_vpc_id,
+            subnet_ids=core_vpc_infra.get_subnet_ids(),
+            tags=[name_tag("MeshTransitGatewayHubAttachment")],
+        )
+        resources = [
+            self.transit_gateway,
+            self.route_table,
+            self.attachment,
+            ec2.CfnTransitGatewayRouteTableAssociation(
                 self,
-                f"Mesh CIDR {i}",
-                route_table_id=self.cfn_route_table.attr_route_table_id,
-                destination_cidr_block=cidr,
-                instance_id=router_instance_id,
+                "Association",
+                transit_gateway_attachment_id=self.attachment.attr_id,
+                transit_gateway_route_table_id=self.route_table.ref,
+            ),
+            ec2.CfnTransitGatewayRouteTablePropagation(
+                self,
+                "Propagation",
+                transit_gateway_attachment_id=self.attachment.attr_id,
+                transit_gateway_route_table_id=self.route_table.ref,
+            ),
+        ]
+
+        # Spokes send all of their mesh traffic to the hub VPC, whose route tables send it on
+        # to the router. The spokes' own (more specific) CIDRs are propagated by their
+        # attachments, so traffic between spokes stays within the transit gateway
+        for i, cidr in enumerate(MESH_CIDRS):
+            resources.append(
+                ec2.CfnTransitGatewayRoute(
+                    self,
+                    f"Mesh CIDR {i}",
+                    destination_cidr_block=cidr,
+                    transit_gateway_attachment_id=self.attachment.attr_id,
+                    transit_gateway_route_table_id=self.route_table.ref,
+                )
             )
 
-        # Make sure we have a more specific route to each VPN server so its
-        # traffic goes directly out via the IGW
-        for i in range(len(wg_server_provided_conditions)):
+        # Read by the spoke stacks' parameters by default
+        resources += [
+            ssm.CfnParameter(
+                self,
+                "TransitGatewayIdParameter",
+                name=TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+                description="The ID of the mesh VPC's transit gateway, for spoke VPCs",
+                type="String",
+                value=self.transit_gateway.attr_id,
+            ),
+            ssm.CfnParameter(
+                self,
+                "RouteTableIdParameter",
+                name=TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+                description="The ID of the mesh VPC's transit gateway route table, for "
+                "spoke VPCs",
+                type="String",
+                value=self.route_table.ref,
+            ),
+        ]
+
+        for resource in resources:
+            resource.cfn_options.condition = condition
+
+
+class RouterConfigParameters(Construct):
+    def __init__(
+        self,
+        scope,
+        id,
+        max_wg_tunnels,
+        wg_server_provided_conditions,
+        router_files_variables,
+    ):
+        super().__init__(scope, id)
 
-            vpn_server_route = ec2.CfnRoute(
+        # The router polls these and applies any changes in place, so unlike the user data
+        # they can be updated without replacing the instance
+        self.global_parameter = ssm.CfnParameter(
+            self,
+            "Global",
+            name=GLOBAL_CONFIG_PARAMETER_NAME,
+            description="Mesh router config shared by all WireGuard tunnels",
+            type="String",
+            value=cdk.Fn.sub(get_global_config_template(), router_files_variables),
+        )
+
+        self.tunnel_parameters = []
+        for i in range(max_wg_tunnels):
+            tunnel_parameter = ssm.CfnParameter(
                 self,
-                f"Mesh VPN Endpoint {i + 1} Goes via IGW",
-                route_table_id=self.cfn_route_table.attr_route_table_id,
-                destination_cidr_block=cdk.Fn.join("", [vpn_endpoint_addrs[i], "/32"]),
-                gateway_id=self.igw.attr_internet_gateway_id,
+                f"Tunnel{i + 1}",
+                name=get_tunnel_config_parameter_name(i),
+                description=f"Mesh router config for WireGuard tunnel {i + 1}",
+                type="String",
+                value=cdk.Fn.sub(get_tunnel_config_template(i)),
             )
-            vpn_server_route.cfn_options.condition = wg_server_provided_conditions[i]
+            tunnel_parameter.cfn_options.condition = wg_server_provided_conditions[i]
+            self.tunnel_parameters.append(tunnel_parameter)
+
+    def add_failover_parameter(
+        self, route_table_ids, shared_route_table_ids, condition
+    ):
+        """
+        route_table_ids holds each availability zone's route table ID, and
+        shared_route_table_ids, for each zone after the first, its route table ID when the
+        first zone's router serves it (see get_failover_config_template())
+        """
+        self.failover_parameter = ssm.CfnParameter(
+            self,
+            "Failover",
+            name=FAILOVER_CONFIG_PARAMETER_NAME,
+            description="Mesh router config for failing over between the router pair",
+            type="String",
+            value=cdk.Fn.sub(
+                get_failover_config_template(),
+                {
+                    **{
+                        f"RouteTableId{i + 1}": route_table_id
+                        for i, route_table_id in enumerate(route_table_ids)
+                    },
+                    **{
+                        f"SharedRouteTableId{zone}": route_table_id
+                        for zone, route_table_id in enumerate(
+                            shared_route_table_ids, start=2
+                        )
+                    },
+                },
+            ),
+        )
+        self.failover_parameter.cfn_options.condition = condition
+
+
+class RouterImagePipeline(Construct):
+    def __init__(
+        self, scope, id, core_vpc_infra, parent_image, build_instance_type, condition
+    ):
+        super().__init__(scope, id)
+
+        component_document = get_router_image_component()
+
+        # Image Builder components and recipes are immutable, so name them after the component
+        # document to create new ones (rather than fail to update them) whenever it changes
+        document_hash = hashlib.sha256(component_document.encode("utf-8")).hexdigest()[
+            :8
+        ]
+
+        build_role = iam.CfnRole(
+            self,
+            "BuildInstanceRole",
+            assume_role_policy_document={
+                "Statement": [
+                    {
+                        "Action": "sts:AssumeRole",
+                        "Effect": "Allow",
+                        "Principal": {"Service": "ec2.amazonaws.com"},
+                    }
+                ],
+                "Version": "2012-10-17",
+            },
+            description="Role for the EC2 Image Builder instance which bakes the router image",
+            managed_policy_arns=[
+                f"arn:{cdk.Aws.PARTITION}:iam::aws:policy/{policy}"
+                for policy in [
+                    "EC2InstanceProfileForImageBuilder",
+                    "AmazonSSMManagedInstanceCore",
+                ]
+            ],
+        )
+        build_instance_profile = iam.CfnInstanceProfile(
+            self, "BuildInstanceProfile", roles=[build_role.ref]
+        )
+
+        component = imagebuilder.CfnComponent(
+            self,
+            "Component",
+            name=f"MeshRouterPackages-{document_hash}",
+            platform="Linux",
+            version="1.0.0",
+            data=component_document,
+        )
+        recipe = imagebuilder.CfnImageRecipe(
+            self,
+            "Recipe",
+            name=f"MeshRouter-{document_hash}",
+            version="1.0.0",
+            parent_image=parent_image,
+            components=[
+                imagebuilder.CfnImageRecipe.ComponentConfigurationProperty(
+                    component_arn=component.attr_arn
+                )
+            ],
+        )
+
+        # Build in the mesh subnet, which routes to the internet via the IGW
+        infrastructure = imagebuilder.CfnInfrastructureConfiguration(
+            self,
+            "Infrastructure",
+            name="MeshRouterImageBuilder",
+            instance_profile_name=build_instance_profile.ref,
+            instance_types=[build_instance_type],
+            subnet_id=core_vpc_infra.cfn_subnet.attr_subnet_id,
+            security_group_ids=[core_vpc_infra.router_security_group.attr_group_id],
+            terminate_instance_on_failure=True,
+        )
+
+        self.image = imagebuilder.CfnImage(
+            self,
+            "Image",
+            image_recipe_arn=recipe.attr_arn,
+            infrastructure_configuration_arn=infrastructure.attr_arn,
+            # The component's validate phase already checks the packages are installed
+            image_tests_configuration=imagebuilder.CfnImage.ImageTestsConfigurationProperty(
+                image_tests_enabled=False
+            ),
+            tags={"Name": "Mesh Router"},
+        )
+        self.image.add_dependency(core_vpc_infra.internet_route)
+        self.image.add_dependency(core_vpc_infra.route_table_association)
+
+        for resource in [
+            build_role,
+            build_instance_profile,
+            component,
+            recipe,
+            infrastructure,
+            self.image,
+        ]:
+            resource.cfn_options.condition = condition
 
 
 class VPNRouterInstance(Construct):
@@ -119,7 +561,11 @@ class VPNRouterInstance(Construct):
         public_key_provided_condition,
         cfn_subnet,
         cfn_security_group,
+        route_table_ids,
+        image_id,
+        instance_type,
         user_data,
+        router_files_variables,
     ):
         super().__init__(scope, id)
 
@@ -154,7 +600,97 @@ class VPNRouterInstance(Construct):
                             ],
                         )
                     ],
-                )
+                ),
+                "InlineAccessToReadRouterConfigFromSSMParameterStore": iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=["ssm:GetParametersByPath", "ssm:GetParameter"],
+                            resources=[
+                                cdk.Fn.join(
+                                    ":",
+                                    [
+                                        "arn:aws:ssm",
+                                        cdk.Aws.REGION,
+                                        cdk.Aws.ACCOUNT_ID,
+                                        f"parameter{ROUTER_CONFIG_PARAMETER_PATH}*",
+                                    ],
+                                ),
+                                cdk.Fn.join(
+                                    ":",
+                                    [
+                                        "arn:aws:ssm",
+                                        cdk.Aws.REGION,
+                                        cdk.Aws.ACCOUNT_ID,
+                                        f"parameter{SHARED_KEY_PARAMETER_NAME}",
+                                    ],
+                                ),
+                            ],
+                        )
+                    ],
+                ),
+                # mesh-router-fetch downloads the router files bundle on first boot
+                "InlineAccessToReadRouterFiles": iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=["s3:GetObject"],
+                            resources=[
+                                cdk.Fn.sub(
+                                    get_router_files_arn_template(),
+                                    router_files_variables,
+                                )
+                            ],
+                        )
+                    ],
+                ),
+                "InlineAccessToFailOverMeshRoutes": iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=["ec2:ReplaceRoute"],
+                            resources=[
+                                cdk.Fn.join(
+                                    ":",
+                                    [
+                                        "arn:aws:ec2",
+                                        cdk.Aws.REGION,
+                                        cdk.Aws.ACCOUNT_ID,
+                                        f"route-table/{route_table_id}",
+                                    ],
+                                )
+                                for route_table_id in route_table_ids
+                            ],
+                        ),
+                        # The Describe actions don't support resource-level permissions.
+                        # DescribeInstances finds the address of the router to nudge after
+                        # taking over from it
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=[
+                                "ec2:DescribeInstances",
+                                "ec2:DescribeRouteTables",
+                            ],
+                            resources=["*"],
+                        ),
+                    ],
+                ),
+                # PutMetricData doesn't support resource-level permissions either, but can be
+                # limited to a namespace
+                "InlineAccessToPutRouterMetrics": iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=["cloudwatch:PutMetricData"],
+                            resources=["*"],
+                            conditions={
+                                "StringEquals": {
+                                    "cloudwatch:namespace": ROUTER_METRICS_NAMESPACE
+                                }
+                            },
+                        ),
+                    ],
+                ),
             },
         )
 
@@ -166,33 +702,98 @@ class VPNRouterInstance(Construct):
         )
         key_pair.cfn_options.condition = public_key_provided_condition
 
-        self.instance = ec2.CfnInstance(
+        instance_profile = iam.CfnInstanceProfile(
             self,
-            "RouterInstance",
-            tags=[name_tag("Mesh Router")],
-            instance_type="t4g.nano",
-            image_id=ssm.StringParameter.value_for_string_parameter(
-                self,
-                "/aws/service/canonical/ubuntu/server/focal/stable/current/arm64/hvm/ebs-gp2/ami-id",
+            "RouterRoleInstanceProfile",
+            roles=[router_iam_role.role_name],
+        )
+
+        # Both routers launch from this, so they share one copy of the user data. Each one's
+        # initial role is read from its ROUTER_ROLE_TAG instance tag instead (see
+        # router_agents/mesh_router_boot.py)
+        self.launch_template = ec2.CfnLaunchTemplate(
+            self,
+            "RouterLaunchTemplate",
+            launch_template_data=ec2.CfnLaunchTemplate.LaunchTemplateDataProperty(
+                instance_type=instance_type,
+                image_id=image_id,
+                iam_instance_profile=ec2.CfnLaunchTemplate.IamInstanceProfileProperty(
+                    name=instance_profile.ref
+                ),
+                security_group_ids=[cfn_security_group.attr_group_id],
+                disable_api_termination=True,
+                metadata_options=ec2.CfnLaunchTemplate.MetadataOptionsProperty(
+                    instance_metadata_tags="enabled"
+                ),
+                user_data=user_data,
             ),
-            iam_instance_profile=iam.CfnInstanceProfile(
-                self,
-                "RouterRoleInstanceProfile",
-                roles=[router_iam_role.role_name],
-            ).ref,
-            source_dest_check=False,
-            security_group_ids=[cfn_security_group.attr_group_id],
-            disable_api_termination=True,
-            subnet_id=cfn_subnet.attr_subnet_id,
-            user_data=user_data,
         )
 
         # Set keypair
-        self.instance.add_property_override(
-            "KeyName",
+        self.launch_template.add_property_override(
+            "LaunchTemplateData.KeyName",
             cdk.Fn.condition_if(
                 public_key_provided_condition.logical_id,
                 key_pair.ref,
                 cdk.Aws.NO_VALUE,
             ),
         )
+
+        self.instance = self._add_instance(
+            "RouterInstance", "Mesh Router", "active", 1, cfn_subnet.attr_subnet_id
+        )
+        # The routers of the other availability zones, keyed by zone
+        self.zone_instances = {}
+        self.zone_standby_instances = {}
+
+    def _add_instance(self, id, name, role, zone, subnet_id):
+        return ec2.CfnInstance(
+            self,
+            id,
+            tags=[
+                name_tag(name),
+                cdk.CfnTag(key=ROUTER_ROLE_TAG, value=role),
+                cdk.CfnTag(key=ROUTER_ZONE_TAG, value=str(zone)),
+            ],
+            launch_template=ec2.CfnInstance.LaunchTemplateSpecificationProperty(
+                launch_template_id=self.launch_template.ref,
+                version=self.launch_template.attr_latest_version_number,
+            ),
+            source_dest_check=False,
+            subnet_id=subnet_id,
+        )
+
+    def add_standby_instance(self, subnet_id, condition):
+        """
+        Adds the standby router of a high availability pair, which shares the active router's
+        launch template, and so its role, key pair and image (see
+        router_agents/mesh_router_failover.py)
+        """
+        self.standby_instance = self._add_instance(
+            "StandbyRouterInstance", "Mesh Router (Standby)", "standby", 1, subnet_id
+        )
+        self.standby_instance.cfn_options.condition = condition
+
+    def add_zone_routers(self, zone, subnet_id, condition, standby_condition):
+        """
+        Adds the router (and under standby_condition, its standby) serving another availability
+        zone, from the same launch template. It brings up that zone's share of the tunnels (see
+        router_config.get_tunnel_zone())
+        """
+        suffix = f"AZ{zone}"
+        self.zone_instances[zone] = self._add_instance(
+            f"RouterInstance{suffix}",
+            f"Mesh Router ({suffix})",
+            "active",
+            zone,
+            subnet_id,
+        )
+        self.zone_instances[zone].cfn_options.condition = condition
+        self.zone_standby_instances[zone] = self._add_instance(
+            f"StandbyRouterInstance{suffix}",
+            f"Mesh Router ({suffix} Standby)",
+            "standby",
+            zone,
+            subnet_id,
+        )
+        self.zone_standby_instances[zone].cfn_options.condition = standby_condition
@@ -0,0 +1,1494 @@
+"""
+Renders MeshVpcCDKStack.clean.template.json directly in Python, without starting the CDK/jsii
+runtime. This mirrors the resources created by MeshVpcCDKStack and its constructs, so any change
+there needs a matching change here. Run with --check to confirm the two paths agree:
+
+    python3 -m mesh_vpccdk.fast_synth --check
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from mesh_vpccdk.cloud_config import (
+    get_cloud_config,
+    get_published_router_files_location,
+    get_router_image_component,
+    get_router_packages_list,
+)
+from mesh_vpccdk.constants import (
+    AMAZON_DNS_SERVER,
+    ARCHITECTURES,
+    DEFAULT_ARCHITECTURE,
+    DIRECT_UPLOAD_MAX_WG_TUNNELS,
+    IMAGE_BUILD_INSTANCE_TYPES,
+    MAX_OSPF_HELLO_INTERVAL,
+    MAX_WG_TUNNELS,
+    MESH_CIDRS,
+    MULTI_AZ_SUBNET_HOST_BITS,
+    MULTI_AZ_SUBNETS,
+    ROUTER_AMI_SSM_PARAMETERS,
+    ROUTER_PROFILES,
+    ROUTER_CONFIG_PARAMETER_PATH,
+    ROUTER_METRICS_NAMESPACE,
+    ROUTER_ROLE_TAG,
+    ROUTER_ZONE_TAG,
+    SHARED_KEY_PARAMETER_NAME,
+    STACK_NAME,
+    TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+    TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+    US_EAST_1_AVAILABILITY_ZONE_IDS,
+)
+from mesh_vpccdk.parameters import (
+    get_core_parameter_specs,
+    get_interface_metadata,
+    get_wireguard_parameter_specs,
+)
+from mesh_vpccdk.postprocess import MINIFY_ENV_VAR, write_clean_template
+from mesh_vpccdk.router_config import (
+    FAILOVER_CONFIG_PARAMETER_NAME,
+    GLOBAL_CONFIG_PARAMETER_NAME,
+    get_failover_config_template,
+    get_global_config_template,
+    get_router_files_arn_template,
+    get_router_files_variables,
+    get_tunnel_config_parameter_name,
+    get_tunnel_config_template,
+    get_tunnel_zone,
+)
+
+DEFAULT_OUTDIR = "cdk.out"
+
+# Must match the values used by aws_cdk.aws_ec2.MultipartUserData
+MULTIPART_BOUNDARY = "+AWS+CDK+User+Data+Separator=="
+CLOUD_CONFIG_CONTENT_TYPE = 'text/cloud-config; charset="us-ascii"'
+
+# Keyword arguments of cdk.CfnParameter() and the CloudFormation keys they render to
+CFN_PARAMETER_KEYS = {
+    "type": "Type",
+    "default": "Default",
+    "allowed_pattern": "AllowedPattern",
+    "allowed_values": "AllowedValues",
+    "constraint_description": "ConstraintDescription",
+    "description": "Description",
+    "min_length": "MinLength",
+    "max_length": "MaxLength",
+    "min_value": "MinValue",
+    "max_value": "MaxValue",
+}
+
+
+def logical_id(*path: str) -> str:
+    """
+    Computes the logical ID CDK allocates to the construct at the given path (relative to the
+    stack), following the algorithm in aws-cdk-lib/core/lib/private/uniqueid.ts
+    """
+    components = [c for c in path if c != "Default"]
+    if len(components) == 1:
+        return re.sub(r"[^A-Za-z0-9]", "", components[0])
+
+    path_hash = hashlib.md5("/".join(components).encode("utf-8")).hexdigest()[:8]
+
+    human_components = []
+    for component in components:
+        if not human_components or not human_components[-1].endswith(component):
+            human_components.append(component)
+
+    human = "".join(
+        re.sub(r"[^A-Za-z0-9]", "", c) for c in human_components if c != "Resource"
+    )
+    return human[:240] + path_hash.upper()
+
+
+def ref(target: str) -> dict:
+    return {"Ref": target}
+
+
+def get_att(target: str, attribute: str) -> dict:
+    return {"Fn::GetAtt": [target, attribute]}
+
+
+def name_tag(name: str) -> dict:
+    return {"Key": "Name", "Value": name}
+
+
+def condition_not_empty(value: dict) -> dict:
+    return {"Fn::Not": [{"Fn::Equals": [value, ""]}]}
+
+
+def cfn_parameter(spec: dict) -> dict:
+    return {
+        CFN_PARAMETER_KEYS[key]: value
+        for key, value in spec.items()
+        if key in CFN_PARAMETER_KEYS and value is not None
+    }
+
+
+def render_multipart_user_data(body: str) -> str:
+    return "\n".join(
+        [
+            f'Content-Type: multipart/mixed; boundary="{MULTIPART_BOUNDARY}"',
+            "MIME-Version: 1.0",
+            "",
+            f"--{MULTIPART_BOUNDARY}",
+            f"Content-Type: {CLOUD_CONFIG_CONTENT_TYPE}",
+            "",
+            body,
+            f"--{MULTIPART_BOUNDARY}--",
+            "",
+        ]
+    )
+
+
+class _TemplateBuilder:
+    def __init__(self):
+        self.template = {
+            "Metadata": {},
+            "Parameters": {},
+            "Mappings": {},
+            "Conditions": {},
+            "Resources": {},
+        }
+
+    def add_parameter(self, spec: dict) -> dict:
+        self.template["Parameters"][spec["id"]] = cfn_parameter(spec)
+        return ref(spec["id"])
+
+    def add_mapping(self, name: str, mapping: dict) -> str:
+        self.template["Mappings"][name] = mapping
+        return name
+
+    def add_condition(self, name: str, expression: dict) -> str:
+        self.template["Conditions"][name] = expression
+        return name
+
+    def add_rule(self, name: str, assertions: list, rule_condition=None) -> str:
+        rule = {"Assertions": assertions}
+        if rule_condition is not None:
+            rule["RuleCondition"] = rule_condition
+        self.template.setdefault("Rules", {})[name] = rule
+        return name
+
+    def add_resource(
+        self,
+        path,
+        resource_type,
+        properties,
+        condition=None,
+        depends_on=None,
+        metadata=None,
+    ) -> str:
+        resource_id = logical_id(*path)
+        resource = {"Type": resource_type, "Properties": properties}
+        if metadata:
+            resource["Metadata"] = metadata
+        if depends_on:
+            resource["DependsOn"] = depends_on
+        if condition is not None:
+            resource["Condition"] = condition
+        self.template["Resources"][resource_id] = resource
+        return resource_id
+
+
+def _add_core_vpc_infrastructure(
+    builder: _TemplateBuilder,
+    vpc_cidr: dict,
+    multi_az_subnet_host_bits: dict,
+    multi_az_condition: str,
+    us_east_1_condition: str,
+) -> dict:
+    scope = "CoreVPCInfrastructure"
+
+    vpc = builder.add_resource(
+        (scope, "MeshVPC"),
+        "AWS::EC2::VPC",
+        {"CidrBlock": vpc_cidr, "Tags": [name_tag("MeshVPC")]},
+    )
+    igw = builder.add_resource(
+        (scope, "MeshIGW"),
+        "AWS::EC2::InternetGateway",
+        {"Tags": [name_tag("MeshIGW")]},
+    )
+    builder.add_resource(
+        (scope, "MeshIGWAttachment"),
+        "AWS::EC2::VPCGatewayAttachment",
+        {
+            "VpcId": get_att(vpc, "VpcId"),
+            "InternetGatewayId": get_att(igw, "InternetGatewayId"),
+        },
+    )
+
+    multi_az_cidr_blocks = {
+        "Fn::Cidr": [vpc_cidr, MULTI_AZ_SUBNETS, multi_az_subnet_host_bits]
+    }
+    subnets = []
+    route_tables = []
+    for i in range(MULTI_AZ_SUBNETS):
+        suffix = f"AZ{i + 1}" if i else ""
+        condition = multi_az_condition if i else None
+
+        subnets.append(
+            builder.add_resource(
+                (scope, f"MeshSubnet{suffix}"),
+                "AWS::EC2::Subnet",
+                {
+                    "VpcId": get_att(vpc, "VpcId"),
+                    "AvailabilityZone": {
+                        "Fn::If": [
+                            us_east_1_condition,
+                            ref("AWS::NoValue"),
+                            {"Fn::Select": [i, {"Fn::GetAZs": ""}]},
+                        ]
+                    },
+                    "AvailabilityZoneId": {
+                        "Fn::If": [
+                            us_east_1_condition,
+                            US_EAST_1_AVAILABILITY_ZONE_IDS[i],
+                            ref("AWS::NoValue"),
+                        ]
+                    },
+                    "CidrBlock": (
+                        {"Fn::Select": [i, multi_az_cidr_blocks]}
+                        if i
+                        else {
+                            "Fn::If": [
+                                multi_az_condition,
+                                {"Fn::Select": [0, multi_az_cidr_blocks]},
+                                vpc_cidr,
+                            ]
+                        }
+                    ),
+                    "MapPublicIpOnLaunch": True,
+                    "Tags": [name_tag(f"MeshSubnet{suffix}")],
+                },
+                condition=condition,
+            )
+        )
+        route_tables.append(
+            builder.add_resource(
+                (scope, f"MeshRouteTable{suffix}"),
+                "AWS::EC2::RouteTable",
+                {
+                    "VpcId": get_att(vpc, "VpcId"),
+                    "Tags": [name_tag(f"MeshVPCRouteTable{suffix}")],
+                },
+                condition=condition,
+            )
+        )
+        route_table_association = builder.add_resource(
+            (scope, f"MeshRouteTableAttachment{suffix}"),
+            "AWS::EC2::SubnetRouteTableAssociation",
+            {
+                "RouteTableId": get_att(route_tables[i], "RouteTableId"),
+                "SubnetId": get_att(subnets[i], "SubnetId"),
+            },
+            condition=condition,
+        )
+        internet_route = builder.add_resource(
+            (scope, f"InternetRoute{suffix}"),
+            "AWS::EC2::Route",
+            {
+                "RouteTableId": get_att(route_tables[i], "RouteTableId"),
+                "DestinationCidrBlock": "0.0.0.0/0",
+                "GatewayId": get_att(igw, "InternetGatewayId"),
+            },
+            condition=condition,
+        )
+        if not i:
+            first_route_table_association = route_table_association
+            first_internet_route = internet_route
+
+    security_group = builder.add_resource(
+        (scope, "AllowFromMeshAndToInternet"),
+        "AWS::EC2::SecurityGroup",
+        {
+            "GroupDescription": "Allow all connections from 10.0.0.0/8 (plus other mesh CIDRS) "
+            "and all outbound to 0.0.0.0/0",
+            "GroupName": "AllowFromMeshAndToInternet",
+            "SecurityGroupEgress": [
+                {
+                    "CidrIp": "0.0.0.0/0",
+                    "Description": "Allow any outbound traffic flows",
+                    "IpProtocol": "-1",
+                }
+            ],
+            "SecurityGroupIngress": [
+                {
+                    "CidrIp": cidr,
+                    "Description": "Allow all traffic from mesh",
+                    "IpProtocol": "-1",
+                }
+                for cidr in MESH_CIDRS
+            ],
+            "VpcId": get_att(vpc, "VpcId"),
+        },
+    )
+
+    return {
+        "scope": scope,
+        "subnet": subnets[0],
+        "subnets": subnets,
+        "route_table": route_tables[0],
+        "route_tables": route_tables,
+        "route_table_ids": [
+            (
+                {
+                    "Fn::If": [
+                        multi_az_condition,
+                        get_att(route_table, "RouteTableId"),
+                        get_att(route_tables[0], "RouteTableId"),
+                    ]
+                }
+                if i
+                else get_att(route_table, "RouteTableId")
+            )
+            for i, route_table in enumerate(route_tables)
+        ],
+        "subnet_ids": [
+            (
+                {
+                    "Fn::If": [
+                        multi_az_condition,
+                        get_att(subnet, "SubnetId"),
+                        ref("AWS::NoValue"),
+                    ]
+                }
+                if i
+                else get_att(subnet, "SubnetId")
+            )
+            for i, subnet in enumerate(subnets)
+        ],
+        "vpc": vpc,
+        "multi_az_condition": multi_az_condition,
+        "us_east_1_condition": us_east_1_condition,
+        "route_table_association": first_route_table_association,
+        "igw": igw,
+        "internet_route": first_internet_route,
+        "security_group": security_group,
+    }
+
+
+def _add_dhcp_options(
+    builder: _TemplateBuilder,
+    core_vpc_infra: dict,
+    domain_name_servers: list,
+    condition: str,
+):
+    dhcp_options = builder.add_resource(
+        (core_vpc_infra["scope"], "MeshDHCPOptions"),
+        "AWS::EC2::DHCPOptions",
+        {
+            "DomainName": {
+                "Fn::If": [
+                    core_vpc_infra["us_east_1_condition"],
+                    "ec2.internal",
+                    {"Fn::Sub": "${AWS::Region}.compute.internal"},
+                ]
+            },
+            "DomainNameServers": domain_name_servers,
+            "Tags": [name_tag("MeshDHCPOptions")],
+        },
+        condition=condition,
+    )
+    builder.add_resource(
+        (core_vpc_infra["scope"], "MeshDHCPOptionsAssociation"),
+        "AWS::EC2::VPCDHCPOptionsAssociation",
+        {
+            "DhcpOptionsId": ref(dhcp_options),
+            "VpcId": get_att(core_vpc_infra["vpc"], "VpcId"),
+        },
+        condition=condition,
+    )
+
+
+def _add_mesh_routes(
+    builder: _TemplateBuilder,
+    core_vpc_infra: dict,
+    router_instance_ids: list,
+    vpn_endpoint_addrs: list,
+    wg_server_provided_conditions: list,
+    multi_az_wg_server_provided_conditions: list,
+):
+    for az, route_table in enumerate(core_vpc_infra["route_tables"]):
+        suffix = f" AZ{az + 1}" if az else ""
+
+        for i, cidr in enumerate(MESH_CIDRS):
+            builder.add_resource(
+                (core_vpc_infra["scope"], f"Mesh CIDR {i}{suffix}"),
+                "AWS::EC2::Route",
+                {
+                    "RouteTableId": get_att(route_table, "RouteTableId"),
+                    "DestinationCidrBlock": cidr,
+                    "InstanceId": router_instance_ids[az],
+                },
+                condition=core_vpc_infra["multi_az_condition"] if az else None,
+            )
+
+        for i in range(len(wg_server_provided_conditions)):
+            builder.add_resource(
+                (
+                    core_vpc_infra["scope"],
+                    f"Mesh VPN Endpoint {i + 1} Goes via IGW{suffix}",
+                ),
+                "AWS::EC2::Route",
+                {
+                    "RouteTableId": get_att(route_table, "RouteTableId"),
+                    "DestinationCidrBlock": {
+                        "Fn::Join": ["", [vpn_endpoint_addrs[i], "/32"]]
+                    },
+                    "GatewayId": get_att(core_vpc_infra["igw"], "InternetGatewayId"),
+                },
+                condition=(
+                    multi_az_wg_server_provided_conditions[i]
+                    if az
+                    else wg_server_provided_conditions[i]
+                ),
+            )
+
+
+def _add_transit_gateway_routes(
+    builder: _TemplateBuilder,
+    core_vpc_infra: dict,
+    name: str,
+    transit_gateway_id: dict,
+    cidrs: list,
+    attachment: str,
+    conditions: list,
+):
+    for az, route_table in enumerate(core_vpc_infra["route_tables"]):
+        suffix = f" AZ{az + 1}" if az else ""
+        for i, cidr in enumerate(cidrs):
+            builder.add_resource(
+                (core_vpc_infra["scope"], f"{name} {i}{suffix}"),
+                "AWS::EC2::Route",
+                {
+                    "RouteTableId": get_att(route_table, "RouteTableId"),
+                    "DestinationCidrBlock": cidr,
+                    "TransitGatewayId": transit_gateway_id,
+                },
+                condition=conditions[az],
+                depends_on=[attachment],
+            )
+
+
+def _add_transit_gateway_hub(
+    builder: _TemplateBuilder, core_vpc_infra: dict, condition: str
+) -> dict:
+    scope = "Hub"
+
+    transit_gateway = builder.add_resource(
+        (scope, "TransitGateway"),
+        "AWS::EC2::TransitGateway",
+        {
+            "AutoAcceptSharedAttachments": "enable",
+            "DefaultRouteTableAssociation": "disable",
+            "DefaultRouteTablePropagation": "disable",
+            "Description": "Connects spoke VPCs to the mesh via the mesh VPC's router",
+            "Tags": [name_tag("MeshTransitGateway")],
+        },
+        condition=condition,
+    )
+    route_table = builder.add_resource(
+        (scope, "RouteTable"),
+        "AWS::EC2::TransitGatewayRouteTable",
+        {
+            "TransitGatewayId": get_att(transit_gateway, "Id"),
+            "Tags": [name_tag("MeshTransitGatewayRouteTable")],
+        },
+        condition=condition,
+    )
+    attachment = builder.add_resource(
+        (scope, "Attachment"),
+        "AWS::EC2::TransitGatewayAttachment",
+        {
+            "SubnetIds": core_vpc_infra["subnet_ids"],
+            "TransitGatewayId": get_att(transit_gateway, "Id"),
+            "VpcId": get_att(core_vpc_infra["vpc"], "VpcId"),
+            "Tags": [name_tag("MeshTransitGatewayHubAttachment")],
+        },
+        condition=condition,
+    )
+    for name, resource_type in [
+        ("Association", "AWS::EC2::TransitGatewayRouteTableAssociation"),
+        ("Propagation", "AWS::EC2::TransitGatewayRouteTablePropagation"),
+    ]:
+        builder.add_resource(
+            (scope, name),
+            resource_type,
+            {
+                "TransitGatewayAttachmentId": get_att(attachment, "Id"),
+                "TransitGatewayRouteTableId": ref(route_table),
+            },
+            condition=condition,
+        )
+    for i, cidr in enumerate(MESH_CIDRS):
+        builder.add_resource(
+            (scope, f"Mesh CIDR {i}"),
+            "AWS::EC2::TransitGatewayRoute",
+            {
+                "TransitGatewayRouteTableId": ref(route_table),
+                "DestinationCidrBlock": cidr,
+                "TransitGatewayAttachmentId": get_att(attachment, "Id"),
+            },
+            condition=condition,
+        )
+    builder.add_resource(
+        (scope, "TransitGatewayIdParameter"),
+        "AWS::SSM::Parameter",
+        {
+            "Type": "String",
+            "Value": get_att(transit_gateway, "Id"),
+            "Description": "The ID of the mesh VPC's transit gateway, for spoke VPCs",
+            "Name": TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+        },
+        condition=condition,
+    )
+    builder.add_resource(
+        (scope, "RouteTableIdParameter"),
+        "AWS::SSM::Parameter",
+        {
+            "Type": "String",
+            "Value": ref(route_table),
+            "Description": "The ID of the mesh VPC's transit gateway route table, for "
+            "spoke VPCs",
+            "Name": TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+        },
+        condition=condition,
+    )
+
+    return {"transit_gateway": transit_gateway, "attachment": attachment}
+
+
+def _add_router_config_parameters(
+    builder: _TemplateBuilder, max_wg_tunnels: int, wg_server_provided_conditions: list
+) -> list:
+    """
+    Returns the logical IDs of the global config parameter, followed by each tunnel's
+    """
+    scope = "RouterConfig"
+
+    global_parameter = builder.add_resource(
+        (scope, "Global"),
+        "AWS::SSM::Parameter",
+        {
+            "Type": "String",
+            "Value": {
+                "Fn::Sub": [
+                    get_global_config_template(),
+                    get_router_files_variables(get_published_router_files_location()),
+                ]
+            },
+            "Description": "Mesh router config shared by all WireGuard tunnels",
+            "Name": GLOBAL_CONFIG_PARAMETER_NAME,
+        },
+    )
+
+    return [global_parameter] + [
+        builder.add_resource(
+            (scope, f"Tunnel{i + 1}"),
+            "AWS::SSM::Parameter",
+            {
+                "Type": "String",
+                "Value": {"Fn::Sub": get_tunnel_config_template(i)},
+                "Description": f"Mesh router config for WireGuard tunnel {i + 1}",
+                "Name": get_tunnel_config_parameter_name(i),
+            },
+            condition=wg_server_provided_conditions[i],
+        )
+        for i in range(max_wg_tunnels)
+    ]
+
+
+def _add_failover_parameter(
+    builder: _TemplateBuilder,
+    core_vpc_infra: dict,
+    shared_route_table_ids: list,
+    condition: str,
+) -> str:
+    return builder.add_resource(
+        ("RouterConfig", "Failover"),
+        "AWS::SSM::Parameter",
+        {
+            "Type": "String",
+            "Value": {
+                "Fn::Sub": [
+                    get_failover_config_template(),
+                    {
+                        **{
+                            f"RouteTableId{i + 1}": route_table_id
+                            for i, route_table_id in enumerate(
+                                core_vpc_infra["route_table_ids"]
+                            )
+                        },
+                        **{
+                            f"SharedRouteTableId{zone}": route_table_id
+                            for zone, route_table_id in enumerate(
+                                shared_route_table_ids, start=2
+                            )
+                        },
+                    },
+                ]
+            },
+            "Description": "Mesh router config for failing over between the router pair",
+            "Name": FAILOVER_CONFIG_PARAMETER_NAME,
+        },
+        condition=condition,
+    )
+
+
+def _add_router_image_pipeline(
+    builder: _TemplateBuilder,
+    core_vpc_infra: dict,
+    parent_image,
+    build_instance_type: str,
+    condition: str,
+) -> str:
+    scope = "RouterImagePipeline"
+
+    component_document = get_router_image_component()
+    document_hash = hashlib.sha256(component_document.encode("utf-8")).hexdigest()[:8]
+
+    build_role = builder.add_resource(
+        (scope, "BuildInstanceRole"),
+        "AWS::IAM::Role",
+        {
+            "AssumeRolePolicyDocument": {
+                "Statement": [
+                    {
+                        "Action": "sts:AssumeRole",
+                        "Effect": "Allow",
+                        "Principal": {"Service": "ec2.amazonaws.com"},
+                    }
+                ],
+                "Version": "2012-10-17",
+            },
+            "Description": "Role for the EC2 Image Builder instance which bakes the router "
+            "image",
+            "ManagedPolicyArns": [
+                {
+                    "Fn::Join": [
+                        "",
+                        ["arn:", ref("AWS::Partition"), f":iam::aws:policy/{policy}"],
+                    ]
+                }
+                for policy in [
+                    "EC2InstanceProfileForImageBuilder",
+                    "AmazonSSMManagedInstanceCore",
+                ]
+            ],
+        },
+        condition=condition,
+    )
+    build_instance_profile = builder.add_resource(
+        (scope, "BuildInstanceProfile"),
+        "AWS::IAM::InstanceProfile",
+        {"Roles": [ref(build_role)]},
+        condition=condition,
+    )
+
+    component = builder.add_resource(
+        (scope, "Component"),
+        "AWS::ImageBuilder::Component",
+        {
+            "Name": f"MeshRouterPackages-{document_hash}",
+            "Platform": "Linux",
+            "Version": "1.0.0",
+            "Data": component_document,
+        },
+        condition=condition,
+    )
+    recipe = builder.add_resource(
+        (scope, "Recipe"),
+        "AWS::ImageBuilder::ImageRecipe",
+        {
+            "Components": [{"ComponentArn": get_att(component, "Arn")}],
+            "Name": f"MeshRouter-{document_hash}",
+            "ParentImage": parent_image,
+            "Version": "1.0.0",
+        },
+        condition=condition,
+    )
+    infrastructure = builder.add_resource(
+        (scope, "Infrastructure"),
+        "AWS::ImageBuilder::InfrastructureConfiguration",
+        {
+            "InstanceProfileName": ref(build_instance_profile),
+            "Name": "MeshRouterImageBuilder",
+            "InstanceTypes": [build_instance_type],
+            "SecurityGroupIds": [get_att(core_vpc_infra["security_group"], "GroupId")],
+            "SubnetId": get_att(core_vpc_infra["subnet"], "SubnetId"),
+            "TerminateInstanceOnFailure": True,
+        },
+        condition=condition,
+    )
+
+    return builder.add_resource(
+        (scope, "Image"),
+        "AWS::ImageBuilder::Image",
+        {
+            "InfrastructureConfigurationArn": get_att(infrastructure, "Arn"),
+            "ImageRecipeArn": get_att(recipe, "Arn"),
+            "ImageTestsConfiguration": {"ImageTestsEnabled": False},
+            "Tags": {"Name": "Mesh Router"},
+        },
+        condition=condition,
+        depends_on=[
+            core_vpc_infra["internet_route"],
+            core_vpc_infra["route_table_association"],
+        ],
+    )
+
+
+def _arn(service: str, resource) -> dict:
+    return {
+        "Fn::Join": [
+            ":",
+            [
+                f"arn:aws:{service}",
+                ref("AWS::Region"),
+                ref("AWS::AccountId"),
+                resource,
+            ],
+        ]
+    }
+
+
+def _ssm_parameter_arn(parameter: str) -> dict:
+    return _arn("ssm", f"parameter{parameter}")
+
+
+def _add_vpn_router_instance(
+    builder: _TemplateBuilder,
+    public_key_material: dict,
+    public_key_provided_condition: str,
+    core_vpc_infra: dict,
+    image_id,
+    instance_type,
+    user_data,
+    high_availability_condition: str,
+    standby_subnet_id,
+    zone_router_conditions: dict,
+    depends_on: list,
+) -> tuple:
+    """
+    Returns the logical IDs of the router instance, the standby router instance, and (keyed by
+    zone) the other availability zones' router instances. zone_router_conditions maps each zone
+    with a router of its own to the conditions for its router and standby router
+    """
+    scope = "VPNRouterInstance"
+
+    router_iam_role = builder.add_resource(
+        (scope, "EC2-SSM-Only", "Resource"),
+        "AWS::IAM::Role",
+        {
+            "AssumeRolePolicyDocument": {
+                "Statement": [
+                    {
+                        "Action": "sts:AssumeRole",
+                        "Effect": "Allow",
+                        "Principal": {"Service": "ec2.amazonaws.com"},
+                    }
+                ],
+                "Version": "2012-10-17",
+            },
+            "Description": "Role for EC2 instances to call AWS Systems Manager in order to "
+            "allow keyless SSH access",
+            "ManagedPolicyArns": [
+                {
+                    "Fn::Join": [
+                        "",
+                        [
+                            "arn:",
+                            ref("AWS::Partition"),
+                            ":iam::aws:policy/AmazonSSMManagedInstanceCore",
+                        ],
+                    ]
+                }
+            ],
+            "Policies": [
+                {
+                    "PolicyDocument": {
+                        "Statement": [
+                            {
+                                "Action": "ssm:PutParameter",
+                                "Effect": "Allow",
+                                "Resource": _ssm_parameter_arn("/MeshVPC/*"),
+                            }
+                        ],
+                        "Version": "2012-10-17",
+                    },
+                    "PolicyName": "InlineAccessToPutOutputInSSMParameterStore",
+                },
+                {
+                    "PolicyDocument": {
+                        "Statement": [
+                            {
+                                "Action": [
+                                    "ssm:GetParametersByPath",
+                                    "ssm:GetParameter",
+                                ],
+                                "Effect": "Allow",
+                                "Resource": [
+                                    _ssm_parameter_arn(
+                                        f"{ROUTER_CONFIG_PARAMETER_PATH}*"
+                                    ),
+                                    _ssm_parameter_arn(SHARED_KEY_PARAMETER_NAME),
+                                ],
+                            }
+                        ],
+                        "Version": "2012-10-17",
+                    },
+                    "PolicyName": "InlineAccessToReadRouterConfigFromSSMParameterStore",
+                },
+                {
+                    "PolicyDocument": {
+                        "Statement": [
+                            {
+                                "Action": "s3:GetObject",
+                                "Effect": "Allow",
+                                "Resource": {
+                                    "Fn::Sub": [
+                                        get_router_files_arn_template(),
+                                        get_router_files_variables(
+                                            get_published_router_files_location()
+                                        ),
+                                    ]
+                                },
+                            }
+                        ],
+                        "Version": "2012-10-17",
+                    },
+                    "PolicyName": "InlineAccessToReadRouterFiles",
+                },
+                {
+                    "PolicyDocument": {
+                        "Statement": [
+                            {
+                                "Action": "ec2:ReplaceRoute",
+                                "Effect": "Allow",
+                                "Resource": [
+                                    _arn(
+                                        "ec2",
+                                        {
+                                            "Fn::Join": [
+                                                "",
+                                                ["route-table/", route_table_id],
+                                            ]
+                                        },
+                                    )
+                                    for route_table_id in core_vpc_infra[
+                                        "route_table_ids"
+                                    ]
+                                ],
+                            },
+                            {
+                                "Action": [
+                                    "ec2:DescribeInstances",
+                                    "ec2:DescribeRouteTables",
+                                ],
+                                "Effect": "Allow",
+                                "Resource": "*",
+                            },
+                        ],
+                        "Version": "2012-10-17",
+                    },
+                    "PolicyName": "InlineAccessToFailOverMeshRoutes",
+                },
+                {
+                    "PolicyDocument": {
+                        "Statement": [
+                            {
+                                "Action": "cloudwatch:PutMetricData",
+                                "Condition": {
+                                    "StringEquals": {
+                                        "cloudwatch:namespace": ROUTER_METRICS_NAMESPACE
+                                    }
+                                },
+                                "Effect": "Allow",
+                                "Resource": "*",
+                            }
+                        ],
+                        "Version": "2012-10-17",
+                    },
+                    "PolicyName": "InlineAccessToPutRouterMetrics",
+                },
+            ],
+            "RoleName": "EC2-SSM-Only-Role",
+        },
+    )
+
+    key_pair = builder.add_resource(
+        (scope, "MeshVPNRouterKey"),
+        "AWS::EC2::KeyPair",
+        {"KeyName": "MeshVPNRouterKey", "PublicKeyMaterial": public_key_material},
+        condition=public_key_provided_condition,
+    )
+
+    instance_profile = builder.add_resource(
+        (scope, "RouterRoleInstanceProfile"),
+        "AWS::IAM::InstanceProfile",
+        {"Roles": [ref(router_iam_role)]},
+    )
+
+    launch_template = builder.add_resource(
+        (scope, "RouterLaunchTemplate"),
+        "AWS::EC2::LaunchTemplate",
+        {
+            "LaunchTemplateData": {
+                "DisableApiTermination": True,
+                "IamInstanceProfile": {"Name": ref(instance_profile)},
+                "ImageId": image_id,
+                "InstanceType": instance_type,
+                "KeyName": {
+                    "Fn::If": [
+                        public_key_provided_condition,
+                        ref(key_pair),
+                        ref("AWS::NoValue"),
+                    ]
+                },
+                "MetadataOptions": {"InstanceMetadataTags": "enabled"},
+                "SecurityGroupIds": [
+                    get_att(core_vpc_infra["security_group"], "GroupId")
+                ],
+                "UserData": user_data,
+            }
+        },
+    )
+
+    def add_instance(id, name, role, zone, subnet_id, condition=None):
+        return builder.add_resource(
+            (scope, id),
+            "AWS::EC2::Instance",
+            {
+                "LaunchTemplate": {
+                    "LaunchTemplateId": ref(launch_template),
+                    "Version": get_att(launch_template, "LatestVersionNumber"),
+                },
+                "SourceDestCheck": False,
+                "SubnetId": subnet_id,
+                "Tags": [
+                    {"Key": ROUTER_ROLE_TAG, "Value": role},
+                    {"Key": ROUTER_ZONE_TAG, "Value": str(zone)},
+                    name_tag(name),
+                ],
+            },
+            condition=condition,
+            depends_on=depends_on,
+        )
+
+    router_instance = add_instance(
+        "RouterInstance",
+        "Mesh Router",
+        "active",
+        1,
+        get_att(core_vpc_infra["subnet"], "SubnetId"),
+    )
+    standby_router_instance = add_instance(
+        "StandbyRouterInstance",
+        "Mesh Router (Standby)",
+        "standby",
+        1,
+        standby_subnet_id,
+        condition=high_availability_condition,
+    )
+    zone_router_instances = {}
+    for zone, (condition, standby_condition) in zone_router_conditions.items():
+        subnet_id = get_att(core_vpc_infra["subnets"][zone - 1], "SubnetId")
+        zone_router_instances[zone] = add_instance(
+            f"RouterInstanceAZ{zone}",
+            f"Mesh Router (AZ{zone})",
+            "active",
+            zone,
+            subnet_id,
+            condition=condition,
+        )
+        add_instance(
+            f"StandbyRouterInstanceAZ{zone}",
+            f"Mesh Router (AZ{zone} Standby)",
+            "standby",
+            zone,
+            subnet_id,
+            condition=standby_condition,
+        )
+
+    return router_instance, standby_router_instance, zone_router_instances
+
+
+def render_clean_template(
+    max_wg_tunnels: int = MAX_WG_TUNNELS, architecture: str = DEFAULT_ARCHITECTURE
+) -> dict:
+    builder = _TemplateBuilder()
+
+    params = {
+        name: builder.add_parameter(spec)
+        for name, spec in get_core_parameter_specs(architecture).items()
+    }
+    wireguard_params = [
+        {
+            name: builder.add_parameter(spec)
+            for name, spec in get_wireguard_parameter_specs(i).items()
+        }
+        for i in range(max_wg_tunnels)
+    ]
+
+    builder.template["Metadata"] = get_interface_metadata(max_wg_tunnels)
+
+    wg_tunnel_conditions = [
+        builder.add_condition(
+            f"WGServer{i + 1}Provided",
+            {
+                "Fn::And": [
+                    condition_not_empty(param)
+                    for name, param in wireguard_params[i].items()
+                    if name != "LinkMTU"
+                ]
+            },
+        )
+        for i in range(max_wg_tunnels)
+    ]
+    public_key_provided = builder.add_condition(
+        "PublicKeyProvided",
+        condition_not_empty(params["RouterInstanceSSHPublicKeyMaterial"]),
+    )
+
+    builder.add_rule(
+        "TunnelOSPFTimers",
+        [
+            {
+                "Assert": {
+                    "Fn::And": [
+                        {
+                            "Fn::Or": [
+                                {
+                                    "Fn::Not": [
+                                        {
+                                            "Fn::Equals": [
+                                                params["TunnelOSPFDead"],
+                                                str(dead),
+                                            ]
+                                        }
+                                    ]
+                                },
+                                {
+                                    "Fn::Contains": [
+                                        [str(hello) for hello in range(1, dead)],
+                                        params["TunnelOSPFHello"],
+                                    ]
+                                },
+                            ]
+                        }
+                        for dead in range(2, MAX_OSPF_HELLO_INTERVAL + 1)
+                    ]
+                },
+                "AssertDescription": "TunnelOSPFDead must be longer than TunnelOSPFHello",
+            }
+        ],
+    )
+
+    builder.add_rule(
+        "EgressAccountingFastPath",
+        [
+            {
+                "Assert": {
+                    "Fn::Not": [
+                        {"Fn::Equals": [params["ForwardingFastPath"], "flowtable"]}
+                    ]
+                },
+                "AssertDescription": "EgressAccounting can't be enabled with the "
+                "flowtable ForwardingFastPath",
+            }
+        ],
+        rule_condition={"Fn::Equals": [params["EgressAccounting"], "enabled"]},
+    )
+
+    router_profiles = builder.add_mapping(
+        "RouterProfiles",
+        {
+            name: {"InstanceType": instance_type}
+            for name, instance_type in ROUTER_PROFILES[architecture].items()
+        },
+    )
+
+    high_availability_enabled = builder.add_condition(
+        "HighAvailabilityEnabled",
+        {"Fn::Equals": [params["RouterHighAvailability"], "enabled"]},
+    )
+    multi_az = builder.add_condition(
+        "MultiAZ", {"Fn::Equals": [params["MeshSubnetLayout"], "multi-az"]}
+    )
+    in_us_east_1 = builder.add_condition(
+        "InUSEast1", {"Fn::Equals": [ref("AWS::Region"), "us-east-1"]}
+    )
+    transit_gateway_hub_enabled = builder.add_condition(
+        "TransitGatewayHub", condition_not_empty(params["TransitGatewaySpokeCIDR"])
+    )
+    baked_router_image = builder.add_condition(
+        "BakedRouterImage", {"Fn::Equals": [params["RouterImage"], "baked"]}
+    )
+    router_dns_resolver_enabled = builder.add_condition(
+        "RouterDNSResolverEnabled",
+        {"Fn::Equals": [params["RouterDNSResolver"], "enabled"]},
+    )
+    multi_az_wg_tunnel_conditions = [
+        builder.add_condition(
+            f"WGServer{i + 1}ProvidedMultiAZ",
+            {
+                "Fn::And": [
+                    {"Condition": wg_tunnel_conditions[i]},
+                    {"Condition": multi_az},
+                ]
+            },
+        )
+        for i in range(max_wg_tunnels)
+    ]
+    zone_router_conditions = {}
+    for zone in range(2, MULTI_AZ_SUBNETS + 1):
+        zone_tunnel_conditions = [
+            {"Condition": wg_tunnel_conditions[i]}
+            for i in range(max_wg_tunnels)
+            if get_tunnel_zone(i) == zone
+        ]
+        if not zone_tunnel_conditions:
+            continue
+        zone_router = builder.add_condition(
+            f"RouterAZ{zone}",
+            {
+                "Fn::And": [
+                    {"Condition": multi_az},
+                    (
+                        {"Fn::Or": zone_tunnel_conditions}
+                        if len(zone_tunnel_conditions) > 1
+                        else zone_tunnel_conditions[0]
+                    ),
+                ]
+            },
+        )
+        zone_router_conditions[zone] = (
+            zone_router,
+            builder.add_condition(
+                f"StandbyRouterAZ{zone}",
+                {
+                    "Fn::And": [
+                        {"Condition": high_availability_enabled},
+                        {"Condition": zone_router},
+                    ]
+                },
+            ),
+        )
+    multi_az_subnet_sizes = builder.add_mapping(
+        "MultiAZSubnetSizes",
+        {
+            prefix_length: {"HostBits": str(host_bits)}
+            for prefix_length, host_bits in MULTI_AZ_SUBNET_HOST_BITS.items()
+        },
+    )
+
+    core_vpc_infra = _add_core_vpc_infrastructure(
+        builder,
+        params["MeshCIDR"],
+        {
+            "Fn::FindInMap": [
+                multi_az_subnet_sizes,
+                params["MeshSubnetPrefixLength"],
+                "HostBits",
+            ]
+        },
+        multi_az,
+        in_us_east_1,
+    )
+
+    stock_image_id = f"{{{{resolve:ssm:{ROUTER_AMI_SSM_PARAMETERS[architecture]}}}}}"
+    router_image = _add_router_image_pipeline(
+        builder,
+        core_vpc_infra,
+        stock_image_id,
+        IMAGE_BUILD_INSTANCE_TYPES[architecture],
+        baked_router_image,
+    )
+
+    router_config = _add_router_config_parameters(
+        builder, max_wg_tunnels, wg_tunnel_conditions
+    )
+
+    user_data = {
+        "Fn::Base64": {
+            "Fn::Sub": [
+                render_multipart_user_data(get_cloud_config()),
+                {
+                    "AWSRegion": ref("AWS::Region"),
+                    "RouterPackages": {
+                        "Fn::If": [
+                            baked_router_image,
+                            get_router_packages_list(preinstalled=True),
+                            get_router_packages_list(preinstalled=False),
+                        ]
+                    },
+                },
+            ]
+        }
+    }
+
+    standby_subnet_id = {
+        "Fn::If": [
+            multi_az,
+            get_att(core_vpc_infra["subnets"][1], "SubnetId"),
+            get_att(core_vpc_infra["subnet"], "SubnetId"),
+        ]
+    }
+    if 2 in zone_router_conditions:
+        standby_subnet_id = {
+            "Fn::If": [
+                zone_router_conditions[2][0],
+                get_att(core_vpc_infra["subnet"], "SubnetId"),
+                standby_subnet_id,
+            ]
+        }
+    (
+        router_instance,
+        standby_router_instance,
+        zone_router_instances,
+    ) = _add_vpn_router_instance(
+        builder,
+        public_key_material=params["RouterInstanceSSHPublicKeyMaterial"],
+        public_key_provided_condition=public_key_provided,
+        core_vpc_infra=core_vpc_infra,
+        image_id={
+            "Fn::If": [
+                baked_router_image,
+                get_att(router_image, "ImageId"),
+                stock_image_id,
+            ]
+        },
+        instance_type={
+            "Fn::FindInMap": [router_profiles, params["RouterProfile"], "InstanceType"]
+        },
+        user_data=user_data,
+        high_availability_condition=high_availability_enabled,
+        standby_subnet_id=standby_subnet_id,
+        zone_router_conditions=zone_router_conditions,
+        depends_on=router_config[:2],
+    )
+
+    route_table_ids = core_vpc_infra["route_table_ids"]
+    zone_router_instance_ids = [ref(router_instance)]
+    shared_route_table_ids = []
+    for zone in range(2, MULTI_AZ_SUBNETS + 1):
+        if zone not in zone_router_conditions:
+            zone_router_instance_ids.append(ref(router_instance))
+            shared_route_table_ids.append(route_table_ids[zone - 1])
+            continue
+        zone_router = zone_router_conditions[zone][0]
+        zone_router_instance_ids.append(
+            {
+                "Fn::If": [
+                    zone_router,
+                    ref(zone_router_instances[zone]),
+                    ref(router_instance),
+                ]
+            }
+        )
+        shared_route_table_ids.append(
+            {
+                "Fn::If": [
+                    zone_router,
+                    route_table_ids[0],
+                    route_table_ids[zone - 1],
+                ]
+            }
+        )
+    _add_failover_parameter(
+        builder, core_vpc_infra, shared_route_table_ids, high_availability_enabled
+    )
+
+    _add_mesh_routes(
+        builder,
+        core_vpc_infra,
+        zone_router_instance_ids,
+        [wireguard_params[i]["ServerIP"] for i in range(max_wg_tunnels)],
+        wg_tunnel_conditions,
+        multi_az_wg_tunnel_conditions,
+    )
+
+    _add_dhcp_options(
+        builder,
+        core_vpc_infra,
+        [
+            get_att(router_instance, "PrivateIp"),
+            *[
+                {
+                    "Fn::If": [
+                        zone_router_conditions[zone][0],
+                        get_att(zone_router_instance, "PrivateIp"),
+                        ref("AWS::NoValue"),
+                    ]
+                }
+                for zone, zone_router_instance in zone_router_instances.items()
+            ],
+            {
+                "Fn::If": [
+                    high_availability_enabled,
+                    get_att(standby_router_instance, "PrivateIp"),
+                    ref("AWS::NoValue"),
+                ]
+            },
+            AMAZON_DNS_SERVER,
+        ],
+        router_dns_resolver_enabled,
+    )
+
+    transit_gateway_hub_multi_az = builder.add_condition(
+        "TransitGatewayHubMultiAZ",
+        {
+            "Fn::And": [
+                {"Condition": transit_gateway_hub_enabled},
+                {"Condition": multi_az},
+            ]
+        },
+    )
+    transit_gateway_hub = _add_transit_gateway_hub(
+        builder, core_vpc_infra, transit_gateway_hub_enabled
+    )
+    _add_transit_gateway_routes(
+        builder,
+        core_vpc_infra,
+        "Spoke CIDR",
+        get_att(transit_gateway_hub["transit_gateway"], "Id"),
+        [params["TransitGatewaySpokeCIDR"]],
+        transit_gateway_hub["attachment"],
+        [transit_gateway_hub_enabled, transit_gateway_hub_multi_az],
+    )
+
+    return builder.template
+
+
+def synthesize_with_cdk(
+    outdir: str,
+    max_wg_tunnels: int = MAX_WG_TUNNELS,
+    architecture: str = DEFAULT_ARCHITECTURE,
+) -> dict:
+    """
+    Synthesizes the stack the slow way (via the CDK/jsii runtime) into outdir, and returns the
+    cleaned template
+    """
+    import aws_cdk as cdk
+
+    from mesh_vpccdk.mesh_vpc_cdk_stack import MeshVpcCDKStack
+    from mesh_vpccdk.postprocess import clean_template
+
+    app = cdk.App(outdir=outdir)
+    MeshVpcCDKStack(
+        app, STACK_NAME, max_wg_tunnels=max_wg_tunnels, architecture=architecture
+    )
+    app.synth()
+
+    with open(os.path.join(outdir, f"{STACK_NAME}.template.json"), "r") as f:
+        return clean_template(json.load(f))
+
+
+def find_differences(expected, actual, path="$"):
+    if type(expected) != type(actual):
+        yield f"{path}: expected {expected!r}, got {actual!r}"
+    elif isinstance(expected, dict):
+        for key in expected.keys() | actual.keys():
+            if key not in actual:
+                yield f"{path}.{key}: missing"
+            elif key not in expected:
+                yield f"{path}.{key}: unexpected"
+            else:
+                yield from find_differences(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        if len(expected) != len(actual):
+            yield f"{path}: expected {len(expected)} items, got {len(actual)}"
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            yield from find_differences(e, a, f"{path}[{i}]")
+    elif expected != actual:
+        yield f"{path}: expected {expected!r}, got {actual!r}"
+
+
+def check_equivalence(
+    template_json: dict,
+    max_wg_tunnels: int = MAX_WG_TUNNELS,
+    architecture: str = DEFAULT_ARCHITECTURE,
+) -> list:
+    with tempfile.TemporaryDirectory() as outdir:
+        cdk_template_json = synthesize_with_cdk(outdir, max_wg_tunnels, architecture)
+
+    return sorted(find_differences(cdk_template_json, template_json))
+
+
+def write_template(
+    template_json: dict,
+    outdir: str,
+    minify: bool = None,
+    max_wg_tunnels: int = MAX_WG_TUNNELS,
+) -> str:
+    os.makedirs(outdir, exist_ok=True)
+    output_path = os.path.join(outdir, f"{STACK_NAME}.clean.template.json")
+    report = write_clean_template(
+        template_json,
+        output_path,
+        minify,
+        direct_upload=max_wg_tunnels <= DIRECT_UPLOAD_MAX_WG_TUNNELS,
+    )
+    print(report, file=sys.stderr)
+
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render the clean template without the CDK/jsii runtime"
+    )
+    parser.add_argument("--outdir", default=DEFAULT_OUTDIR)
+    parser.add_argument("--max-wg-tunnels", type=int, default=MAX_WG_TUNNELS)
+    parser.add_argument(
+        "--architecture", choices=ARCHITECTURES, default=DEFAULT_ARCHITECTURE
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        default=None,
+        help="Write the template without whitespace (also set by the "
+        f"{MINIFY_ENV_VAR} environment variable)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Also synthesize via CDK and fail if the templates differ",
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    template_json = render_clean_template(args.max_wg_tunnels, args.architecture)
+    output_path = write_template(
+        template_json, args.outdir, args.minify, args.max_wg_tunnels
+    )
+    print(
+        f"Wrote {output_path} in {(time.perf_counter() - start) * 1000:.1f}ms",
+        file=sys.stderr,
+    )
+
+    if args.check:
+        differences = check_equivalence(
+            template_json, args.max_wg_tunnels, args.architecture
+        )
+        for difference in differences:
+            print(difference, file=sys.stderr)
+        if differences:
+            print(
+                f"Fast synth output differs from CDK synth in {len(differences)} place(s)",
+                file=sys.stderr,
+            )
+            return 1
+        print("Fast synth output matches CDK synth", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
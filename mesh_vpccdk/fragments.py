@@ -0,0 +1,159 @@
+"""
+A small template engine for the text fragments the stack is generated from (the router's
+cloud-config and image component). Each fragment is compiled once into a tree of render
+functions, which is cached by path and modification time, and then rendered in a single pass:
+
+    {{ name }}, {{ name.key }}                          Substituted from the context
+    {% if name %} ... {% else %} ... {% endif %}        Also {% if not name %}
+    {% for item in name %} ... {% endfor %}
+    {# comment #}                                       Stripped from the output
+
+A line holding nothing but a tag or comment is removed entirely, so comments cost nothing in
+the output (which matters for the user data, limited to 16 KB). CloudFormation's ${}
+placeholders are left alone, for the Fn::Sub the output is passed through.
+"""
+
+import functools
+import os
+import re
+
+# Tags (and comments) alone on their line, including the line's indentation and newline, or
+# inline tags
+TOKEN_REGEX = re.compile(
+    r"^[ \t]*(\{%.*?%\}|\{#.*?#\})[ \t]*\n|(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})",
+    re.MULTILINE | re.DOTALL,
+)
+
+# How many compiled fragments to keep. Entries for old versions of a file are only evicted
+# once this fills up, which is only a concern for long running processes (e.g. cdk watch)
+MAX_CACHED_FRAGMENTS = 64
+
+
+class FragmentSyntaxError(Exception):
+    pass
+
+
+def _tokenize(source: str) -> list:
+    """
+    Returns a list of ("text", text), ("variable", name), ("block", words) and ("comment", "")
+    tokens
+    """
+    tokens = []
+    position = 0
+    for match in TOKEN_REGEX.finditer(source):
+        if match.start() > position:
+            tokens.append(("text", source[position : match.start()]))
+        position = match.end()
+
+        tag = match.group(1) or match.group(2)
+        inner = tag[2:-2].strip()
+        if tag.startswith("{{"):
+            tokens.append(("variable", inner))
+        elif tag.startswith("{%"):
+            tokens.append(("block", inner.split()))
+        else:
+            tokens.append(("comment", ""))
+
+    if position < len(source):
+        tokens.append(("text", source[position:]))
+    return tokens
+
+
+def _lookup(context: dict, name: str):
+    value = context
+    for key in name.split("."):
+        try:
+            value = value[key]
+        except (KeyError, TypeError):
+            raise KeyError(f"{name} isn't in the fragment's context") from None
+    return value
+
+
+def _join(parts: list):
+    if len(parts) == 1:
+        return parts[0]
+    return lambda context: "".join(part(context) for part in parts)
+
+
+def _text(text: str):
+    return lambda context: text
+
+
+def _variable(name: str):
+    return lambda context: str(_lookup(context, name))
+
+
+def _if(name: str, negate: bool, body, orelse):
+    return lambda context: (
+        body(context) if bool(_lookup(context, name)) != negate else orelse(context)
+    )
+
+
+def _for(variable: str, name: str, body):
+    return lambda context: "".join(
+        body({**context, variable: item}) for item in _lookup(context, name)
+    )
+
+
+def _parse(tokens: list, position: int, end_tags: tuple):
+    """
+    Compiles tokens from position up to one of end_tags. Returns the render function, the end
+    tag found (or None at the end of the fragment) and the position after it
+    """
+    parts = []
+    while position < len(tokens):
+        kind, value = tokens[position]
+        position += 1
+
+        if kind == "text":
+            parts.append(_text(value))
+        elif kind == "variable":
+            parts.append(_variable(value))
+        elif kind == "block" and value[0] in end_tags:
+            return _join(parts), value[0], position
+        elif kind == "block" and value[0] == "if" and len(value) in (2, 3):
+            negate = len(value) == 3
+            if negate and value[1] != "not":
+                raise FragmentSyntaxError(f"Bad tag {{% {' '.join(value)} %}}")
+            body, end_tag, position = _parse(tokens, position, ("else", "endif"))
+            orelse = _text("")
+            if end_tag == "else":
+                orelse, end_tag, position = _parse(tokens, position, ("endif",))
+            if end_tag != "endif":
+                raise FragmentSyntaxError("{% if %} without {% endif %}")
+            parts.append(_if(value[-1], negate, body, orelse))
+        elif kind == "block" and value[0] == "for" and len(value) == 4:
+            if value[2] != "in":
+                raise FragmentSyntaxError(f"Bad tag {{% {' '.join(value)} %}}")
+            body, end_tag, position = _parse(tokens, position, ("endfor",))
+            if end_tag != "endfor":
+                raise FragmentSyntaxError("{% for %} without {% endfor %}")
+            parts.append(_for(value[1], value[3], body))
+        elif kind == "block":
+            raise FragmentSyntaxError(f"Unexpected tag {{% {' '.join(value)} %}}")
+
+    return _join(parts), None, position
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_FRAGMENTS)
+def compile_fragment(source: str):
+    """
+    Returns a function which renders the fragment source with a context dict
+    """
+    render, end_tag, _ = _parse(_tokenize(source), 0, ())
+    if end_tag is not None:
+        raise FragmentSyntaxError(f"Unexpected tag {{% {end_tag} %}}")
+    return render
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_FRAGMENTS)
+def _compile_file(path: str, mtime_ns: int):
+    with open(path, "r") as f:
+        try:
+            return compile_fragment(f.read())
+        except FragmentSyntaxError as e:
+            raise FragmentSyntaxError(f"{path}: {e}") from None
+
+
+def render_fragment(path: str, **context) -> str:
+    return _compile_file(path, os.stat(path).st_mtime_ns)(context)
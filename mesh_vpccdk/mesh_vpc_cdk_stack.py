@@ -1,190 +1,65 @@
-from collections import ChainMap
-
 import aws_cdk as cdk
+from aws_cdk import aws_s3_assets as s3_assets, aws_ssm as ssm
 
 from constructs import Construct
 
-from mesh_vpccdk.constructs import CoreVPCInfrastructure, VPNRouterInstance
+from mesh_vpccdk.cloud_config import (
+    get_router_packages_list,
+    write_router_files_bundle,
+)
+from mesh_vpccdk.constants import (
+    AMAZON_DNS_SERVER,
+    DEFAULT_ARCHITECTURE,
+    IMAGE_BUILD_INSTANCE_TYPES,
+    MAX_OSPF_HELLO_INTERVAL,
+    MAX_WG_TUNNELS,
+    MULTI_AZ_SUBNET_HOST_BITS,
+    MULTI_AZ_SUBNETS,
+    ROUTER_AMI_SSM_PARAMETERS,
+    ROUTER_PROFILES,
+)
+from mesh_vpccdk.constructs import (
+    CoreVPCInfrastructure,
+    RouterConfigParameters,
+    RouterImagePipeline,
+    TransitGatewayHub,
+    VPNRouterInstance,
+)
+from mesh_vpccdk.parameters import (
+    get_core_parameter_specs,
+    get_interface_metadata,
+    get_wireguard_parameter_specs,
+)
+from mesh_vpccdk.router_config import get_router_files_variables, get_tunnel_zone
 from mesh_vpccdk.util import get_user_data
 
-SN3_VPN_SERVER_IP = "199.170.132.4"
-SN3_VPN_SERVER_PUBLIC_KEY = "FRjRFt/XnSa1tDqnH5g3Y6CikIar/bq3uwUh5vfU/UI="
-
-CIDR_REGEX = r"^([0-9]{1,3}\.){3}[0-9]{1,3}(\/([0-9]|[1-2][0-9]|3[0-2]))?$"
-IPV4_ADDR_REGEX = r"^([0-9]{1,3}\.){3}[0-9]{1,3}$"
-PORT_NUMBER_REGEX = r"^[0-9]{1,5}$"
-WG_KEY_REGEX = r"^([A-z0-9\/\+]{43}\=)$"
-SUFFIX_TO_INDICATE_OPTIONAL = r"|^$"
-
-MAX_WG_TUNNELS = 3
-
 
 class MeshVpcCDKStack(cdk.Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        max_wg_tunnels: int = MAX_WG_TUNNELS,
+        architecture: str = DEFAULT_ARCHITECTURE,
+        **kwargs,
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         params = {
-            "MeshCIDR": cdk.CfnParameter(
-                self,
-                id="MeshCIDR",
-                allowed_pattern=CIDR_REGEX,
-                type="String",
-                description="Enter the mesh IP-space CIDR to use to create the VPC. This "
-                "must be a real mesh IP CIDR that is allocated exclusively for"
-                " this purpose. Minimum size is /28, but using at least a /27 is recommended",
-            ),
-            "RouterInstanceSSHPublicKeyMaterial": cdk.CfnParameter(
-                self,
-                id="RouterInstanceSSHPublicKeyMaterial",
-                type="String",
-                description="(optional) A public key which the router EC2 instance will trust for "
-                "SSH connections, must be in OpenSSH public key format. If not provided, the "
-                "router will not be accessible using vanilla SSH (only AWS Systems Manger). Note: "
-                "even if a key is provided here, you will still need to create a new security group"
-                " which allows port 22 access and associate it with the router instance in order"
-                "to actually connect over vanilla SSH from a non-mesh IP address.",
-                default="",
-            ),
+            name: cdk.CfnParameter(self, **spec)
+            for name, spec in get_core_parameter_specs(architecture).items()
         }
 
         wireguard_params = [
             {
-                "ServerIP": cdk.CfnParameter(
-                    self,
-                    id=f"WireguardServer{i + 1}IP",
-                    type="String",
-                    description="The public IP address of the mesh-side wireguard endpoint to connect to",
-                    default=SN3_VPN_SERVER_IP if i == 0 else None,
-                    allowed_pattern=IPV4_ADDR_REGEX
-                    if i == 0
-                    else IPV4_ADDR_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                ),
-                "ServerPort": cdk.CfnParameter(
-                    self,
-                    id=f"WireguardServer{i + 1}Port",
-                    type="String",
-                    description="The port that the IP specified above is listening for our connection on",
-                    allowed_pattern=PORT_NUMBER_REGEX
-                    if i == 0
-                    else PORT_NUMBER_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                ),
-                "ServerPublicKey": cdk.CfnParameter(
-                    self,
-                    id=f"WireguardServer{i + 1}PublicKey",
-                    type="String",
-                    description="The public key of the mesh-side wireguard server",
-                    default=SN3_VPN_SERVER_PUBLIC_KEY if i == 0 else None,
-                    allowed_pattern=WG_KEY_REGEX
-                    if i == 0
-                    else WG_KEY_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                ),
-                "p2pIPAddressMeshSide": cdk.CfnParameter(
-                    self,
-                    id=f"p2pIPAddress{i + 1}MeshSide",
-                    type="String",
-                    description="The adjacent router IP for the router instance to use as its OSPF "
-                    "neighbor. This should probably be the mesh-side of the P2P CIDR for your tunnel",
-                    allowed_pattern=IPV4_ADDR_REGEX
-                    if i == 0
-                    else IPV4_ADDR_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                ),
-                "p2pIPAddressAWSSide": cdk.CfnParameter(
-                    self,
-                    id=f"p2pIPAddress{i + 1}AWSSide",
-                    type="String",
-                    description="The AWS-side IP of the P2P CIDR for your tunnel "
-                    "(also used as the router's OSPF identity)"
-                    if i == 0
-                    else "The AWS-side IP of the P2P CIDR for your tunnel",
-                    allowed_pattern=IPV4_ADDR_REGEX
-                    if i == 0
-                    else IPV4_ADDR_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                ),
-                "LinkOSPFCost": cdk.CfnParameter(
-                    self,
-                    id=f"LinkOSFPCost{i+1}",
-                    type="String",
-                    default="10" if i == 0 else None,
-                    allowed_pattern=PORT_NUMBER_REGEX
-                    if i == 0
-                    else PORT_NUMBER_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
-                    description="The OSPF cost to use for this WG tunnel",
-                ),
+                name: cdk.CfnParameter(self, **spec)
+                for name, spec in get_wireguard_parameter_specs(i).items()
             }
-            for i in range(MAX_WG_TUNNELS)
+            for i in range(max_wg_tunnels)
         ]
 
-        wg_parameter_groups = [
-            {
-                "Label": {
-                    "default": f"WireGuard Connection {i + 1} Details{' (Optional)' if i > 0 else ''}"
-                },
-                "Parameters": [
-                    f"WireguardServer{i + 1}IP",
-                    f"WireguardServer{i + 1}Port",
-                    f"WireguardServer{i + 1}PublicKey",
-                    f"p2pIPAddress{i + 1}MeshSide",
-                    f"p2pIPAddress{i + 1}AWSSide",
-                    f"LinkOSFPCost{i + 1}",
-                ],
-            }
-            for i in range(MAX_WG_TUNNELS)
-        ]
-
-        wg_parameter_labels = dict(
-            ChainMap(
-                *[
-                    {
-                        f"p2pIPAddress{i + 1}MeshSide": {
-                            "default": f"WG tunnel {i + 1} P2P Address (Mesh Side)"
-                        },
-                        f"p2pIPAddress{i + 1}AWSSide": {
-                            "default": f"WG tunnel {i + 1} P2P Address (AWS Side)"
-                        },
-                        f"WireguardServer{i + 1}IP": {
-                            "default": f"Mesh WireGuard server {i + 1} Public IP"
-                        },
-                        f"WireguardServer{i + 1}Port": {
-                            "default": f"Mesh WireGuard server {i + 1} port"
-                        },
-                        f"WireguardServer{i + 1}PublicKey": {
-                            "default": f"Mesh WireGuard Server {i + 1} Public Key"
-                        },
-                        f"LinkOSFPCost{i + 1}": {
-                            "default": f"WG Tunnel {i + 1} OSPF Cost"
-                        },
-                    }
-                    for i in range(MAX_WG_TUNNELS)
-                ]
-            )
-        )
+        self.template_options.metadata = get_interface_metadata(max_wg_tunnels)
 
-        self.template_options.metadata = {
-            "AWS::CloudFormation::Interface": {
-                "ParameterGroups": [
-                    {
-                        "Label": {"default": "IP Addresses"},
-                        "Parameters": [
-                            "MeshCIDR",
-                        ],
-                    },
-                    *wg_parameter_groups,
-                    {
-                        "Label": {"default": "Router Instance Config"},
-                        "Parameters": [
-                            "RouterInstanceSSHPublicKeyMaterial",
-                        ],
-                    },
-                ],
-                "ParameterLabels": {
-                    "MeshCIDR": {"default": "Mesh CIDR range to use for VPC"},
-                    **wg_parameter_labels,
-                    "RouterInstanceSSHPublicKeyMaterial": {
-                        "default": "Public Key for SSH Access to the Router Instance"
-                    },
-                },
-            }
-        }
         wg_tunnel_conditions = [
             cdk.CfnCondition(
                 self,
@@ -198,10 +73,12 @@ class MeshVpcCDKStack(cdk.Stack):
                             )
                         )
                         for param in wireguard_params[i].keys()
+                        # The MTU has a default, and its pattern doesn't allow it to be empty
+                        if param != "LinkMTU"
                     ]
                 ),
             )
-            for i in range(MAX_WG_TUNNELS)
+            for i in range(max_wg_tunnels)
         ]
 
         conditions = {
@@ -214,57 +91,220 @@ class MeshVpcCDKStack(cdk.Stack):
                     )
                 ),
             ),
+            "HighAvailabilityEnabled": cdk.CfnCondition(
+                self,
+                "HighAvailabilityEnabled",
+                expression=cdk.Fn.condition_equals(
+                    params["RouterHighAvailability"].value_as_string, "enabled"
+                ),
+            ),
+            "MultiAZ": cdk.CfnCondition(
+                self,
+                "MultiAZ",
+                expression=cdk.Fn.condition_equals(
+                    params["MeshSubnetLayout"].value_as_string, "multi-az"
+                ),
+            ),
+            "InUSEast1": cdk.CfnCondition(
+                self,
+                "InUSEast1",
+                expression=cdk.Fn.condition_equals(cdk.Aws.REGION, "us-east-1"),
+            ),
+            "TransitGatewayHub": cdk.CfnCondition(
+                self,
+                "TransitGatewayHub",
+                expression=cdk.Fn.condition_not(
+                    cdk.Fn.condition_equals(
+                        params["TransitGatewaySpokeCIDR"].value_as_string, ""
+                    )
+                ),
+            ),
+            "BakedRouterImage": cdk.CfnCondition(
+                self,
+                "BakedRouterImage",
+                expression=cdk.Fn.condition_equals(
+                    params["RouterImage"].value_as_string, "baked"
+                ),
+            ),
+            "RouterDNSResolverEnabled": cdk.CfnCondition(
+                self,
+                "RouterDNSResolverEnabled",
+                expression=cdk.Fn.condition_equals(
+                    params["RouterDNSResolver"].value_as_string, "enabled"
+                ),
+            ),
         }
 
+        # CloudFormation rules can't compare numbers, so for each dead interval which isn't
+        # longer than every allowed hello interval, this lists the hello intervals it's longer than
+        cdk.CfnRule(
+            self,
+            "TunnelOSPFTimers",
+            assertions=[
+                cdk.CfnRuleAssertion(
+                    assert_=cdk.Fn.condition_and(
+                        *[
+                            cdk.Fn.condition_or(
+                                cdk.Fn.condition_not(
+                                    cdk.Fn.condition_equals(
+                                        params["TunnelOSPFDead"].value_as_string,
+                                        str(dead),
+                                    )
+                                ),
+                                cdk.Fn.condition_contains(
+                                    [str(hello) for hello in range(1, dead)],
+                                    params["TunnelOSPFHello"].value_as_string,
+                                ),
+                            )
+                            for dead in range(2, MAX_OSPF_HELLO_INTERVAL + 1)
+                        ]
+                    ),
+                    assert_description="TunnelOSPFDead must be longer than "
+                    "TunnelOSPFHello",
+                )
+            ],
+        )
+
+        # Flows offloaded to the flowtable skip the forward chain, where the accounting counts them
+        cdk.CfnRule(
+            self,
+            "EgressAccountingFastPath",
+            rule_condition=cdk.Fn.condition_equals(
+                params["EgressAccounting"].value_as_string, "enabled"
+            ),
+            assertions=[
+                cdk.CfnRuleAssertion(
+                    assert_=cdk.Fn.condition_not(
+                        cdk.Fn.condition_equals(
+                            params["ForwardingFastPath"].value_as_string, "flowtable"
+                        )
+                    ),
+                    assert_description="EgressAccounting can't be enabled with the "
+                    "flowtable ForwardingFastPath",
+                )
+            ],
+        )
+
+        router_profiles = cdk.CfnMapping(
+            self,
+            "RouterProfiles",
+            mapping={
+                name: {"InstanceType": instance_type}
+                for name, instance_type in ROUTER_PROFILES[architecture].items()
+            },
+        )
+
+        # A tunnel's routes in the second availability zone's route table only exist when both
+        # the tunnel and the zone do
+        multi_az_wg_tunnel_conditions = [
+            cdk.CfnCondition(
+                self,
+                f"WGServer{i + 1}ProvidedMultiAZ",
+                expression=cdk.Fn.condition_and(
+                    wg_tunnel_conditions[i], conditions["MultiAZ"]
+                ),
+            )
+            for i in range(max_wg_tunnels)
+        ]
+
+        # With the multi-az subnet layout, each zone after the first has a router of its own
+        # (and a standby, with a high availability pair) when any of the tunnels it brings up
+        # are provided. Otherwise its route table points at the first zone's router
+        zone_router_conditions = {}
+        zone_standby_router_conditions = {}
+        for zone in range(2, MULTI_AZ_SUBNETS + 1):
+            zone_tunnel_conditions = [
+                wg_tunnel_conditions[i]
+                for i in range(max_wg_tunnels)
+                if get_tunnel_zone(i) == zone
+            ]
+            if not zone_tunnel_conditions:
+                continue
+            zone_router_conditions[zone] = cdk.CfnCondition(
+                self,
+                f"RouterAZ{zone}",
+                expression=cdk.Fn.condition_and(
+                    conditions["MultiAZ"],
+                    (
+                        cdk.Fn.condition_or(*zone_tunnel_conditions)
+                        if len(zone_tunnel_conditions) > 1
+                        else zone_tunnel_conditions[0]
+                    ),
+                ),
+            )
+            zone_standby_router_conditions[zone] = cdk.CfnCondition(
+                self,
+                f"StandbyRouterAZ{zone}",
+                expression=cdk.Fn.condition_and(
+                    conditions["HighAvailabilityEnabled"],
+                    zone_router_conditions[zone],
+                ),
+            )
+
+        multi_az_subnet_sizes = cdk.CfnMapping(
+            self,
+            "MultiAZSubnetSizes",
+            mapping={
+                prefix_length: {"HostBits": str(host_bits)}
+                for prefix_length, host_bits in MULTI_AZ_SUBNET_HOST_BITS.items()
+            },
+        )
+
         core_vpc_infra = CoreVPCInfrastructure(
             self,
             "CoreVPCInfrastructure",
             vpc_cidr=params["MeshCIDR"].value_as_string,
+            multi_az_subnet_host_bits=multi_az_subnet_sizes.find_in_map(
+                params["MeshSubnetPrefixLength"].value_as_string, "HostBits"
+            ),
+            multi_az_condition=conditions["MultiAZ"],
+            us_east_1_condition=conditions["InUSEast1"],
         )
 
-        wg_param_substitutions = dict(
-            ChainMap(
-                *[
-                    {
-                        f"P2P_IP_Address_{i + 1}_AWS_Side": wireguard_params[i][
-                            "p2pIPAddressAWSSide"
-                        ].value_as_string,
-                        f"P2P_IP_Address_{i + 1}_Mesh_Side": wireguard_params[i][
-                            "p2pIPAddressMeshSide"
-                        ].value_as_string,
-                        f"WireGuardServer{i + 1}PublicKey": wireguard_params[i][
-                            "ServerPublicKey"
-                        ].value_as_string,
-                        f"WireGuardServer{i + 1}PublicIP": wireguard_params[i][
-                            "ServerIP"
-                        ].value_as_string,
-                        f"WireGuardServer{i + 1}Port": wireguard_params[i][
-                            "ServerPort"
-                        ].value_as_string,
-                        f"LinkOSPFCost{i + 1}": wireguard_params[i][
-                            "LinkOSPFCost"
-                        ].value_as_string,
-                    }
-                    for i in range(MAX_WG_TUNNELS)
-                ]
-            )
+        # `cdk deploy` uploads this to the CDK bootstrap bucket, for the routers to download on
+        # first boot. The clean templates point the routers at the copy upload.py publishes
+        # instead (see postprocess.use_published_router_files())
+        router_files = s3_assets.Asset(
+            self,
+            "RouterFiles",
+            path=write_router_files_bundle(cdk.Stage.of(self).outdir),
+        )
+        router_files_variables = get_router_files_variables(
+            {"bucket": router_files.s3_bucket_name, "key": router_files.s3_object_key}
         )
 
-        wg_condition_substitutions = {
-            f"CommentIfWGServer{i + 1}NotProvided": cdk.Fn.condition_if(
-                wg_tunnel_conditions[i].logical_id, "", "#"
-            ).to_string()
-            for i in range(1, MAX_WG_TUNNELS)
-        }
+        router_config = RouterConfigParameters(
+            self,
+            "RouterConfig",
+            max_wg_tunnels=max_wg_tunnels,
+            wg_server_provided_conditions=wg_tunnel_conditions,
+            router_files_variables=router_files_variables,
+        )
+
+        stock_image_id = ssm.StringParameter.value_for_string_parameter(
+            self, ROUTER_AMI_SSM_PARAMETERS[architecture]
+        )
+        router_image_pipeline = RouterImagePipeline(
+            self,
+            "RouterImagePipeline",
+            core_vpc_infra=core_vpc_infra,
+            parent_image=stock_image_id,
+            build_instance_type=IMAGE_BUILD_INSTANCE_TYPES[architecture],
+            condition=conditions["BakedRouterImage"],
+        )
 
-        user_data = cdk.Fn.base64(
+        # Tunnel config is deliberately kept out of the user data (the router reads it from
+        # router_config instead), since any change to the user data replaces the instance
+        router_user_data = cdk.Fn.base64(
             cdk.Fn.sub(
-                get_user_data(MAX_WG_TUNNELS),
+                get_user_data(),
                 {
                     "AWSRegion": cdk.Aws.REGION,
-                    "VPCCIDR": params["MeshCIDR"].value_as_string,
-                    **wg_param_substitutions,
-                    **wg_condition_substitutions,
+                    "RouterPackages": cdk.Fn.condition_if(
+                        conditions["BakedRouterImage"].logical_id,
+                        get_router_packages_list(preinstalled=True),
+                        get_router_packages_list(preinstalled=False),
+                    ).to_string(),
                 },
             )
         )
@@ -274,18 +314,144 @@ class MeshVpcCDKStack(cdk.Stack):
             "VPNRouterInstance",
             cfn_subnet=core_vpc_infra.cfn_subnet,
             cfn_security_group=core_vpc_infra.router_security_group,
+            route_table_ids=core_vpc_infra.get_route_table_ids(),
+            image_id=cdk.Fn.condition_if(
+                conditions["BakedRouterImage"].logical_id,
+                router_image_pipeline.image.attr_image_id,
+                stock_image_id,
+            ).to_string(),
+            instance_type=router_profiles.find_in_map(
+                params["RouterProfile"].value_as_string, "InstanceType"
+            ),
             public_key_material=params[
                 "RouterInstanceSSHPublicKeyMaterial"
             ].value_as_string,
             public_key_provided_condition=conditions["PublicKeyProvided"],
-            user_data=user_data,
+            user_data=router_user_data,
+            router_files_variables=router_files_variables,
+        )
+        # In the second availability zone when there are several, so the pair survives the loss
+        # of a zone, unless that zone has a router of its own. Then the standby stays in the
+        # first zone, so the routes it takes over still don't cross zones
+        standby_subnet_id = cdk.Fn.condition_if(
+            conditions["MultiAZ"].logical_id,
+            core_vpc_infra.cfn_subnets[1].attr_subnet_id,
+            core_vpc_infra.cfn_subnet.attr_subnet_id,
+        )
+        if 2 in zone_router_conditions:
+            standby_subnet_id = cdk.Fn.condition_if(
+                zone_router_conditions[2].logical_id,
+                core_vpc_infra.cfn_subnet.attr_subnet_id,
+                standby_subnet_id,
+            )
+        vpn_router_instance.add_standby_instance(
+            subnet_id=standby_subnet_id.to_string(),
+            condition=conditions["HighAvailabilityEnabled"],
+        )
+        for zone, condition in zone_router_conditions.items():
+            vpn_router_instance.add_zone_routers(
+                zone,
+                subnet_id=core_vpc_infra.cfn_subnets[zone - 1].attr_subnet_id,
+                condition=condition,
+                standby_condition=zone_standby_router_conditions[zone],
+            )
+
+        # Each zone's route table points at its own router, or the first zone's when it has
+        # none, in which case the first zone's router pair also fails over its routes
+        route_table_ids = core_vpc_infra.get_route_table_ids()
+        zone_router_instance_ids = [vpn_router_instance.instance.ref]
+        shared_route_table_ids = []
+        for zone in range(2, MULTI_AZ_SUBNETS + 1):
+            if zone not in zone_router_conditions:
+                zone_router_instance_ids.append(vpn_router_instance.instance.ref)
+                shared_route_table_ids.append(route_table_ids[zone - 1])
+                continue
+            zone_router_instance_ids.append(
+                cdk.Fn.condition_if(
+                    zone_router_conditions[zone].logical_id,
+                    vpn_router_instance.zone_instances[zone].ref,
+                    vpn_router_instance.instance.ref,
+                ).to_string()
+            )
+            shared_route_table_ids.append(
+                cdk.Fn.condition_if(
+                    zone_router_conditions[zone].logical_id,
+                    route_table_ids[0],
+                    route_table_ids[zone - 1],
+                ).to_string()
+            )
+
+        router_config.add_failover_parameter(
+            route_table_ids,
+            shared_route_table_ids,
+            condition=conditions["HighAvailabilityEnabled"],
         )
 
+        # The optional tunnels' parameters may not exist, but the global and first tunnel
+        # parameters always do, and are enough for the router to come up on first boot
+        for instance in [
+            vpn_router_instance.instance,
+            vpn_router_instance.standby_instance,
+            *vpn_router_instance.zone_instances.values(),
+            *vpn_router_instance.zone_standby_instances.values(),
+        ]:
+            instance.add_dependency(router_config.global_parameter)
+            instance.add_dependency(router_config.tunnel_parameters[0])
+
         core_vpc_infra.add_mesh_routes(
-            vpn_router_instance.instance.ref,
+            zone_router_instance_ids,
             [
                 wireguard_params[i]["ServerIP"].value_as_string
-                for i in range(MAX_WG_TUNNELS)
+                for i in range(max_wg_tunnels)
+            ],
+            [wg_tunnel_conditions[i] for i in range(max_wg_tunnels)],
+            multi_az_wg_tunnel_conditions,
+        )
+
+        # Both routers of a high availability pair run the resolver, though only the active one
+        # can reach the mesh's resolvers. The Amazon provided resolver is last, so AWS names
+        # still resolve while neither router is up. DHCP options list at most four servers, so
+        # the other zones' standby routers are left out
+        core_vpc_infra.add_dhcp_options(
+            [
+                vpn_router_instance.instance.attr_private_ip,
+                *[
+                    cdk.Fn.condition_if(
+                        condition.logical_id,
+                        vpn_router_instance.zone_instances[zone].attr_private_ip,
+                        cdk.Aws.NO_VALUE,
+                    ).to_string()
+                    for zone, condition in zone_router_conditions.items()
+                ],
+                cdk.Fn.condition_if(
+                    conditions["HighAvailabilityEnabled"].logical_id,
+                    vpn_router_instance.standby_instance.attr_private_ip,
+                    cdk.Aws.NO_VALUE,
+                ).to_string(),
+                AMAZON_DNS_SERVER,
             ],
-            [wg_tunnel_conditions[i] for i in range(MAX_WG_TUNNELS)],
+            condition=conditions["RouterDNSResolverEnabled"],
+        )
+
+        # A hub's route tables send the spoke VPCs' traffic from the router to the transit
+        # gateway (the spokes' routes to the mesh point at the transit gateway themselves)
+        transit_gateway_hub_multi_az = cdk.CfnCondition(
+            self,
+            "TransitGatewayHubMultiAZ",
+            expression=cdk.Fn.condition_and(
+                conditions["TransitGatewayHub"], conditions["MultiAZ"]
+            ),
+        )
+        transit_gateway_hub = TransitGatewayHub(
+            self,
+            "Hub",
+            core_vpc_infra=core_vpc_infra,
+            condition=conditions["TransitGatewayHub"],
+        )
+        core_vpc_infra.add_transit_gateway_routes(
+            "Spoke CIDR",
+            transit_gateway_hub.transit_gateway.attr_id,
+            [params["TransitGatewaySpokeCIDR"].value_as_string],
+            transit_gateway_hub.attachment,
+            [conditions["TransitGatewayHub"], transit_gateway_hub_multi_az],
         )
@@ -0,0 +1,659 @@
+"""
+Builds a simulated router, VPC and mesh in Linux network namespaces on this machine, using the
+router config exactly as the stack ships it (the templates and mesh-router-config from the
+router files), and measures how it routes:
+
+    sudo python3 -m mesh_vpccdk.netns_rig --max-tunnels 4 --output cdk.out/netns-rig.json
+
+For each tunnel count from 1 to --max-tunnels, this brings up the router with that many
+WireGuard tunnels to a simulated mesh-side WireGuard and bird peer, waits for every OSPF
+adjacency to reach Full, then measures latency (ping) and throughput (iperf3) from a VPC host to
+the mesh and back. It also transfers from the VPC host to a mesh host on a 1500 byte MTU LAN,
+which fails unless the router clamps the MSS the mesh host advertises to fit the tunnels. Needs
+root, and ip, wg, bird (1.6), birdc, nft, ping and iperf3 installed.
+
+The namespaces are laid out like the real deployment:
+
+    meshrig-vpc      The VPC: a host at the VPC router address (.1), which also NATs the
+                     router's WireGuard traffic out to the "internet" like an internet gateway.
+                     With --subnet-layout multi-az, the router's subnet is only half the VPC
+                     CIDR, and this also has a host in the other half (the other zone)
+    meshrig-router   The router, with ens5 facing the VPC
+    meshrig-mesh     The mesh: a WireGuard server and bird peer per tunnel, and SN3's address
+    meshrig-meshhost A host on a LAN in the mesh, behind meshrig-mesh
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from string import Template
+
+from ruamel.yaml import YAML
+
+from mesh_vpccdk.cloud_config import (
+    ROUTER_AGENTS_DIRECTORY,
+    ROUTER_TEMPLATE_DIRECTORY,
+    get_router_files,
+)
+from mesh_vpccdk.constants import FAILOVER_HEALTH_CHECK_TARGET
+from mesh_vpccdk.parameters import (
+    get_core_parameter_specs,
+    get_wireguard_parameter_specs,
+)
+from mesh_vpccdk.router_config import (
+    get_global_config_template,
+    get_tunnel_config_template,
+)
+
+VPC_NAMESPACE = "meshrig-vpc"
+ROUTER_NAMESPACE = "meshrig-router"
+MESH_NAMESPACE = "meshrig-mesh"
+MESH_HOST_NAMESPACE = "meshrig-meshhost"
+NAMESPACES = [VPC_NAMESPACE, ROUTER_NAMESPACE, MESH_NAMESPACE, MESH_HOST_NAMESPACE]
+
+VPC_CIDR = "10.70.100.0/27"
+VPC_ROUTER_ADDRESS = "10.70.100.1"
+ROUTER_ADDRESS = "10.70.100.4"
+# In the half of VPC_CIDR the router's subnet doesn't cover, with the multi-az subnet layout
+OTHER_ZONE_HOST_ADDRESS = "10.70.100.20"
+INTERNET_VPC_SIDE_ADDRESS = "203.0.113.1"
+INTERNET_MESH_SIDE_ADDRESS = "203.0.113.2"
+MESH_TARGET = FAILOVER_HEALTH_CHECK_TARGET
+MESH_LAN_ADDRESS = "10.72.0.1"
+MESH_HOST_ADDRESS = "10.72.0.2"
+MESH_LAN_MTU = 1500
+
+REQUIRED_COMMANDS = ["ip", "wg", "bird", "birdc", "nft", "ping", "iperf3"]
+
+MESH_BIRD_CONF = """router id ${router_id};
+
+protocol device {
+        scan time 10;
+}
+
+protocol kernel {
+        persist;
+        export all;
+}
+${bfd_protocol}
+protocol ospf {
+        ecmp yes;
+        import all;
+        export none;
+        area 0 {
+                interface "mesh0" {
+                        stub yes;
+                };
+                interface "lan0" {
+                        stub yes;
+                };
+${interfaces}
+        };
+}
+"""
+
+MESH_OSPF_INTERFACE = """                interface "${interface}" {
+                        cost ${ospf_cost};
+                        hello ${ospf_hello};
+                        dead ${ospf_dead};
+                        bfd ${bfd};
+                        type ptmp;
+                        neighbors {
+                                ${aws_side_ip};
+                        };
+                };"""
+
+VPC_NAT_RULES = """table ip meshrig_nat {
+        chain postrouting {
+                type nat hook postrouting priority 100; policy accept;
+                oifname "to-mesh" masquerade
+        }
+}
+"""
+
+PING_RTT_REGEX = re.compile(r"= ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms")
+
+
+class RigError(Exception):
+    pass
+
+
+def run(command, namespace=None, check=True, input=None):
+    """
+    Runs a command (split on whitespace), optionally inside one of the rig's namespaces
+    """
+    command = command.split()
+    if namespace:
+        command = ["ip", "netns", "exec", namespace, *command]
+    result = subprocess.run(
+        command,
+        input=input,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if check and result.returncode != 0:
+        raise RigError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def load_router_config_agent():
+    spec = importlib.util.spec_from_file_location(
+        "mesh_router_config",
+        os.path.join(ROUTER_AGENTS_DIRECTORY, "mesh_router_config.py"),
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_file(path, content):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    return path
+
+
+def write_router_templates(template_dir):
+    for path, file in get_router_files().items():
+        if path.startswith(ROUTER_TEMPLATE_DIRECTORY):
+            write_file(
+                os.path.join(template_dir, os.path.basename(path)), file["content"]
+            )
+
+
+def get_parameter_values(num_tunnels, mesh_public_key, overrides):
+    """
+    Returns the stack parameter values to render the router config with: each parameter's
+    default, with the rig's addressing and any overrides on top
+    """
+    values = {
+        spec["id"]: spec.get("default") for spec in get_core_parameter_specs().values()
+    }
+    values["MeshCIDR"] = VPC_CIDR
+
+    for i in range(num_tunnels):
+        specs = get_wireguard_parameter_specs(i)
+        values.update({spec["id"]: spec.get("default") for spec in specs.values()})
+        values.update(
+            {
+                specs["ServerIP"]["id"]: INTERNET_MESH_SIDE_ADDRESS,
+                specs["ServerPort"]["id"]: str(51820 + i),
+                specs["ServerPublicKey"]["id"]: mesh_public_key,
+                specs["p2pIPAddressMeshSide"]["id"]: f"10.71.0.{2 * i}",
+                specs["p2pIPAddressAWSSide"]["id"]: f"10.71.0.{2 * i + 1}",
+                specs["LinkOSPFCost"]["id"]: "10",
+            }
+        )
+
+    values.update(overrides)
+    return values
+
+
+def render_router_config(agent, template_dir, num_tunnels, mesh_public_key, overrides):
+    """
+    Renders the router config the same way the router does, from the config parameter values
+    the stack would publish. The rig runs the first availability zone's router, which with the
+    multi-az subnet layout only brings up every other tunnel
+    """
+    values = get_parameter_values(num_tunnels, mesh_public_key, overrides)
+    config = json.loads(Template(get_global_config_template()).substitute(values))
+    config["tunnels"] = [
+        json.loads(Template(get_tunnel_config_template(i)).substitute(values))
+        for i in range(num_tunnels)
+    ]
+    agent.validate_config(config)
+    config["role"] = "active"
+    config["zone"] = 1
+    agent.select_zone_tunnels(config)
+    return config, agent.render(config, template_dir)
+
+
+def generate_key_pair():
+    private_key = run("wg genkey").strip()
+    return private_key, run("wg pubkey", input=private_key).strip()
+
+
+def teardown():
+    existing = run("ip netns list").split()
+    for namespace in NAMESPACES:
+        if namespace not in existing:
+            continue
+        # Processes (bird, iperf3) outlive their namespace unless killed
+        for pid in run(f"ip netns pids {namespace}").split():
+            run(f"kill {pid}", check=False)
+        run(f"ip netns delete {namespace}")
+
+
+def build_network(workdir, vpc_mtu, subnet_layout):
+    for namespace in NAMESPACES:
+        run(f"ip netns add {namespace}")
+        run("ip link set lo up", namespace=namespace)
+        run("sysctl -qw net.ipv4.ip_forward=1", namespace=namespace)
+
+    # VPC <-> router. With the multi-az layout, the router's subnet is the first half of the VPC
+    # CIDR, and the VPC router reaches the other zone's host directly
+    subnet_prefix_length = 27 if subnet_layout == "single" else 28
+    run(
+        f"ip link add to-router mtu {vpc_mtu} netns {VPC_NAMESPACE} type veth "
+        f"peer ens5 mtu {vpc_mtu} netns {ROUTER_NAMESPACE}"
+    )
+    run(
+        f"ip addr add {VPC_ROUTER_ADDRESS}/{subnet_prefix_length} dev to-router",
+        namespace=VPC_NAMESPACE,
+    )
+    run("ip link set to-router up", namespace=VPC_NAMESPACE)
+    run(
+        f"ip addr add {ROUTER_ADDRESS}/{subnet_prefix_length} dev ens5",
+        namespace=ROUTER_NAMESPACE,
+    )
+    run("ip link set ens5 up", namespace=ROUTER_NAMESPACE)
+    # The router gets this from DHCP in the VPC
+    run(f"ip route add default via {VPC_ROUTER_ADDRESS}", namespace=ROUTER_NAMESPACE)
+    # The VPC's route table sends the mesh to the router
+    run(f"ip route add 10.0.0.0/8 via {ROUTER_ADDRESS}", namespace=VPC_NAMESPACE)
+    if subnet_layout != "single":
+        run("ip link add zone2 type dummy", namespace=VPC_NAMESPACE)
+        run(
+            f"ip addr add {OTHER_ZONE_HOST_ADDRESS}/28 dev zone2",
+            namespace=VPC_NAMESPACE,
+        )
+        run("ip link set zone2 up", namespace=VPC_NAMESPACE)
+
+    # VPC <-> "internet" <-> mesh. The mesh learns the VPC CIDR over the tunnels, so the
+    # router's WireGuard traffic is NATed on its way out, as the internet gateway would
+    run(
+        f"ip link add to-mesh netns {VPC_NAMESPACE} type veth "
+        f"peer to-vpc netns {MESH_NAMESPACE}"
+    )
+    run(
+        f"ip addr add {INTERNET_VPC_SIDE_ADDRESS}/24 dev to-mesh",
+        namespace=VPC_NAMESPACE,
+    )
+    run("ip link set to-mesh up", namespace=VPC_NAMESPACE)
+    run(
+        f"ip addr add {INTERNET_MESH_SIDE_ADDRESS}/24 dev to-vpc",
+        namespace=MESH_NAMESPACE,
+    )
+    run("ip link set to-vpc up", namespace=MESH_NAMESPACE)
+    nat_path = write_file(os.path.join(workdir, "vpc-nat.nft"), VPC_NAT_RULES)
+    run(f"nft -f {nat_path}", namespace=VPC_NAMESPACE)
+
+    # SN3's address, which the mesh announces into OSPF
+    run("ip link add mesh0 type dummy", namespace=MESH_NAMESPACE)
+    run(f"ip addr add {MESH_TARGET}/32 dev mesh0", namespace=MESH_NAMESPACE)
+    run("ip link set mesh0 up", namespace=MESH_NAMESPACE)
+
+    # A mesh host on an ordinary LAN, which (unlike SN3's address above) advertises an MSS
+    # larger than the tunnels carry
+    run(
+        f"ip link add lan0 mtu {MESH_LAN_MTU} netns {MESH_NAMESPACE} type veth "
+        f"peer eth0 mtu {MESH_LAN_MTU} netns {MESH_HOST_NAMESPACE}"
+    )
+    run(f"ip addr add {MESH_LAN_ADDRESS}/24 dev lan0", namespace=MESH_NAMESPACE)
+    run("ip link set lan0 up", namespace=MESH_NAMESPACE)
+    run(f"ip addr add {MESH_HOST_ADDRESS}/24 dev eth0", namespace=MESH_HOST_NAMESPACE)
+    run("ip link set eth0 up", namespace=MESH_HOST_NAMESPACE)
+    run(f"ip route add default via {MESH_LAN_ADDRESS}", namespace=MESH_HOST_NAMESPACE)
+
+
+def add_wireguard_interface(
+    namespace,
+    name,
+    private_key_path,
+    port,
+    addresses,
+    mtu,
+    peer_public_key,
+    allowed_ips,
+    endpoint=None,
+    keepalive=None,
+):
+    run(f"ip link add {name} type wireguard", namespace=namespace)
+    peer = f"peer {peer_public_key} allowed-ips {','.join(allowed_ips)}"
+    if endpoint:
+        peer += f" endpoint {endpoint}"
+    if keepalive:
+        peer += f" persistent-keepalive {keepalive}"
+    run(
+        f"wg set {name} private-key {private_key_path} listen-port {port} {peer}",
+        namespace=namespace,
+    )
+    for address in addresses:
+        run(f"ip addr add {address} dev {name}", namespace=namespace)
+    run(f"ip link set {name} mtu {mtu} up", namespace=namespace)
+
+
+def start_bird(namespace, workdir, bird_conf):
+    path = os.path.join(workdir, f"{namespace}-bird")
+    write_file(f"{path}.conf", bird_conf)
+    run(f"bird -c {path}.conf -s {path}.ctl -P {path}.pid", namespace=namespace)
+    return f"{path}.ctl"
+
+
+def apply_router_config(agent, rendered, workdir, router_private_key_path):
+    """
+    Applies the rendered router config in the router namespace. netplan (and networkd) can't
+    run inside a namespace, so its config is translated to the equivalent ip and wg commands
+    """
+    yaml = YAML(typ="safe")
+
+    sysctl_path = write_file(
+        os.path.join(workdir, "router-sysctl.conf"), rendered[agent.SYSCTL_PATH]
+    )
+    run(f"sysctl -q -p {sysctl_path}", namespace=ROUTER_NAMESPACE)
+
+    netplan = yaml.load(rendered[agent.STATIC_ROUTES_NETPLAN_PATH])
+    ens5 = netplan["network"]["ethernets"]["ens5"]
+    run(f"ip link set ens5 mtu {ens5['mtu']}", namespace=ROUTER_NAMESPACE)
+    for route in ens5["routes"]:
+        run(
+            f"ip route replace {route['to']} via {route['via']}",
+            namespace=ROUTER_NAMESPACE,
+        )
+
+    netplan = yaml.load(rendered[agent.WIREGUARD_NETPLAN_PATH])
+    for name, tunnel in netplan["network"]["tunnels"].items():
+        (peer,) = tunnel["peers"]
+        add_wireguard_interface(
+            ROUTER_NAMESPACE,
+            name,
+            router_private_key_path,
+            port=tunnel["port"],
+            addresses=tunnel["addresses"],
+            mtu=tunnel["mtu"],
+            peer_public_key=peer["keys"]["public"],
+            allowed_ips=peer["allowed-ips"],
+            endpoint=peer["endpoint"],
+            keepalive=peer["keepalive"],
+        )
+
+    nftables_path = write_file(
+        os.path.join(workdir, "router.nft"), rendered[agent.NFTABLES_PATH]
+    )
+    run(f"nft -f {nftables_path}", namespace=ROUTER_NAMESPACE)
+
+    return start_bird(ROUTER_NAMESPACE, workdir, rendered[agent.BIRD_CONF_PATH])
+
+
+def start_mesh(config, template_dir, workdir, mesh_private_key_path, router_public_key):
+    bfd = "yes" if config["bfd"] == "enabled" else "no"
+    for tunnel in config["tunnels"]:
+        add_wireguard_interface(
+            MESH_NAMESPACE,
+            tunnel["interface"],
+            mesh_private_key_path,
+            port=tunnel["server_port"],
+            addresses=[f"{tunnel['mesh_side_ip']}/31"],
+            mtu=tunnel["mtu"],
+            peer_public_key=router_public_key,
+            allowed_ips=["0.0.0.0/0"],
+        )
+
+    with open(os.path.join(template_dir, "bfd.conf"), "r") as f:
+        bfd_protocol = f.read() if bfd == "yes" else ""
+    interfaces = "\n".join(
+        Template(MESH_OSPF_INTERFACE).substitute(
+            tunnel,
+            bfd=bfd,
+            ospf_hello=config["ospf_hello"],
+            ospf_dead=config["ospf_dead"],
+        )
+        for tunnel in config["tunnels"]
+    )
+    return start_bird(
+        MESH_NAMESPACE,
+        workdir,
+        Template(MESH_BIRD_CONF).substitute(
+            router_id=MESH_TARGET, bfd_protocol=bfd_protocol, interfaces=interfaces
+        ),
+    )
+
+
+def wait_for_ospf_full(socket_path, num_tunnels, timeout):
+    start = time.monotonic()
+    while True:
+        neighbors = run(
+            f"birdc -s {socket_path} show ospf neighbors",
+            namespace=ROUTER_NAMESPACE,
+            check=False,
+        )
+        if neighbors.count("Full") >= num_tunnels:
+            return time.monotonic() - start
+        if time.monotonic() - start > timeout:
+            raise RigError(f"OSPF adjacencies didn't reach Full:\n{neighbors}")
+        time.sleep(0.5)
+
+
+def wait_for_route(timeout, target=MESH_TARGET, source=None):
+    # OSPF is Full slightly before bird has installed the routes it learned
+    command = f"ping -c 1 -W 1 {target}"
+    if source:
+        command += f" -I {source}"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            run(command, namespace=VPC_NAMESPACE)
+            return
+        except RigError:
+            if time.monotonic() > deadline:
+                raise RigError(
+                    f"{target} isn't reachable from {source or 'the VPC'} via the router"
+                )
+            time.sleep(0.5)
+
+
+def measure_latency(count):
+    output = run(f"ping -q -c {count} -i 0.2 {MESH_TARGET}", namespace=VPC_NAMESPACE)
+    rtt_min, rtt_avg, rtt_max, rtt_mdev = PING_RTT_REGEX.search(output).groups()
+    return {
+        "min_ms": float(rtt_min),
+        "avg_ms": float(rtt_avg),
+        "max_ms": float(rtt_max),
+        "mdev_ms": float(rtt_mdev),
+    }
+
+
+def measure_throughput(duration, streams, reverse):
+    command = f"iperf3 -c {MESH_TARGET} -t {duration} -P {streams} -J"
+    if reverse:
+        command += " -R"
+    result = json.loads(run(command, namespace=VPC_NAMESPACE))
+    return result["end"]["sum_received"]["bits_per_second"]
+
+
+def measure_mesh_host_transfer(duration, config):
+    """
+    Sends from the VPC host to the mesh host, and checks the connection's MSS (the smaller of
+    the VPC host's own and the one the mesh host advertised) fits the tunnels
+    """
+    command = f"iperf3 -c {MESH_HOST_ADDRESS} -t {duration} -J"
+    result = json.loads(run(command, namespace=VPC_NAMESPACE))
+    mss = result["start"]["tcp_mss_default"]
+    tunnel_mss = min(int(tunnel["mtu"]) for tunnel in config["tunnels"]) - 40
+    if mss > tunnel_mss:
+        raise RigError(
+            f"Transfers to the mesh host use an MSS of {mss}, larger than the tunnels' "
+            f"{tunnel_mss}"
+        )
+    return mss, result["end"]["sum_received"]["bits_per_second"]
+
+
+def run_tunnel_count(agent, num_tunnels, args, overrides):
+    teardown()
+    workdir = tempfile.mkdtemp(prefix="meshrig-")
+    try:
+        template_dir = os.path.join(workdir, "templates")
+        os.mkdir(template_dir)
+        write_router_templates(template_dir)
+
+        router_private_key, router_public_key = generate_key_pair()
+        mesh_private_key, mesh_public_key = generate_key_pair()
+        router_key_path = write_file(
+            os.path.join(workdir, "router.key"), router_private_key
+        )
+        mesh_key_path = write_file(os.path.join(workdir, "mesh.key"), mesh_private_key)
+
+        config, rendered = render_router_config(
+            agent, template_dir, num_tunnels, mesh_public_key, overrides
+        )
+        build_network(workdir, config["vpc_mtu"], args.subnet_layout)
+        start_mesh(config, template_dir, workdir, mesh_key_path, router_public_key)
+        router_socket = apply_router_config(agent, rendered, workdir, router_key_path)
+
+        result = {"tunnels": len(config["tunnels"])}
+        result["ospf_full_seconds"] = round(
+            wait_for_ospf_full(
+                router_socket, len(config["tunnels"]), args.ospf_timeout
+            ),
+            2,
+        )
+        wait_for_route(timeout=30)
+        wait_for_route(timeout=30, target=MESH_HOST_ADDRESS)
+        if args.subnet_layout != "single":
+            # The mesh only routes back to the other zone if the router announces the whole
+            # VPC CIDR, rather than just its own subnet
+            wait_for_route(timeout=30, source=OTHER_ZONE_HOST_ADDRESS)
+
+        run(f"iperf3 -s -D -B {MESH_TARGET}", namespace=MESH_NAMESPACE)
+        run(f"iperf3 -s -D -B {MESH_HOST_ADDRESS}", namespace=MESH_HOST_NAMESPACE)
+        time.sleep(0.5)
+        result["latency"] = measure_latency(args.pings)
+        result["to_mesh_bits_per_second"] = measure_throughput(
+            args.duration, args.streams, reverse=False
+        )
+        result["from_mesh_bits_per_second"] = measure_throughput(
+            args.duration, args.streams, reverse=True
+        )
+        (
+            result["to_mesh_host_mss"],
+            result["to_mesh_host_bits_per_second"],
+        ) = measure_mesh_host_transfer(args.duration, config)
+
+    finally:
+        if args.keep:
+            print(f"Left the rig up, with its config in {workdir}", file=sys.stderr)
+        else:
+            teardown()
+            shutil.rmtree(workdir)
+
+    return result
+
+
+def format_results(results) -> str:
+    header = [
+        "tunnels",
+        "ospf_full",
+        "rtt_avg",
+        "rtt_max",
+        "to_mesh",
+        "from_mesh",
+        "to_mesh_host",
+    ]
+    rows = [
+        [
+            str(result["tunnels"]),
+            f"{result['ospf_full_seconds']:.1f}s",
+            f"{result['latency']['avg_ms']:.3f}ms",
+            f"{result['latency']['max_ms']:.3f}ms",
+            f"{result['to_mesh_bits_per_second'] / 1e9:.2f}Gbit/s",
+            f"{result['from_mesh_bits_per_second'] / 1e9:.2f}Gbit/s",
+            f"{result['to_mesh_host_bits_per_second'] / 1e9:.2f}Gbit/s",
+        ]
+        for result in results
+    ]
+
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.rjust(width) for cell, width in zip(row, widths))
+        for row in [header, *rows]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the router in a simulated VPC and mesh, in namespaces"
+    )
+    parser.add_argument("--max-tunnels", type=int, default=2)
+    parser.add_argument("--ecmp", choices=["disabled", "enabled"], default="enabled")
+    parser.add_argument("--bfd", choices=["disabled", "enabled"], default="disabled")
+    parser.add_argument(
+        "--fast-path",
+        choices=get_core_parameter_specs()["ForwardingFastPath"]["allowed_values"],
+        default="disabled",
+    )
+    parser.add_argument(
+        "--subnet-layout",
+        choices=get_core_parameter_specs()["MeshSubnetLayout"]["allowed_values"],
+        default="single",
+    )
+    parser.add_argument(
+        "--route-filtering",
+        choices=get_core_parameter_specs()["MeshRouteFiltering"]["allowed_values"],
+        default="full",
+    )
+    parser.add_argument(
+        "--ospf-hello",
+        default="1",
+        help="Shorter than the stack's default, so the adjacencies come up quickly",
+    )
+    parser.add_argument("--ospf-dead", default="4")
+    parser.add_argument("--ospf-timeout", type=float, default=120)
+    parser.add_argument(
+        "--duration", type=int, default=10, help="Seconds per iperf3 run"
+    )
+    parser.add_argument(
+        "--streams", type=int, default=4, help="Parallel iperf3 streams"
+    )
+    parser.add_argument("--pings", type=int, default=50)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Leave the last rig's namespaces up for poking around in",
+    )
+    args = parser.parse_args(argv)
+
+    if os.geteuid() != 0:
+        print("The rig must be run as root", file=sys.stderr)
+        return 1
+    missing = [command for command in REQUIRED_COMMANDS if not shutil.which(command)]
+    if missing:
+        print(f"The rig needs {', '.join(missing)} installed", file=sys.stderr)
+        return 1
+
+    overrides = {"ECMPMode": args.ecmp, "TunnelBFD": args.bfd}
+    overrides["ForwardingFastPath"] = args.fast_path
+    overrides["MeshRouteFiltering"] = args.route_filtering
+    overrides["MeshSubnetLayout"] = args.subnet_layout
+    overrides["TunnelOSPFHello"] = args.ospf_hello
+    overrides["TunnelOSPFDead"] = args.ospf_dead
+
+    agent = load_router_config_agent()
+    results = []
+    try:
+        for num_tunnels in range(1, args.max_tunnels + 1):
+            results.append(run_tunnel_count(agent, num_tunnels, args, overrides))
+            print(format_results(results[-1:]), file=sys.stderr)
+    except RigError as e:
+        print(f"Rig failed: {e}", file=sys.stderr)
+        teardown()
+        return 1
+
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
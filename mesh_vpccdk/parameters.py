@@ -0,0 +1,478 @@
+from collections import ChainMap
+
+from mesh_vpccdk.constants import (
+    CIDR_REGEX,
+    DEFAULT_ARCHITECTURE,
+    DEFAULT_ROUTER_PROFILE,
+    DEFAULT_WG_TUNNEL_MTU,
+    IPV4_ADDR_REGEX,
+    MAX_CIDR_LENGTH,
+    MAX_IPV4_ADDR_LENGTH,
+    MAX_OSPF_HELLO_INTERVAL,
+    MAX_OSPF_HELLO_INTERVAL_LENGTH,
+    MAX_PORT_NUMBER_LENGTH,
+    MULTI_AZ_SUBNET_HOST_BITS,
+    MULTI_AZ_SUBNETS,
+    OSPF_DEAD_INTERVAL_REGEX,
+    OSPF_HELLO_INTERVAL_REGEX,
+    PORT_NUMBER_REGEX,
+    ROUTER_PROFILES,
+    SN3_VPN_SERVER_IP,
+    SN3_VPN_SERVER_PUBLIC_KEY,
+    SUFFIX_TO_INDICATE_OPTIONAL,
+    TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+    TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+    VPC_MTUS,
+    WG_TUNNEL_MTU_REGEX,
+    WG_KEY_LENGTH,
+    WG_KEY_REGEX,
+)
+
+# The parameter definitions live here (rather than inline in the stack) so that both the CDK
+# stack and the jsii-free renderer in fast_synth.py are generated from the same source. Each
+# spec is a dict of keyword arguments for cdk.CfnParameter()
+
+
+def get_core_parameter_specs(architecture: str = DEFAULT_ARCHITECTURE) -> dict:
+    router_profiles = ROUTER_PROFILES[architecture]
+    burstable_family = router_profiles[DEFAULT_ROUTER_PROFILE].split(".")[0]
+    return {
+        "MeshCIDR": {
+            "id": "MeshCIDR",
+            "allowed_pattern": CIDR_REGEX,
+            "max_length": MAX_CIDR_LENGTH,
+            "type": "String",
+            "description": "Enter the mesh IP-space CIDR to use to create the VPC. This "
+            "must be a real mesh IP CIDR that is allocated exclusively for"
+            " this purpose. Minimum size is /28, but using at least a /27 is recommended",
+        },
+        "MeshSubnetLayout": {
+            "id": "MeshSubnetLayout",
+            "type": "String",
+            "description": '"single" uses one subnet spanning the mesh CIDR. "multi-az" creates '
+            f"{MULTI_AZ_SUBNETS} subnets in different availability zones. Set when the stack is "
+            "created",
+            "allowed_values": ["single", "multi-az"],
+            "default": "single",
+        },
+        "MeshSubnetPrefixLength": {
+            "id": "MeshSubnetPrefixLength",
+            "type": "String",
+            "description": 'The prefix length of each "multi-az" subnet, allocated from the start '
+            "of the mesh CIDR",
+            "allowed_values": list(MULTI_AZ_SUBNET_HOST_BITS),
+            "default": "28",
+        },
+        "TransitGatewaySpokeCIDR": {
+            "id": "TransitGatewaySpokeCIDR",
+            "type": "String",
+            "description": "(optional) A mesh IP-space CIDR covering spoke VPCs (see the "
+            "MeshSpokeVpcStack template), which this router serves through a transit gateway",
+            "allowed_pattern": CIDR_REGEX + SUFFIX_TO_INDICATE_OPTIONAL,
+            "max_length": MAX_CIDR_LENGTH,
+            "default": "",
+        },
+        "RouterInstanceSSHPublicKeyMaterial": {
+            "id": "RouterInstanceSSHPublicKeyMaterial",
+            "type": "String",
+            "description": "(optional) A public key which the router EC2 instance will trust for "
+            "SSH connections, must be in OpenSSH public key format. If not provided, the "
+            "router will not be accessible using vanilla SSH (only AWS Systems Manger). Note: "
+            "even if a key is provided here, you will still need to create a new security group"
+            " which allows port 22 access and associate it with the router instance in order"
+            "to actually connect over vanilla SSH from a non-mesh IP address.",
+            "default": "",
+        },
+        "RouterProfile": {
+            "id": "RouterProfile",
+            "type": "String",
+            "description": "The size of the router instance: "
+            + ", ".join(
+                f'"{name}" is a {type}' for name, type in router_profiles.items()
+            )
+            + f". Use {list(router_profiles)[-1]} for sustained bulk transfers. Changing "
+            "this restarts the router",
+            "allowed_values": list(router_profiles.keys()),
+            "default": DEFAULT_ROUTER_PROFILE,
+        },
+        "RouterPackageUpgrade": {
+            "id": "RouterPackageUpgrade",
+            "type": "String",
+            "description": "Whether to upgrade the router's packages on first boot, which delays "
+            "routing by several minutes",
+            "allowed_values": ["false", "true"],
+            "default": "false",
+        },
+        "RouterImage": {
+            "id": "RouterImage",
+            "type": "String",
+            "description": '"stock" Ubuntu, or an image "baked" with the router\'s packages by '
+            "EC2 Image Builder (adds around 30 minutes to stack creation), so a replacement "
+            "router starts routing within seconds",
+            "allowed_values": ["stock", "baked"],
+            "default": "stock",
+        },
+        "ECMPMode": {
+            "id": "ECMPMode",
+            "type": "String",
+            "description": "Whether to balance flows across every tunnel with the lowest OSPF "
+            "cost, rather than using just one",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "DynamicOSPFCost": {
+            "id": "DynamicOSPFCost",
+            "type": "String",
+            "description": "Whether to add each tunnel's measured round trip time and loss to its "
+            "OSPF cost",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "RouterHighAvailability": {
+            "id": "RouterHighAvailability",
+            "type": "String",
+            "description": "Whether to run a standby router which takes over the VPC's mesh "
+            "routes and WireGuard tunnels if the active one fails. Set when the stack is created",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "MeshRouteFiltering": {
+            "id": "MeshRouteFiltering",
+            "type": "String",
+            "description": '"full" installs every mesh OSPF route. "aggregate" only installs the '
+            "mesh's aggregate CIDRs, keeping the router's memory use flat as the mesh grows",
+            "allowed_values": ["full", "aggregate"],
+            "default": "full",
+        },
+        "EgressAccounting": {
+            "id": "EgressAccounting",
+            "type": "String",
+            "description": "Whether to publish the top talkers to the mesh (which AWS charges "
+            "for) to the /MeshVPC/RouterEgressSummary SSM parameter",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "RouterDNSResolver": {
+            "id": "RouterDNSResolver",
+            "type": "String",
+            "description": "Whether the router runs a caching DNS resolver for the VPC, which "
+            "forwards mesh zones (e.g. .mesh) to the mesh's resolvers",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "ForwardingFastPath": {
+            "id": "ForwardingFastPath",
+            "type": "String",
+            "description": '"notrack" skips connection tracking for forwarded traffic. '
+            '"flowtable" also forwards established flows in a fast path. Both only forward '
+            "between the mesh and the VPC",
+            "allowed_values": ["disabled", "notrack", "flowtable"],
+            "default": "disabled",
+        },
+        "VPCSideMTU": {
+            "id": "VPCSideMTU",
+            "type": "String",
+            "description": "The MTU of the router's VPC-facing interface. Use 1500 if VPC hosts "
+            "send the mesh traffic which can't be MSS clamped, without path MTU discovery",
+            "allowed_values": VPC_MTUS,
+            "default": VPC_MTUS[0],
+        },
+        "TunnelBFD": {
+            "id": "TunnelBFD",
+            "type": "String",
+            "description": "Whether to run BFD over each tunnel, to fail over within a second. The "
+            "mesh side must run BFD too",
+            "allowed_values": ["disabled", "enabled"],
+            "default": "disabled",
+        },
+        "TunnelOSPFHello": {
+            "id": "TunnelOSPFHello",
+            "type": "String",
+            "default": "10",
+            "allowed_pattern": OSPF_HELLO_INTERVAL_REGEX,
+            "constraint_description": f"Must be from 1 to {MAX_OSPF_HELLO_INTERVAL}",
+            "max_length": MAX_OSPF_HELLO_INTERVAL_LENGTH,
+            "description": "The OSPF hello interval in seconds on every tunnel. This must match "
+            "the mesh side of the tunnels",
+        },
+        "TunnelOSPFDead": {
+            "id": "TunnelOSPFDead",
+            "type": "String",
+            "default": "40",
+            "allowed_pattern": OSPF_DEAD_INTERVAL_REGEX,
+            "constraint_description": "Must be from 2 to 65535, and longer than the hello "
+            "interval",
+            "max_length": MAX_PORT_NUMBER_LENGTH,
+            "description": "The OSPF dead interval in seconds on every tunnel. This must match "
+            "the mesh side of the tunnels",
+        },
+    }
+
+
+def _optional_if_not_first(pattern: str, tunnel_num: int) -> str:
+    return pattern if tunnel_num == 0 else pattern + SUFFIX_TO_INDICATE_OPTIONAL
+
+
+def _described_if_first(description: str, tunnel_num: int):
+    # The optional tunnels' parameters are only labelled (see get_interface_metadata()), since
+    # repeating the first tunnel's descriptions for each would push the template past the
+    # direct upload limit
+    return description if tunnel_num == 0 else None
+
+
+def get_wireguard_parameter_specs(tunnel_num: int) -> dict:
+    i = tunnel_num
+    return {
+        "ServerIP": {
+            "id": f"WireguardServer{i + 1}IP",
+            "type": "String",
+            "description": _described_if_first(
+                "The public IP address of the mesh-side wireguard endpoint to connect to",
+                i,
+            ),
+            "default": SN3_VPN_SERVER_IP if i == 0 else None,
+            "allowed_pattern": _optional_if_not_first(IPV4_ADDR_REGEX, i),
+            "max_length": MAX_IPV4_ADDR_LENGTH,
+        },
+        "ServerPort": {
+            "id": f"WireguardServer{i + 1}Port",
+            "type": "String",
+            "description": _described_if_first(
+                "The port that the IP specified above is listening for our connection on",
+                i,
+            ),
+            "allowed_pattern": _optional_if_not_first(PORT_NUMBER_REGEX, i),
+            "max_length": MAX_PORT_NUMBER_LENGTH,
+        },
+        "ServerPublicKey": {
+            "id": f"WireguardServer{i + 1}PublicKey",
+            "type": "String",
+            "description": _described_if_first(
+                "The public key of the mesh-side wireguard server", i
+            ),
+            "default": SN3_VPN_SERVER_PUBLIC_KEY if i == 0 else None,
+            "allowed_pattern": _optional_if_not_first(WG_KEY_REGEX, i),
+            "max_length": WG_KEY_LENGTH,
+        },
+        "p2pIPAddressMeshSide": {
+            "id": f"p2pIPAddress{i + 1}MeshSide",
+            "type": "String",
+            "description": _described_if_first(
+                "The adjacent router IP for the router instance to use as its OSPF "
+                "neighbor. This should probably be the mesh-side of the P2P CIDR for your "
+                "tunnel",
+                i,
+            ),
+            "allowed_pattern": _optional_if_not_first(IPV4_ADDR_REGEX, i),
+            "max_length": MAX_IPV4_ADDR_LENGTH,
+        },
+        "p2pIPAddressAWSSide": {
+            "id": f"p2pIPAddress{i + 1}AWSSide",
+            "type": "String",
+            "description": _described_if_first(
+                "The AWS-side IP of the P2P CIDR for your tunnel "
+                "(also used as the router's OSPF identity)",
+                i,
+            ),
+            "allowed_pattern": _optional_if_not_first(IPV4_ADDR_REGEX, i),
+            "max_length": MAX_IPV4_ADDR_LENGTH,
+        },
+        "LinkOSPFCost": {
+            "id": f"LinkOSFPCost{i + 1}",
+            "type": "String",
+            "default": "10" if i == 0 else None,
+            "allowed_pattern": _optional_if_not_first(PORT_NUMBER_REGEX, i),
+            "max_length": MAX_PORT_NUMBER_LENGTH,
+            "description": _described_if_first(
+                "The OSPF cost to use for this WG tunnel", i
+            ),
+        },
+        "LinkMTU": {
+            "id": f"LinkMTU{i + 1}",
+            "type": "String",
+            "default": DEFAULT_WG_TUNNEL_MTU,
+            "allowed_pattern": WG_TUNNEL_MTU_REGEX,
+            "constraint_description": "Must be from 576 to 1420",
+            "max_length": MAX_PORT_NUMBER_LENGTH,
+            "description": _described_if_first(
+                "The MTU of this WG tunnel. This should be the path MTU to the WireGuard "
+                "server, minus 80 bytes of WireGuard overhead",
+                i,
+            ),
+        },
+    }
+
+
+def get_interface_metadata(max_wg_tunnels: int) -> dict:
+    wg_parameter_groups = [
+        {
+            "Label": {
+                "default": f"WireGuard Connection {i + 1} Details{' (Optional)' if i > 0 else ''}"
+            },
+            "Parameters": [
+                spec["id"] for spec in get_wireguard_parameter_specs(i).values()
+            ],
+        }
+        for i in range(max_wg_tunnels)
+    ]
+
+    wg_parameter_labels = dict(
+        ChainMap(
+            *[
+                {
+                    f"p2pIPAddress{i + 1}MeshSide": {
+                        "default": f"WG tunnel {i + 1} P2P Address (Mesh Side)"
+                    },
+                    f"p2pIPAddress{i + 1}AWSSide": {
+                        "default": f"WG tunnel {i + 1} P2P Address (AWS Side)"
+                    },
+                    f"WireguardServer{i + 1}IP": {
+                        "default": f"Mesh WireGuard server {i + 1} Public IP"
+                    },
+                    f"WireguardServer{i + 1}Port": {
+                        "default": f"Mesh WireGuard server {i + 1} port"
+                    },
+                    f"WireguardServer{i + 1}PublicKey": {
+                        "default": f"Mesh WireGuard Server {i + 1} Public Key"
+                    },
+                    f"LinkOSFPCost{i + 1}": {"default": f"WG Tunnel {i + 1} OSPF Cost"},
+                    f"LinkMTU{i + 1}": {"default": f"WG Tunnel {i + 1} MTU"},
+                }
+                for i in range(max_wg_tunnels)
+            ]
+        )
+    )
+
+    return {
+        "AWS::CloudFormation::Interface": {
+            "ParameterGroups": [
+                {
+                    "Label": {"default": "IP Addresses"},
+                    "Parameters": [
+                        "MeshCIDR",
+                        "MeshSubnetLayout",
+                        "MeshSubnetPrefixLength",
+                        "TransitGatewaySpokeCIDR",
+                    ],
+                },
+                *wg_parameter_groups,
+                {
+                    "Label": {"default": "Router Instance Config"},
+                    "Parameters": [
+                        "RouterInstanceSSHPublicKeyMaterial",
+                        "RouterProfile",
+                        "RouterPackageUpgrade",
+                        "RouterImage",
+                        "RouterHighAvailability",
+                        "ECMPMode",
+                        "DynamicOSPFCost",
+                        "TunnelBFD",
+                        "TunnelOSPFHello",
+                        "TunnelOSPFDead",
+                        "VPCSideMTU",
+                        "ForwardingFastPath",
+                        "MeshRouteFiltering",
+                        "RouterDNSResolver",
+                        "EgressAccounting",
+                    ],
+                },
+            ],
+            "ParameterLabels": {
+                "MeshCIDR": {"default": "Mesh CIDR range to use for VPC"},
+                "MeshSubnetLayout": {"default": "Subnet Layout"},
+                "MeshSubnetPrefixLength": {"default": "Multi-AZ Subnet Prefix Length"},
+                "TransitGatewaySpokeCIDR": {
+                    "default": "Spoke VPCs CIDR (Transit Gateway Hub)"
+                },
+                **wg_parameter_labels,
+                "RouterInstanceSSHPublicKeyMaterial": {
+                    "default": "Public Key for SSH Access to the Router Instance"
+                },
+                "RouterProfile": {"default": "Router Profile (Instance Size)"},
+                "RouterPackageUpgrade": {
+                    "default": "Upgrade Packages on the Router's First Boot"
+                },
+                "RouterImage": {"default": "Router Image"},
+                "RouterHighAvailability": {"default": "Standby Router for Failover"},
+                "ECMPMode": {"default": "Equal-Cost Multipath (ECMP) Across Tunnels"},
+                "DynamicOSPFCost": {"default": "Adjust OSPF Costs from Tunnel Latency"},
+                "TunnelBFD": {"default": "BFD Over Each Tunnel"},
+                "TunnelOSPFHello": {"default": "Tunnel OSPF Hello Interval"},
+                "TunnelOSPFDead": {"default": "Tunnel OSPF Dead Interval"},
+                "VPCSideMTU": {"default": "VPC-Side MTU"},
+                "ForwardingFastPath": {"default": "Forwarding Fast Path"},
+                "MeshRouteFiltering": {"default": "Mesh Route Filtering"},
+                "RouterDNSResolver": {"default": "Caching DNS Resolver on the Router"},
+                "EgressAccounting": {
+                    "default": "Egress Accounting by Source and Prefix"
+                },
+            },
+        }
+    }
+
+
+def get_spoke_parameter_specs() -> dict:
+    """
+    The parameters of the spoke VPC stack (see spoke_vpc_stack.py)
+    """
+    core_specs = get_core_parameter_specs()
+    return {
+        "MeshCIDR": {
+            **core_specs["MeshCIDR"],
+            "description": "Enter the mesh IP-space CIDR to use to create the spoke VPC. This "
+            "must be a real mesh IP CIDR that is allocated exclusively for this purpose, and "
+            "inside the hub stack's TransitGatewaySpokeCIDR",
+        },
+        "MeshSubnetLayout": {
+            **core_specs["MeshSubnetLayout"],
+            "description": 'How the mesh CIDR is divided into subnets. "single" uses one subnet '
+            'spanning the whole mesh CIDR, in one availability zone. "multi-az" creates '
+            f"{MULTI_AZ_SUBNETS} subnets (of the size below) in different availability zones. "
+            "This must be set when the stack is created",
+        },
+        "MeshSubnetPrefixLength": core_specs["MeshSubnetPrefixLength"],
+        "TransitGatewayId": {
+            "id": "TransitGatewayId",
+            "type": "AWS::SSM::Parameter::Value<String>",
+            "description": "The SSM parameter holding the ID of the hub stack's transit "
+            "gateway. The hub stack publishes this in its own account and region",
+            "default": TRANSIT_GATEWAY_ID_PARAMETER_NAME,
+        },
+        "TransitGatewayRouteTableId": {
+            "id": "TransitGatewayRouteTableId",
+            "type": "AWS::SSM::Parameter::Value<String>",
+            "description": "The SSM parameter holding the ID of the hub stack's transit "
+            "gateway route table",
+            "default": TRANSIT_GATEWAY_ROUTE_TABLE_ID_PARAMETER_NAME,
+        },
+    }
+
+
+def get_spoke_interface_metadata() -> dict:
+    return {
+        "AWS::CloudFormation::Interface": {
+            "ParameterGroups": [
+                {
+                    "Label": {"default": "IP Addresses"},
+                    "Parameters": [
+                        "MeshCIDR",
+                        "MeshSubnetLayout",
+                        "MeshSubnetPrefixLength",
+                    ],
+                },
+                {
+                    "Label": {"default": "Hub Stack"},
+                    "Parameters": ["TransitGatewayId", "TransitGatewayRouteTableId"],
+                },
+            ],
+            "ParameterLabels": {
+                "MeshCIDR": {"default": "Mesh CIDR range to use for VPC"},
+                "MeshSubnetLayout": {"default": "Subnet Layout"},
+                "MeshSubnetPrefixLength": {"default": "Multi-AZ Subnet Prefix Length"},
+                "TransitGatewayId": {"default": "Transit Gateway ID Parameter"},
+                "TransitGatewayRouteTableId": {
+                    "default": "Transit Gateway Route Table ID Parameter"
+                },
+            },
+        }
+    }
@@ -0,0 +1,151 @@
+import json
+import os
+
+from mesh_vpccdk.budget import check_template_budget
+from mesh_vpccdk.cloud_config import get_published_router_files_location
+from mesh_vpccdk.router_config import get_router_files_variables
+
+# Set this environment variable (to anything but "" or "0") to write the clean templates without
+# any whitespace, which keeps them small enough to upload directly in the console for longer
+MINIFY_ENV_VAR = "MESH_VPC_MINIFY_TEMPLATE"
+
+# The passes clean_template() runs over the synthesized template, in the order they were
+# registered. Each takes the template dict, and returns it (modified in place or replaced)
+POSTPROCESS_PASSES = []
+
+
+def minify_enabled() -> bool:
+    return os.environ.get(MINIFY_ENV_VAR, "") not in ("", "0")
+
+
+def postprocess_pass(function):
+    """
+    Registers function as a post-processing pass
+    """
+    POSTPROCESS_PASSES.append(function)
+    return function
+
+
+def _replace_refs(value, replacements: dict):
+    if isinstance(value, dict):
+        if set(value.keys()) == {"Ref"} and value["Ref"] in replacements:
+            return replacements[value["Ref"]]
+        return {k: _replace_refs(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_refs(v, replacements) for v in value]
+    return value
+
+
+def _replace_sub_variables(value, replacements: dict):
+    if isinstance(value, dict):
+        if set(value.keys()) == {"Fn::Sub"} and isinstance(value["Fn::Sub"], list):
+            body, variables = value["Fn::Sub"]
+            return {
+                "Fn::Sub": [
+                    body,
+                    {
+                        name: replacements.get(
+                            name, _replace_sub_variables(v, replacements)
+                        )
+                        for name, v in variables.items()
+                    },
+                ]
+            }
+        return {k: _replace_sub_variables(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_sub_variables(v, replacements) for v in value]
+    return value
+
+
+@postprocess_pass
+def remove_bootstrap_rule(template_json: dict) -> dict:
+    """
+    Removes the rule checking the CDK bootstrap version, since the template isn't deployed via
+    a bootstrapped CDK environment
+    """
+    rules = template_json.get("Rules", {})
+    rules.pop("CheckBootstrapVersion", None)
+    if not rules:
+        template_json.pop("Rules", None)
+    template_json.get("Parameters", {}).pop("BootstrapVersion", None)
+    return template_json
+
+
+@postprocess_pass
+def resolve_ssm_parameters(template_json: dict) -> dict:
+    """
+    CDK reads SSM parameters (e.g. the stock router AMI) via template parameters, which would
+    show up in the console. Replaces each reference with an equivalent dynamic reference, and
+    removes the parameters
+    """
+    ssm_parameter_values = {
+        parameter: f"{{{{resolve:ssm:{spec['Default']}}}}}"
+        for parameter, spec in template_json.get("Parameters", {}).items()
+        if parameter.startswith("SsmParameter")
+    }
+    template_json["Resources"] = _replace_refs(
+        template_json["Resources"], ssm_parameter_values
+    )
+
+    for parameter in ssm_parameter_values:
+        del template_json["Parameters"][parameter]
+
+    return template_json
+
+
+@postprocess_pass
+def use_published_router_files(template_json: dict) -> dict:
+    """
+    Points the routers at the router files bundle upload.py publishes, in place of the CDK
+    asset, which is only uploaded (to the CDK bootstrap bucket) by `cdk deploy`
+    """
+    template_json["Resources"] = _replace_sub_variables(
+        template_json["Resources"],
+        get_router_files_variables(get_published_router_files_location()),
+    )
+    return template_json
+
+
+def clean_template(template_json: dict, passes: list = None) -> dict:
+    """
+    Post process the synthesized template to remove CDK specific stuff, since we're vending
+    this as a CloudFormation template. Runs each of passes (by default, every registered pass)
+    over template_json, which may be modified in place, and returns the result
+    """
+    for postprocess in POSTPROCESS_PASSES if passes is None else passes:
+        template_json = postprocess(template_json)
+
+    return template_json
+
+
+def serialize_template(template_json: dict, minify: bool = False) -> str:
+    if minify:
+        return json.dumps(template_json, separators=(",", ":"))
+    return json.dumps(template_json, indent=2)
+
+
+def write_clean_template(
+    template_json: dict,
+    output_path: str,
+    minify: bool = None,
+    direct_upload: bool = False,
+) -> str:
+    """
+    Atomically writes the cleaned template to output_path, after checking it fits within the
+    deployment limits (including the direct upload limit, if direct_upload is True). Returns the
+    budget report (see budget.check_template_budget()). The template is minified if minify is
+    True, or if it's None and MINIFY_ENV_VAR is set
+    """
+    if minify is None:
+        minify = minify_enabled()
+    template_str = serialize_template(template_json, minify)
+    report = check_template_budget(template_json, template_str, direct_upload)
+
+    # Written alongside and renamed into place, so anything watching the template (e.g. during
+    # cdk watch, see synth_server.py) never reads a partly written one
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, "w") as of:
+        of.write(template_str)
+    os.replace(temporary_path, output_path)
+
+    return report
@@ -0,0 +1,88 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+# Set this environment variable (to anything but "" or "0") to have app.py write a cProfile
+# report and per-stage timings next to the synthesized templates
+PROFILE_ENV_VAR = "MESH_VPC_PROFILE"
+
+PROFILE_REPORT_FILENAME = "synth-profile.txt"
+PROFILE_STATS_FILENAME = "synth-profile.pstats"
+TIMINGS_FILENAME = "synth-timings.json"
+
+
+def profiling_enabled() -> bool:
+    return os.environ.get(PROFILE_ENV_VAR, "") not in ("", "0")
+
+
+class StageTimer:
+    """
+    Records the wall-clock duration of each named stage of a build, in the order they ran
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+    def format(self) -> str:
+        width = max([len(name) for name in self.timings] + [len("total")])
+        lines = [
+            f"{name.ljust(width)}  {seconds * 1000:10.1f}ms"
+            for name, seconds in [*self.timings.items(), ("total", self.total())]
+        ]
+        return "\n".join(lines)
+
+
+def write_profile_report(outdir: str, profile: cProfile.Profile, timer: StageTimer):
+    os.makedirs(outdir, exist_ok=True)
+
+    profile.dump_stats(os.path.join(outdir, PROFILE_STATS_FILENAME))
+
+    report = io.StringIO()
+    report.write(timer.format() + "\n\n")
+    pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(50)
+    with open(os.path.join(outdir, PROFILE_REPORT_FILENAME), "w") as f:
+        f.write(report.getvalue())
+
+    with open(os.path.join(outdir, TIMINGS_FILENAME), "w") as f:
+        json.dump(
+            {name: round(seconds, 6) for name, seconds in timer.timings.items()},
+            f,
+            indent=2,
+        )
+
+
+@contextmanager
+def maybe_profile(outdir: str, timer: StageTimer, enabled: bool = None):
+    """
+    Runs the body under cProfile if profiling is enabled, writing the report and the stage
+    timings collected by timer into outdir afterwards
+    """
+    if enabled is None:
+        enabled = profiling_enabled()
+
+    if not enabled:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        write_profile_report(outdir, profile, timer)
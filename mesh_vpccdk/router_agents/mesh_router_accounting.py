@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Accounts for the router's egress to the mesh (the traffic AWS bills for) by VPC source and mesh
+destination prefix, so heavy talkers can be found without VPC Flow Logs. Nothing is logged per
+packet: mesh-router-config adds an nftables rule which counts the bytes forwarded from the VPC
+into the tunnels, in a dynamic set keyed by source and destination address. Every poll interval
+this reads the set's counters, rolls the destinations up into prefixes of --prefix-length, and
+adds the bytes since the last poll into a rollup store.
+
+The store is a ring of --buckets time buckets of --bucket-seconds each (a day of hours, by
+default), each holding at most --max-pairs (source, prefix) pairs. When a bucket is full, its
+smallest pairs are folded into its "other" total, so the store's size is fixed however many
+hosts talk. It's saved to ROLLUP_PATH after every poll, so history survives restarts. Every
+summary interval, the top talkers over the last summary interval are printed (to the journal)
+and published to the /MeshVPC/RouterEgressSummary SSM parameter. Run
+
+    mesh-router-accounting summary --window 86400
+
+on the router to see the top talkers over any window the store covers.
+
+Installed to /usr/local/bin/mesh-router-accounting by mesh-router-boot, and run by
+mesh-router-accounting.service, which mesh-router-config enables when the stack's
+EgressAccounting parameter is "enabled".
+
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Must match mesh_router_config.py
+NFTABLES_TABLE = ["inet", "mesh_vpc"]
+ACCOUNTING_SET = "egress_accounting"
+
+ROLLUP_PATH = "/var/lib/mesh-vpc/egress-rollup.json"
+DEFAULT_SUMMARY_PARAMETER = "/MeshVPC/RouterEgressSummary"
+
+# The largest value a standard SSM parameter holds
+MAX_SUMMARY_BYTES = 4096
+
+
+class AccountingError(Exception):
+    pass
+
+
+def read_counters():
+    """
+    Returns a dict of each (source, destination) address pair in the accounting set to its
+    byte count
+    """
+    result = subprocess.run(
+        ["nft", "-j", "list", "set", *NFTABLES_TABLE, ACCOUNTING_SET],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode != 0:
+        raise AccountingError(
+            f"Couldn't read {ACCOUNTING_SET}: {result.stderr.strip()}"
+        )
+    return parse_counters(result.stdout)
+
+
+def parse_counters(output):
+    counters = {}
+    for item in json.loads(output)["nftables"]:
+        for element in item.get("set", {}).get("elem", []):
+            # Elements with a counter are wrapped in an "elem" object
+            element = element.get("elem", element) if isinstance(element, dict) else {}
+            source, destination = element.get("val", {}).get("concat", [None, None])
+            if source and destination:
+                counters[(source, destination)] = element.get("counter", {}).get(
+                    "bytes", 0
+                )
+    return counters
+
+
+class CounterDeltas:
+    """
+    Turns successive readings of the set's cumulative counters into the bytes sent since the
+    previous reading. The first reading only records a baseline
+    """
+
+    def __init__(self):
+        self.previous = None
+
+    def update(self, counters):
+        previous, self.previous = self.previous, counters
+        if previous is None:
+            return {}
+        # A counter which went backwards was reset, by the set being reloaded or the element
+        # expiring and being recreated, so it has counted from zero since
+        return {
+            key: (
+                count - previous.get(key, 0) if count >= previous.get(key, 0) else count
+            )
+            for key, count in counters.items()
+            if count != previous.get(key, 0)
+        }
+
+
+def roll_up(deltas, prefix_length):
+    """
+    Sums the bytes sent from each source to each destination prefix
+    """
+    pairs = {}
+    for (source, destination), count in deltas.items():
+        prefix = ipaddress.ip_network(f"{destination}/{prefix_length}", strict=False)
+        key = f"{source} {prefix}"
+        pairs[key] = pairs.get(key, 0) + count
+    return pairs
+
+
+class RollupStore:
+    """
+    Byte counts by "source prefix" pair, in a ring of fixed-length time buckets, each holding
+    at most max_pairs pairs
+    """
+
+    def __init__(self, bucket_seconds, bucket_count, max_pairs, buckets=None):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.max_pairs = max_pairs
+        self.buckets = [None] * bucket_count
+        # Buckets from a store with different dimensions are dropped rather than reinterpreted
+        if buckets and len(buckets) == bucket_count:
+            self.buckets = buckets
+
+    def bucket(self, now):
+        start = int(now) // self.bucket_seconds * self.bucket_seconds
+        index = start // self.bucket_seconds % self.bucket_count
+        if self.buckets[index] is None or self.buckets[index]["start"] != start:
+            # Reusing the slot of the oldest bucket keeps the ring's size fixed
+            self.buckets[index] = {"start": start, "pairs": {}, "other": 0}
+        return self.buckets[index]
+
+    def add(self, now, pairs):
+        bucket = self.bucket(now)
+        for key, count in pairs.items():
+            bucket["pairs"][key] = bucket["pairs"].get(key, 0) + count
+
+        if len(bucket["pairs"]) > self.max_pairs:
+            ranked = sorted(bucket["pairs"].items(), key=lambda item: -item[1])
+            bucket["pairs"] = dict(ranked[: self.max_pairs])
+            bucket["other"] += sum(count for _, count in ranked[self.max_pairs :])
+
+    def summarize(self, now, window_seconds, top):
+        """
+        Returns the total bytes, and the top sources, destination prefixes and pairs, over the
+        buckets which overlap the last window_seconds
+        """
+        since = int(now) - window_seconds
+        pairs = {}
+        other = 0
+        for bucket in self.buckets:
+            if bucket is None or bucket["start"] + self.bucket_seconds <= since:
+                continue
+            for key, count in bucket["pairs"].items():
+                pairs[key] = pairs.get(key, 0) + count
+            other += bucket["other"]
+
+        sources = {}
+        destinations = {}
+        for key, count in pairs.items():
+            source, destination = key.split(" ")
+            sources[source] = sources.get(source, 0) + count
+            destinations[destination] = destinations.get(destination, 0) + count
+
+        def ranked(counts):
+            largest = sorted(counts.items(), key=lambda item: -item[1])[:top]
+            return [[key, count] for key, count in largest]
+
+        return {
+            "window": window_seconds,
+            "total_bytes": sum(pairs.values()) + other,
+            "other_bytes": other,
+            "sources": ranked(sources),
+            "destinations": ranked(destinations),
+            "pairs": ranked(pairs),
+        }
+
+    def to_json(self):
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "max_pairs": self.max_pairs,
+            "buckets": self.buckets,
+        }
+
+    @classmethod
+    def load(cls, path, bucket_seconds, bucket_count, max_pairs):
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        if state.get("bucket_seconds") != bucket_seconds:
+            state = {}
+        return cls(bucket_seconds, bucket_count, max_pairs, state.get("buckets"))
+
+    def save(self, path):
+        # Written to a temporary file and renamed into place, so a crash never leaves a
+        # partially written store
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".mesh-router-accounting"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.to_json(), f, separators=(",", ":"))
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def format_summary(summary):
+    lines = [
+        f"Egress over the last {summary['window']}s: {summary['total_bytes']:,} bytes "
+        f"({summary['other_bytes']:,} not attributed)"
+    ]
+    for title in ["sources", "destinations", "pairs"]:
+        lines.append(f"Top {title}:")
+        lines += [f"  {key}: {count:,} bytes" for key, count in summary[title]]
+    return "\n".join(lines)
+
+
+def publish_summary(parameter, summary):
+    # The lists are shortened until the summary fits in the parameter
+    while True:
+        value = json.dumps(summary, separators=(",", ":"))
+        if len(value) <= MAX_SUMMARY_BYTES or not summary["pairs"]:
+            break
+        for title in ["sources", "destinations", "pairs"]:
+            summary[title] = summary[title][:-1]
+
+    result = subprocess.run(
+        [
+            "aws",
+            "ssm",
+            "put-parameter",
+            "--name",
+            parameter,
+            "--description",
+            "The router's top egress talkers to the mesh, by VPC source and mesh prefix",
+            "--type",
+            "String",
+            "--overwrite",
+            "--value",
+            value,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode != 0:
+        raise AccountingError(f"put-parameter failed: {result.stderr.strip()}")
+
+
+def run(args):
+    store = RollupStore.load(
+        args.store, args.bucket_seconds, args.buckets, args.max_pairs
+    )
+    deltas = CounterDeltas()
+    last_summary = time.monotonic()
+    while True:
+        try:
+            counters = read_counters()
+        except AccountingError as e:
+            # e.g. mesh-router-config hasn't loaded the rules yet
+            print(e, file=sys.stderr)
+        else:
+            now = time.time()
+            store.add(now, roll_up(deltas.update(counters), args.prefix_length))
+            store.save(args.store)
+
+            if time.monotonic() - last_summary >= args.summary_interval:
+                last_summary = time.monotonic()
+                summary = store.summarize(now, int(args.summary_interval), args.top)
+                print(format_summary(summary))
+                # The standby router of a high availability pair forwards nothing, so it
+                # doesn't overwrite the active router's summary
+                if summary["total_bytes"] and not args.no_publish:
+                    try:
+                        publish_summary(args.parameter, summary)
+                    except AccountingError as e:
+                        print(f"Couldn't publish summary: {e}", file=sys.stderr)
+
+        time.sleep(args.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Account for egress to the mesh by VPC source and mesh prefix"
+    )
+    parser.add_argument("--store", default=ROLLUP_PATH)
+    parser.add_argument(
+        "--bucket-seconds",
+        type=int,
+        default=3600,
+        help="The length of each bucket in the rollup store",
+    )
+    parser.add_argument(
+        "--buckets", type=int, default=24, help="The number of buckets kept"
+    )
+    parser.add_argument(
+        "--max-pairs",
+        type=int,
+        default=512,
+        help="The most (source, destination prefix) pairs kept in each bucket",
+    )
+    parser.add_argument("--top", type=int, default=10)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument(
+        "--interval",
+        type=float,
+        default=60,
+        help="Seconds between polls of the counters",
+    )
+    run_parser.add_argument(
+        "--prefix-length",
+        type=int,
+        default=24,
+        help="The length of the mesh prefixes destinations are rolled up into",
+    )
+    run_parser.add_argument(
+        "--summary-interval",
+        type=float,
+        default=3600,
+        help="Seconds between summaries of the top talkers",
+    )
+    run_parser.add_argument("--parameter", default=DEFAULT_SUMMARY_PARAMETER)
+    run_parser.add_argument(
+        "--no-publish",
+        action="store_true",
+        help="Print summaries without publishing them to SSM",
+    )
+
+    summary_parser = subparsers.add_parser("summary")
+    summary_parser.add_argument(
+        "--window",
+        type=int,
+        default=3600,
+        help="Summarize the last this many seconds (rounded out to whole buckets)",
+    )
+    summary_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(args)
+        return 0
+
+    store = RollupStore.load(
+        args.store, args.bucket_seconds, args.buckets, args.max_pairs
+    )
+    summary = store.summarize(time.time(), args.window, args.top)
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
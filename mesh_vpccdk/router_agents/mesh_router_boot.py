@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Gates each step of the router's first boot on real readiness signals (rather than fixed sleeps),
+and records how long after kernel boot each phase was reached. The timings are logged to
+/var/log/mesh-router-boot.log and published to SSM parameter store, so the time it takes each
+router launch to start routing can be tracked.
+
+Installed to /usr/local/bin/mesh-router-boot by mesh-router-fetch, and called from
+mesh-router-first-boot:
+
+    mesh-router-boot wait <check>     Wait for a readiness check to pass, and record it as a phase
+    mesh-router-boot mark <phase>     Record a phase as reached now
+    mesh-router-boot publish          Publish the phases recorded so far
+    mesh-router-boot role             Record this router's role from its instance tag
+    mesh-router-boot zone             Record the availability zone this router serves, likewise
+
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import urllib.request
+
+STATE_PATH = "/var/lib/mesh-vpc/boot-phases.json"
+LOG_PATH = "/var/log/mesh-router-boot.log"
+AGENT_ENV_PATH = "/etc/mesh-vpc/agent.env"
+DEFAULT_TIMINGS_PARAMETER = "/MeshVPC/RouterBootTimings"
+ROLE_PATH = "/var/lib/mesh-vpc/router-role"
+ZONE_PATH = "/var/lib/mesh-vpc/router-zone"
+
+IMDS_URL = "http://169.254.169.254/latest"
+
+# Must match ROUTER_ROLE_TAG and ROUTER_ZONE_TAG in constants.py
+ROUTER_ROLE_TAG = "MeshRouterRole"
+ROUTER_ZONE_TAG = "MeshRouterZone"
+
+REQUIRED_COMMANDS = ["bird", "birdc", "wg", "aws", "netplan", "nft"]
+
+
+def uptime():
+    with open("/proc/uptime", "r") as f:
+        return float(f.read().split()[0])
+
+
+def run(command):
+    try:
+        return subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+    except OSError:
+        # A command which isn't installed yet just means that check isn't ready
+        return subprocess.CompletedProcess(command, 127, stdout="")
+
+
+def load_agent_env():
+    # runcmd doesn't get the environment the systemd units load, so read it ourselves
+    try:
+        with open(AGENT_ENV_PATH, "r") as f:
+            for line in f:
+                key, _, value = line.strip().partition("=")
+                if key and not key.startswith("#"):
+                    os.environ.setdefault(key, value)
+    except FileNotFoundError:
+        pass
+
+
+def load_state():
+    try:
+        with open(STATE_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"phases": {}}
+
+
+def record_phase(phase):
+    state = load_state()
+    state["phases"][phase] = round(uptime(), 2)
+
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH, "w") as f:
+        json.dump(state, f)
+    with open(LOG_PATH, "a") as f:
+        f.write(f"{state['phases'][phase]:10.2f}s {phase}\n")
+
+    return state
+
+
+def packages_installed():
+    if any(shutil.which(command) is None for command in REQUIRED_COMMANDS):
+        return False
+    # Make sure nothing (e.g. unattended-upgrades) is still holding the dpkg lock
+    return run(["fuser", "/var/lib/dpkg/lock-frontend"]).returncode != 0
+
+
+def default_route():
+    return "dev ens5" in run(["ip", "route", "show", "default"]).stdout
+
+
+def router_config():
+    # mesh-router-config fails until SSM is reachable and the instance profile credentials are
+    # available, so retrying it is the readiness check
+    return run(["systemctl", "start", "mesh-router-config.service"]).returncode == 0
+
+
+def wireguard_endpoints():
+    output = run(["wg", "show", "all", "endpoints"]).stdout
+    endpoints = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[2] != "(none)":
+            endpoints[fields[0]] = fields[2].rsplit(":", 1)[0]
+    return endpoints
+
+
+def tunnels_up():
+    interfaces = run(["wg", "show", "interfaces"]).stdout.split()
+    if not interfaces:
+        return False
+    for interface in interfaces:
+        link = run(["ip", "-o", "link", "show", interface]).stdout
+        if "state DOWN" in link or not link:
+            return False
+    return True
+
+
+def routes_present():
+    # Each WireGuard server must be routed via the VPC, not into the tunnels themselves
+    endpoints = wireguard_endpoints()
+    if not endpoints:
+        return False
+    return all(
+        "dev ens5" in run(["ip", "route", "get", endpoint]).stdout
+        for endpoint in endpoints.values()
+    )
+
+
+def bird_running():
+    return run(["birdc", "show", "status"]).returncode == 0
+
+
+def first_handshake():
+    output = run(["wg", "show", "all", "latest-handshakes"]).stdout
+    return any(line.split()[-1] != "0" for line in output.splitlines() if line.split())
+
+
+def ospf_full():
+    return "Full" in run(["birdc", "show", "ospf", "neighbors"]).stdout
+
+
+# A standby router (see mesh-router-failover) keeps its tunnels down, so these never pass on it
+TUNNEL_CHECKS = ["tunnels_up", "routes_present", "first_handshake", "ospf_full"]
+
+CHECKS = {
+    "packages_installed": packages_installed,
+    "default_route": default_route,
+    "router_config": router_config,
+    "tunnels_up": tunnels_up,
+    "routes_present": routes_present,
+    "bird_running": bird_running,
+    "first_handshake": first_handshake,
+    "ospf_full": ospf_full,
+}
+
+
+def get_instance_tag(tag):
+    token_request = urllib.request.Request(
+        f"{IMDS_URL}/api/token",
+        method="PUT",
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "60"},
+    )
+    with urllib.request.urlopen(token_request, timeout=2) as response:
+        token = response.read().decode("utf-8")
+
+    request = urllib.request.Request(
+        f"{IMDS_URL}/meta-data/tags/instance/{tag}",
+        headers={"X-aws-ec2-metadata-token": token},
+    )
+    with urllib.request.urlopen(request, timeout=2) as response:
+        return response.read().decode("utf-8").strip()
+
+
+def write_role():
+    # Both routers of a high availability pair boot from the same launch template (and so user
+    # data), so each one's initial role is set by a tag on its instance instead. Later changes
+    # of role are recorded by mesh-router-failover
+    role = get_instance_tag(ROUTER_ROLE_TAG)
+    os.makedirs(os.path.dirname(ROLE_PATH), exist_ok=True)
+    with open(ROLE_PATH, "w") as f:
+        f.write(f"{role}\n")
+    return role
+
+
+def write_zone():
+    # Likewise, the routers of every availability zone share the user data, and each one's zone
+    # (which decides the tunnels mesh-router-config brings up) is set by a tag on its instance
+    zone = get_instance_tag(ROUTER_ZONE_TAG)
+    os.makedirs(os.path.dirname(ZONE_PATH), exist_ok=True)
+    with open(ZONE_PATH, "w") as f:
+        f.write(f"{zone}\n")
+    return zone
+
+
+def is_standby():
+    try:
+        with open(ROLE_PATH, "r") as f:
+            return f.read().strip() == "standby"
+    except FileNotFoundError:
+        return False
+
+
+def wait(check, timeout, interval):
+    if check in TUNNEL_CHECKS and is_standby():
+        record_phase(f"{check}_skipped_on_standby")
+        return True
+
+    deadline = time.monotonic() + timeout
+    while not CHECKS[check]():
+        if time.monotonic() > deadline:
+            record_phase(f"{check}_timed_out")
+            return False
+        time.sleep(interval)
+
+    record_phase(check)
+    return True
+
+
+def publish(parameter):
+    state = load_state()
+    phases = json.dumps(state["phases"], separators=(",", ":"))
+    with open(LOG_PATH, "a") as f:
+        f.write(f"Boot phases: {phases}\n")
+
+    result = run(
+        [
+            "aws",
+            "ssm",
+            "put-parameter",
+            "--name",
+            parameter,
+            "--description",
+            "Seconds after kernel boot that each phase of the router's first boot was reached",
+            "--type",
+            "String",
+            "--overwrite",
+            "--value",
+            phases,
+        ]
+    )
+    return result.returncode == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Gate and time the steps of the router's first boot"
+    )
+    parser.add_argument("--parameter", default=DEFAULT_TIMINGS_PARAMETER)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    wait_parser = subparsers.add_parser("wait")
+    wait_parser.add_argument("check", choices=CHECKS.keys())
+    wait_parser.add_argument("--timeout", type=float, default=300)
+    wait_parser.add_argument("--interval", type=float, default=0.5)
+    wait_parser.add_argument(
+        "--publish",
+        action="store_true",
+        help="Publish the recorded phases once the check passes (or times out)",
+    )
+
+    mark_parser = subparsers.add_parser("mark")
+    mark_parser.add_argument("phase")
+
+    subparsers.add_parser("publish")
+    subparsers.add_parser("role")
+    subparsers.add_parser("zone")
+
+    args = parser.parse_args(argv)
+    load_agent_env()
+
+    if args.command == "role":
+        record_phase(f"role_{write_role()}")
+        return 0
+
+    if args.command == "zone":
+        record_phase(f"zone_{write_zone()}")
+        return 0
+
+    if args.command == "mark":
+        record_phase(args.phase)
+        return 0
+
+    if args.command == "publish":
+        return 0 if publish(args.parameter) else 1
+
+    passed = wait(args.check, args.timeout, args.interval)
+    if args.publish:
+        publish(args.parameter)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+"""
+Renders the router's netplan and bird configuration from the tunnel config that the
+CloudFormation stack publishes to SSM parameter store, and applies any changes in place with
+`netplan apply` and `birdc configure`. This lets tunnel parameters be changed with a stack update,
+without replacing the router instance (and so without re-keying it).
+
+Installed to /usr/local/bin/mesh-router-config by mesh-router-boot, and run periodically by
+mesh-router-config.timer. Runs on the router's stock python3, so must only use the standard
+library.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from string import Template
+
+DEFAULT_CONFIG_PATH = "/MeshVPC/RouterConfig"
+DEFAULT_TEMPLATE_DIR = "/etc/mesh-vpc/templates"
+
+# Written by cloud-init and mesh-router-failover. A standby router keeps its tunnels down
+ROLE_PATH = "/var/lib/mesh-vpc/router-role"
+
+# Written by mesh-router-boot. With the multi-az subnet layout, each availability zone's router
+# only brings up its own share of the tunnels. Must match MULTI_AZ_SUBNETS in constants.py
+ZONE_PATH = "/var/lib/mesh-vpc/router-zone"
+MULTI_AZ_ZONES = 2
+
+BIRD_CONF_PATH = "/etc/bird/bird.conf"
+WIREGUARD_NETPLAN_PATH = "/etc/netplan/71-wireguard-tunnels.yaml"
+STATIC_ROUTES_NETPLAN_PATH = "/etc/netplan/60-static-routes.yaml"
+SYSCTL_PATH = "/etc/sysctl.d/61-mesh-router.conf"
+NFTABLES_PATH = "/etc/mesh-vpc/nftables.conf"
+NFTABLES_TABLE = ["inet", "mesh_vpc"]
+
+# The tunnels mesh-router-cost probes, and the OSPF costs it has chosen for them, when the
+# stack's DynamicOSPFCost parameter is enabled. Both must match mesh_router_cost.py
+OSPF_TUNNELS_PATH = "/var/lib/mesh-vpc/ospf-tunnels.json"
+COST_OVERRIDES_PATH = "/var/lib/mesh-vpc/ospf-costs.json"
+COST_AGENT_SERVICE = "mesh-router-cost.service"
+
+# The caching resolver, run when the stack's RouterDNSResolver parameter is enabled
+UNBOUND_CONF_PATH = "/etc/unbound/unbound.conf.d/mesh-vpc.conf"
+RESOLVER_SERVICE = "unbound.service"
+
+# Run when the stack's EgressAccounting parameter is enabled, to read the accounting set's
+# counters. The set's name must match mesh_router_accounting.py
+ACCOUNTING_AGENT_SERVICE = "mesh-router-accounting.service"
+ACCOUNTING_SET = "egress_accounting"
+
+# A tunnel's MTU must fit WireGuard's encapsulation into the internet path's MTU (see
+# DEFAULT_WG_TUNNEL_MTU in constants.py)
+INTERNET_PATH_MTU = 1500
+WIREGUARD_OVERHEAD = 80
+
+WIREGUARD_NETPLAN_HEADER = """network:
+  version: 2
+  renderer: networkd
+  tunnels:
+"""
+
+STATIC_ROUTES_NETPLAN_HEADER = """network:
+  ethernets:
+    ens5:
+      mtu: ${vpc_mtu}
+      routes:
+"""
+
+
+class RouterConfigError(Exception):
+    pass
+
+
+def fetch_config(config_path):
+    """
+    Reads the global and per-tunnel config parameters under config_path. Tunnels which weren't
+    provided in the stack parameters have no config parameter, so are simply absent
+    """
+    try:
+        output = subprocess.run(
+            [
+                "aws",
+                "ssm",
+                "get-parameters-by-path",
+                "--path",
+                config_path,
+                "--recursive",
+                "--output",
+                "json",
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RouterConfigError(f"Couldn't read {config_path} from SSM: {e}")
+
+    config = {"tunnels": []}
+    for parameter in json.loads(output)["Parameters"]:
+        value = json.loads(parameter["Value"])
+        if parameter["Name"].rstrip("/").endswith("/Global"):
+            config.update(value)
+        elif "/Tunnels/" in parameter["Name"]:
+            config["tunnels"].append(value)
+
+    return config
+
+
+def read_role(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return "active"
+
+
+def read_zone(path):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return 1
+
+
+def tunnel_zone(tunnel, config):
+    # Must match get_tunnel_zone() in router_config.py
+    if config["subnet_layout"] != "multi-az":
+        return 1
+    return (int(tunnel["interface"][len("wg") :]) - 1) % MULTI_AZ_ZONES + 1
+
+
+def select_zone_tunnels(config):
+    """
+    Keeps only the tunnels this router's availability zone (config["zone"]) brings up, so the
+    rest of the config (the OSPF interfaces, the routes to the WireGuard servers, and so on) is
+    rendered for those alone
+    """
+    config["tunnels"] = [
+        tunnel
+        for tunnel in config["tunnels"]
+        if tunnel_zone(tunnel, config) == config["zone"]
+    ]
+    if not config["tunnels"]:
+        raise RouterConfigError(
+            f"Router config has no tunnels in zone {config['zone']}"
+        )
+    # The global router ID is the first tunnel's address, which the other zones' routers
+    # don't have, so each of those uses its own first tunnel's
+    if config["zone"] != 1:
+        config["router_id"] = config["tunnels"][0]["aws_side_ip"]
+
+
+def active_tunnels(config):
+    return [] if config.get("role") == "standby" else config["tunnels"]
+
+
+def load_config_file(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def read_cost_overrides(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def validate_config(config):
+    for key in [
+        "router_id",
+        "vpc_cidr",
+        "subnet_layout",
+        "ospf_hello",
+        "ospf_dead",
+        "tunnels",
+    ]:
+        if key not in config:
+            raise RouterConfigError(f"Router config is missing {key}")
+    if not config["tunnels"]:
+        raise RouterConfigError("Router config has no tunnels")
+    if config["subnet_layout"] not in ("single", "multi-az"):
+        raise RouterConfigError(f"Unknown subnet layout {config['subnet_layout']}")
+
+    for key in [
+        "ecmp",
+        "bfd",
+        "dynamic_ospf_cost",
+        "dns_resolver",
+        "egress_accounting",
+    ]:
+        config.setdefault(key, "disabled")
+        if config[key] not in ("disabled", "enabled"):
+            raise RouterConfigError(f"Unknown {key} mode {config[key]}")
+    config.setdefault("route_filtering", "full")
+    if config["route_filtering"] not in ("full", "aggregate"):
+        raise RouterConfigError(f"Unknown route filtering {config['route_filtering']}")
+    config.setdefault("fast_path", "disabled")
+    if config["fast_path"] not in ("disabled", "notrack", "flowtable"):
+        raise RouterConfigError(f"Unknown fast path mode {config['fast_path']}")
+    if not 0 < int(config["ospf_hello"]) < int(config["ospf_dead"]):
+        raise RouterConfigError(
+            f"OSPF dead interval {config['ospf_dead']} must be longer than the hello "
+            f"interval {config['ospf_hello']}"
+        )
+    # Flows offloaded to the flowtable skip the forward chain, where the accounting counts them
+    if config["egress_accounting"] == "enabled" and config["fast_path"] == "flowtable":
+        raise RouterConfigError(
+            "Egress accounting can't be enabled with the flowtable fast path"
+        )
+    config.setdefault("vpc_mtu", "9001")
+    config.setdefault("spoke_cidr", "")
+
+    for tunnel in config["tunnels"]:
+        if "mtu" not in tunnel:
+            raise RouterConfigError(
+                f"Tunnel config for {tunnel.get('interface')} is missing mtu"
+            )
+        # The tunnels' packets cross the internet, whatever the VPC-side MTU
+        if not 576 <= int(tunnel["mtu"]) <= INTERNET_PATH_MTU - WIREGUARD_OVERHEAD:
+            raise RouterConfigError(
+                f"{tunnel['interface']} MTU {tunnel['mtu']} doesn't fit inside the internet "
+                f"path's MTU of {INTERNET_PATH_MTU} with WireGuard's overhead"
+            )
+
+    config["tunnels"].sort(key=lambda tunnel: int(tunnel["listen_port"]))
+
+
+def read_template(template_dir, name):
+    with open(os.path.join(template_dir, name), "r") as f:
+        return Template(f.read())
+
+
+def yes_no(enabled):
+    return "yes" if enabled == "enabled" else "no"
+
+
+def get_vpc_router_address(config):
+    # The VPC router is always the first host address in the VPC CIDR
+    return ipaddress.ip_network(config["vpc_cidr"], strict=False).network_address + 1
+
+
+def render_bird_conf(config, template_dir):
+    interface_template = read_template(template_dir, "ospf_interface.conf")
+    # With dynamic costs, mesh-router-cost's costs replace the ones from the stack
+    cost_overrides = config.get("cost_overrides", {})
+    interfaces = "\n".join(
+        interface_template.substitute(
+            tunnel,
+            bfd=yes_no(config["bfd"]),
+            ospf_cost=cost_overrides.get(tunnel["interface"], tunnel["ospf_cost"]),
+            ospf_hello=config["ospf_hello"],
+            ospf_dead=config["ospf_dead"],
+        )
+        for tunnel in config["tunnels"]
+    )
+    bfd_protocol = (
+        read_template(template_dir, "bfd.conf").substitute(config)
+        if config["bfd"] == "enabled"
+        else ""
+    )
+    # As a transit gateway hub, the spoke VPCs (which the VPC routes to the transit gateway) are
+    # announced to the mesh along with the VPC itself
+    spoke_protocol = ""
+    if config["spoke_cidr"]:
+        spoke_protocol = (
+            "\nprotocol static spokes {\n"
+            "        import all;\n"
+            f"        route {config['spoke_cidr']} via {get_vpc_router_address(config)};\n"
+            "}\n"
+        )
+    filters = {
+        "aggregate_protocol": "",
+        # The VPC route is only for announcing. Hosts outside ens5's own subnet are reached via
+        # the VPC router, by the default route
+        "kernel_export": 'where proto != "vpc"',
+        "ospf_import": "all",
+        "ospf_export": "all",
+    }
+    if config["route_filtering"] == "aggregate":
+        aggregate_routes = "\n".join(
+            f"        route {cidr} recursive {config['mesh_anchor']};"
+            for cidr in config["mesh_cidrs"]
+        )
+        filters = {
+            "aggregate_protocol": read_template(
+                template_dir, "mesh_aggregates.conf"
+            ).substitute(config, aggregate_routes=aggregate_routes),
+            "kernel_export": 'where proto = "mesh_aggregates" || proto = "spokes"',
+            # Only the routes the aggregates' next hops are resolved through (excluding any
+            # default route), rather than the whole mesh
+            "ospf_import": f"where net.len > 0 && {config['mesh_anchor']} ~ net",
+            "ospf_export": f'where net = {config["vpc_cidr"]} || proto = "spokes"',
+        }
+
+    return read_template(template_dir, "bird.conf").substitute(
+        config,
+        interfaces=interfaces,
+        ecmp=yes_no(config["ecmp"]),
+        bfd_protocol=bfd_protocol,
+        spoke_protocol=spoke_protocol,
+        **filters,
+    )
+
+
+def render_wireguard_netplan(config, template_dir):
+    tunnels = active_tunnels(config)
+    if not tunnels:
+        return WIREGUARD_NETPLAN_HEADER.replace("tunnels:\n", "tunnels: {}\n")
+
+    tunnel_template = read_template(template_dir, "wg_tunnel_config.yml")
+    return WIREGUARD_NETPLAN_HEADER + "".join(
+        tunnel_template.substitute(tunnel) for tunnel in tunnels
+    )
+
+
+def render_static_routes_netplan(config):
+    # We need more specific routes to each WireGuard server via the VPC router, so that the
+    # tunnel traffic itself doesn't get routed into the tunnels once OSPF installs a default
+    # route
+    vpc_router_address = get_vpc_router_address(config)
+    return Template(STATIC_ROUTES_NETPLAN_HEADER).substitute(config) + "".join(
+        f"      - to: {tunnel['server_ip']}\n        via: {vpc_router_address}\n"
+        for tunnel in config["tunnels"]
+    )
+
+
+def render_sysctl_conf(config):
+    # With ECMP, hash flows onto the equal-cost tunnels by their addresses and ports (rather
+    # than just their addresses), so that traffic between a single pair of hosts is still
+    # balanced. Loose reverse path filtering allows replies to come back over a different
+    # tunnel than the request went out on
+    ecmp = config["ecmp"] == "enabled"
+    return (
+        f"net.ipv4.fib_multipath_hash_policy = {1 if ecmp else 0}\n"
+        "net.ipv4.conf.all.rp_filter = 2\n"
+    )
+
+
+def render_nftables_conf(config, template_dir):
+    flowtable = ""
+    accounting_set = ""
+    prerouting_rules = ""
+    forward_rules = ""
+    if config["fast_path"] != "disabled":
+        vpc_side_cidrs = config["vpc_cidr"]
+        if config["spoke_cidr"]:
+            vpc_side_cidrs = f"{{ {config['vpc_cidr']}, {config['spoke_cidr']} }}"
+        forward_rules = read_template(
+            template_dir, "nftables_fast_path.conf"
+        ).substitute(config, vpc_side_cidrs=vpc_side_cidrs)
+
+    if config["egress_accounting"] == "enabled":
+        # Counts the bytes each VPC host sends to each mesh address in the kernel, for
+        # mesh-router-accounting to read. The set's size is fixed, and idle pairs expire, so
+        # its memory use is bounded however many hosts talk
+        accounting_set = (
+            f"        set {ACCOUNTING_SET} {{\n"
+            "                type ipv4_addr . ipv4_addr\n"
+            "                size 65536\n"
+            "                flags dynamic, timeout\n"
+            "                timeout 10m\n"
+            "        }\n"
+        )
+        forward_rules += (
+            '                iifname "ens5" oifname "wg*" '
+            f"update @{ACCOUNTING_SET} {{ ip saddr . ip daddr counter }}\n"
+        )
+
+    if config["fast_path"] == "notrack":
+        # Nothing on the router needs connection state for forwarded traffic (there's no NAT,
+        # and the filtering is stateless), so skip conntrack for everything not addressed to
+        # the router itself. This saves a conntrack entry per flow, and the lookups per packet
+        prerouting_rules = "                fib daddr type != local notrack\n"
+    elif config["fast_path"] == "flowtable":
+        # Once a flow is established, its packets are forwarded straight from the ingress hook,
+        # skipping routing and the rest of netfilter. Flowtables can't match interfaces by
+        # wildcard, so the tunnels are listed explicitly
+        devices = ", ".join(
+            ["ens5", *[tunnel["interface"] for tunnel in active_tunnels(config)]]
+        )
+        flowtable = (
+            "        flowtable fastpath {\n"
+            "                hook ingress priority 0;\n"
+            f"                devices = {{ {devices} }};\n"
+            "        }\n"
+        )
+        forward_rules += "                ip protocol { tcp, udp } flow add @fastpath\n"
+
+    return read_template(template_dir, "nftables.conf").substitute(
+        config,
+        # The largest TCP payload the smallest tunnel carries, after the IPv4 and TCP headers
+        tunnel_mss=min(int(tunnel["mtu"]) for tunnel in config["tunnels"]) - 40,
+        flowtable=flowtable,
+        accounting_set=accounting_set,
+        prerouting_rules=prerouting_rules,
+        forward_rules=forward_rules,
+    )
+
+
+def get_vpc_address(config):
+    # The router's own address on the VPC side, i.e. the source address of its route to the VPC
+    # router. Connecting a UDP socket doesn't send anything
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((str(get_vpc_router_address(config)), 53))
+        return s.getsockname()[0]
+
+
+def render_unbound_conf(config, template_dir):
+    # The resolver listens on the router's VPC-side address only, since systemd-resolved
+    # already has port 53 on localhost
+    access_control = "\n".join(
+        f"        access-control: {cidr} allow"
+        for cidr in [config["vpc_cidr"], config["spoke_cidr"]]
+        if cidr
+    )
+    # Unbound answers reverse lookups of private addresses itself by default
+    mesh_local_zones = "\n".join(
+        f'        local-zone: "{zone}." nodefault'
+        for zone in config["mesh_dns_zones"]
+        if zone.endswith(".in-addr.arpa")
+    )
+    # Mesh zones are forwarded to the mesh's resolvers over the tunnels, everything else to the
+    # Amazon provided resolver (for the VPC's private zones)
+    forward_zones = "\n\n".join(
+        f'forward-zone:\n        name: "{zone}."\n'
+        + "\n".join(f"        forward-addr: {server}" for server in servers)
+        for zone, servers in [
+            *[(zone, config["mesh_dns_servers"]) for zone in config["mesh_dns_zones"]],
+            ("", [config["upstream_dns_server"]]),
+        ]
+    )
+    return read_template(template_dir, "unbound.conf").substitute(
+        config,
+        access_control=access_control,
+        mesh_local_zones=mesh_local_zones,
+        forward_zones=forward_zones,
+    )
+
+
+def render_ospf_tunnels(config):
+    # The tunnels for mesh-router-cost to probe (none, unless dynamic costs are enabled)
+    tunnels = active_tunnels(config) if config["dynamic_ospf_cost"] == "enabled" else []
+    probed = [
+        {key: tunnel[key] for key in ["interface", "mesh_side_ip", "ospf_cost"]}
+        for tunnel in tunnels
+    ]
+    return json.dumps(probed, indent=2) + "\n"
+
+
+def render(config, template_dir):
+    return {
+        SYSCTL_PATH: render_sysctl_conf(config),
+        NFTABLES_PATH: render_nftables_conf(config, template_dir),
+        BIRD_CONF_PATH: render_bird_conf(config, template_dir),
+        WIREGUARD_NETPLAN_PATH: render_wireguard_netplan(config, template_dir),
+        STATIC_ROUTES_NETPLAN_PATH: render_static_routes_netplan(config),
+        OSPF_TUNNELS_PATH: render_ospf_tunnels(config),
+        **(
+            {UNBOUND_CONF_PATH: render_unbound_conf(config, template_dir)}
+            if config["dns_resolver"] == "enabled"
+            else {}
+        ),
+    }
+
+
+def write_if_changed(path, content, mode=0o600):
+    try:
+        with open(path, "r") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+
+    # Write to a temporary file and rename it into place, so bird or netplan never see a
+    # partially written config
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=".mesh-router-config"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    return True
+
+
+def remove_stale_tunnels(config):
+    # netplan apply doesn't remove virtual devices which are no longer in its config
+    output = subprocess.run(
+        ["ip", "-o", "link", "show", "type", "wireguard"],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    configured = {tunnel["interface"] for tunnel in active_tunnels(config)}
+    for line in output.splitlines():
+        interface = line.split(":")[1].strip().split("@")[0]
+        if interface not in configured:
+            print(f"Removing stale tunnel {interface}")
+            subprocess.run(["ip", "link", "delete", interface], check=True)
+
+
+def reconfigure_bird():
+    # birdc configure applies the new config without dropping OSPF adjacencies on unchanged
+    # interfaces. If bird isn't running yet (or rejects the reload), fall back to a restart
+    result = subprocess.run(
+        ["birdc", "configure"], stdout=subprocess.PIPE, universal_newlines=True
+    )
+    if result.returncode != 0 or "Reconfigured" not in result.stdout:
+        subprocess.run(["systemctl", "restart", "bird"], check=True)
+
+
+def set_service_enabled(service, enabled):
+    state = subprocess.run(
+        ["systemctl", "is-enabled", service],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    ).stdout.strip()
+    if (state == "enabled") != enabled:
+        print(f"{'Enabling' if enabled else 'Disabling'} {service}")
+        subprocess.run(
+            ["systemctl", "enable" if enabled else "disable", "--now", service],
+            check=True,
+        )
+
+
+def nftables_loaded():
+    return (
+        subprocess.run(
+            ["nft", "list", "table", *NFTABLES_TABLE],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+        == 0
+    )
+
+
+def apply(config, rendered):
+    changed = set()
+    for path, content in rendered.items():
+        mode = 0o600 if path.startswith("/etc/netplan/") else 0o644
+        if write_if_changed(path, content, mode):
+            print(f"Updated {path}")
+            changed.add(path)
+
+    if SYSCTL_PATH in changed:
+        subprocess.run(["sysctl", "-p", SYSCTL_PATH], check=True)
+    if changed & {WIREGUARD_NETPLAN_PATH, STATIC_ROUTES_NETPLAN_PATH}:
+        subprocess.run(["netplan", "apply"], check=True)
+        remove_stale_tunnels(config)
+    # Unlike the other config, the nftables rules don't survive a reboot by themselves. They're
+    # loaded after netplan, since the flowtable needs any new tunnel interfaces to exist
+    if NFTABLES_PATH in changed or not nftables_loaded():
+        subprocess.run(["nft", "-f", NFTABLES_PATH], check=True)
+    if BIRD_CONF_PATH in changed:
+        reconfigure_bird()
+    set_service_enabled(COST_AGENT_SERVICE, config["dynamic_ospf_cost"] == "enabled")
+    # Restarting drops the resolver's cache, but only happens when its config changes
+    if UNBOUND_CONF_PATH in changed:
+        subprocess.run(["systemctl", "restart", RESOLVER_SERVICE], check=True)
+    set_service_enabled(RESOLVER_SERVICE, config["dns_resolver"] == "enabled")
+    set_service_enabled(
+        ACCOUNTING_AGENT_SERVICE, config["egress_accounting"] == "enabled"
+    )
+
+    return bool(changed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render and apply the router config the stack publishes to SSM"
+    )
+    parser.add_argument(
+        "--config-path",
+        default=os.environ.get("MESH_VPC_CONFIG_PATH", DEFAULT_CONFIG_PATH),
+        help="The SSM parameter path the stack publishes the router config under",
+    )
+    parser.add_argument(
+        "--config-file",
+        help="Read the router config from this JSON file instead of SSM (for testing)",
+    )
+    parser.add_argument("--template-dir", default=DEFAULT_TEMPLATE_DIR)
+    parser.add_argument("--role-path", default=ROLE_PATH)
+    parser.add_argument("--zone-path", default=ZONE_PATH)
+    parser.add_argument("--cost-overrides-path", default=COST_OVERRIDES_PATH)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the rendered config instead of applying it",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.config_file:
+            config = load_config_file(args.config_file)
+        else:
+            config = fetch_config(args.config_path)
+        validate_config(config)
+        config["role"] = read_role(args.role_path)
+        config["zone"] = read_zone(args.zone_path)
+        select_zone_tunnels(config)
+        if config["dns_resolver"] == "enabled":
+            config["vpc_address"] = get_vpc_address(config)
+        if config["dynamic_ospf_cost"] == "enabled":
+            config["cost_overrides"] = read_cost_overrides(args.cost_overrides_path)
+        rendered = render(config, args.template_dir)
+    except (RouterConfigError, KeyError, ValueError) as e:
+        print(f"Not applying router config: {e!r}", file=sys.stderr)
+        return 1
+
+    if args.dry_run:
+        for path, content in rendered.items():
+            print(f"# {path}\n{content}")
+        return 0
+
+    if not apply(config, rendered):
+        print("Router config unchanged")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Steers traffic onto the lowest latency healthy tunnel, by adjusting each tunnel's OSPF cost from
+the round trip time and packet loss to the mesh side of the tunnel. Every probe interval it
+pings each tunnel's mesh_side_ip through the tunnel, smooths the results, and works out a cost:
+
+    cost = LinkOSPFCost + RTT (ms) / --ms-per-cost + loss fraction * --loss-cost
+
+A tunnel's cost is only changed once its target has differed from the applied cost by more than
+the hysteresis threshold for --hold probes in a row, so jitter doesn't flap routes. Changed
+costs are written to COST_OVERRIDES_PATH, and applied by mesh-router-config (which renders them
+into bird.conf in place of the stack's costs, and runs `birdc configure`).
+
+Installed to /usr/local/bin/mesh-router-cost by mesh-router-boot, and run by
+mesh-router-cost.service, which mesh-router-config enables when the stack's DynamicOSPFCost
+parameter is "enabled". The tunnels to probe are read from OSPF_TUNNELS_PATH, which
+mesh-router-config writes. Pass --dry-run to print the costs rather than applying them.
+
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# Both must match mesh_router_config.py
+OSPF_TUNNELS_PATH = "/var/lib/mesh-vpc/ospf-tunnels.json"
+COST_OVERRIDES_PATH = "/var/lib/mesh-vpc/ospf-costs.json"
+
+APPLY_COMMAND = ["systemctl", "start", "mesh-router-config.service"]
+
+# The largest cost bird accepts for an OSPF interface
+MAX_OSPF_COST = 65535
+
+LOSS_REGEX = re.compile(r"([\d.]+)% packet loss")
+RTT_REGEX = re.compile(r"= [\d.]+/([\d.]+)/")
+
+
+def read_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def write_json(path, value):
+    # Written to a temporary file and renamed into place, so mesh-router-config never reads a
+    # partially written file
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=".mesh-router-cost"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, indent=2, sort_keys=True)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def start_probe(tunnel, count):
+    return subprocess.Popen(
+        [
+            "ping",
+            "-n",
+            "-q",
+            "-c",
+            str(count),
+            "-i",
+            "0.2",
+            "-W",
+            "1",
+            "-I",
+            tunnel["interface"],
+            tunnel["mesh_side_ip"],
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+
+
+def parse_probe(output):
+    """
+    Returns the (average RTT in ms, or None if nothing came back, loss fraction) from ping's
+    summary
+    """
+    loss = LOSS_REGEX.search(output)
+    rtt = RTT_REGEX.search(output)
+    return (
+        float(rtt.group(1)) if rtt else None,
+        float(loss.group(1)) / 100 if loss else 1.0,
+    )
+
+
+def probe_tunnels(tunnels, count):
+    """
+    Pings every tunnel at once. Returns a dict of each tunnel's interface to its probe result
+    """
+    probes = {tunnel["interface"]: start_probe(tunnel, count) for tunnel in tunnels}
+    return {
+        interface: parse_probe(probe.communicate()[0])
+        for interface, probe in probes.items()
+    }
+
+
+class CostController:
+    """
+    Tracks each tunnel's smoothed RTT and loss, and decides when to change its applied cost
+    """
+
+    def __init__(
+        self, applied, smoothing, ms_per_cost, loss_cost, hysteresis, min_change, hold
+    ):
+        self.applied = dict(applied)
+        self.smoothing = smoothing
+        self.ms_per_cost = ms_per_cost
+        self.loss_cost = loss_cost
+        self.hysteresis = hysteresis
+        self.min_change = min_change
+        self.hold = hold
+        self.rtt = {}
+        self.loss = {}
+        self.pending = {}
+
+    def smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def target_cost(self, tunnel):
+        interface = tunnel["interface"]
+        rtt = self.rtt.get(interface)
+        if rtt is None:
+            # Nothing has ever come back through the tunnel
+            return MAX_OSPF_COST
+        cost = (
+            int(tunnel["ospf_cost"])
+            + rtt / self.ms_per_cost
+            + self.loss[interface] * self.loss_cost
+        )
+        return max(1, min(MAX_OSPF_COST, round(cost)))
+
+    def update(self, tunnels, results):
+        """
+        Folds in a round of probe results, and returns whether any applied cost changed
+        """
+        changed = False
+        interfaces = {tunnel["interface"] for tunnel in tunnels}
+        for state in (self.applied, self.rtt, self.loss, self.pending):
+            for interface in set(state) - interfaces:
+                del state[interface]
+                changed |= state is self.applied
+
+        for tunnel in tunnels:
+            interface = tunnel["interface"]
+            rtt, loss = results[interface]
+            if rtt is not None:
+                self.rtt[interface] = self.smooth(self.rtt.get(interface), rtt)
+            self.loss[interface] = self.smooth(self.loss.get(interface), loss)
+
+            target = self.target_cost(tunnel)
+            applied = self.applied.get(interface, int(tunnel["ospf_cost"]))
+            threshold = max(self.min_change, applied * self.hysteresis)
+            if abs(target - applied) < threshold:
+                self.pending[interface] = 0
+                continue
+
+            self.pending[interface] = self.pending.get(interface, 0) + 1
+            if self.pending[interface] >= self.hold:
+                print(
+                    f"{interface}: cost {applied} -> {target} "
+                    f"(RTT {self.rtt.get(interface, 0):.1f}ms, "
+                    f"loss {self.loss[interface]:.0%})"
+                )
+                self.applied[interface] = target
+                self.pending[interface] = 0
+                changed = True
+
+        return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Set each tunnel's OSPF cost from its round trip time and loss"
+    )
+    parser.add_argument("--tunnels-file", default=OSPF_TUNNELS_PATH)
+    parser.add_argument("--costs-file", default=COST_OVERRIDES_PATH)
+    parser.add_argument(
+        "--interval", type=float, default=10, help="Seconds between probes"
+    )
+    parser.add_argument(
+        "--count", type=int, default=5, help="Pings per tunnel in each probe"
+    )
+    parser.add_argument(
+        "--smoothing",
+        type=float,
+        default=0.3,
+        help="Weight of each probe in the moving average of RTT and loss",
+    )
+    parser.add_argument(
+        "--ms-per-cost",
+        type=float,
+        default=1.0,
+        help="Milliseconds of RTT per unit of OSPF cost",
+    )
+    parser.add_argument(
+        "--loss-cost",
+        type=float,
+        default=1000,
+        help="OSPF cost added for 100%% loss (in proportion for partial loss)",
+    )
+    parser.add_argument(
+        "--hysteresis",
+        type=float,
+        default=0.2,
+        help="Fraction of the applied cost the target must differ by to change it",
+    )
+    parser.add_argument(
+        "--min-change",
+        type=int,
+        default=5,
+        help="The smallest cost change applied, however small the applied cost is",
+    )
+    parser.add_argument(
+        "--hold",
+        type=int,
+        default=3,
+        help="Consecutive probes the target must differ for before it's applied",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print cost changes without writing or applying them",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Probe once (ignoring --hold) and exit"
+    )
+    args = parser.parse_args(argv)
+
+    # Costs applied before a restart carry over, so the agent picks up where it left off
+    controller = CostController(
+        read_json(args.costs_file, {}),
+        args.smoothing,
+        args.ms_per_cost,
+        args.loss_cost,
+        args.hysteresis,
+        args.min_change,
+        1 if args.once else args.hold,
+    )
+    while True:
+        tunnels = read_json(args.tunnels_file, [])
+        results = probe_tunnels(tunnels, args.count)
+        if controller.update(tunnels, results) and not args.dry_run:
+            write_json(args.costs_file, controller.applied)
+            result = subprocess.run(APPLY_COMMAND)
+            if result.returncode != 0:
+                print(
+                    f"Couldn't apply costs, mesh-router-config exited {result.returncode}",
+                    file=sys.stderr,
+                )
+
+        if args.once:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
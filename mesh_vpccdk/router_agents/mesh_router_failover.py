@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Keeps the VPC's mesh routes pointed at a healthy router, when the stack runs an active/standby
+router pair (the RouterHighAvailability parameter). With the multi-az subnet layout, each
+availability zone with tunnels has its own pair, which only manages its zone's route tables.
+Whichever router the mesh routes in those route tables point at is active, and brings up the
+WireGuard tunnels. The other is standby: it keeps its tunnels down (both routers share a
+WireGuard key, so the mesh side would otherwise flap between them), and pings the mesh through
+the VPC route table, i.e. via the active router.
+If that fails for several probes in a row, it replaces the mesh routes to point at itself and
+brings up its tunnels, and nudges the old active router (a UDP datagram to NUDGE_PORT), which
+reads the route tables straight away, sees it no longer owns the routes, and demotes itself to
+standby. A nudge only prompts a read of the route tables, so a lost or spoofed one does no harm:
+the old active router still sees the change at its next regular read.
+
+A standby router can't tell whether it would reach the mesh any better (its tunnels are down),
+so when the mesh side itself is down, the pair would take the routes back and forth. Instead,
+each take over which isn't followed by the mesh becoming reachable again doubles the hold down
+before the next one, up to --max-hold-down. The route tables are only read every
+--route-poll-interval, and again just before taking over, so the pair makes few EC2 API calls.
+
+Installed to /usr/local/bin/mesh-router-failover by mesh-router-boot:
+
+    mesh-router-failover run                Monitor and fail over (mesh-router-failover.service)
+    mesh-router-failover step               Run a single monitoring step and exit
+    mesh-router-failover shared-key PATH    Write the router pair's shared WireGuard key to PATH
+
+The EC2 API is called via the AWS CLI, so the failover logic can be run against a local EC2 API
+stand-in (e.g. moto_server) from a workstation with --endpoint-url, --instance-id and
+--config-file. Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+DEFAULT_CONFIG_PARAMETER = "/MeshVPC/RouterConfig/Failover"
+SHARED_KEY_PARAMETER = "/MeshVPC/RouterPrivateKey"
+ROLE_PATH = "/var/lib/mesh-vpc/router-role"
+# The router which takes over nudges the one it took over from on this port, so that it tears its
+# tunnels down without waiting for its next read of the route tables
+NUDGE_PORT = 51800
+# Written by mesh-router-boot
+ZONE_PATH = "/var/lib/mesh-vpc/router-zone"
+
+IMDS_URL = "http://169.254.169.254/latest"
+
+ACTIVE = "active"
+STANDBY = "standby"
+
+
+class FailoverError(Exception):
+    pass
+
+
+def aws(*args, endpoint_url=None):
+    command = ["aws", *args, "--output", "json"]
+    if endpoint_url:
+        command += ["--endpoint-url", endpoint_url]
+    try:
+        output = subprocess.run(
+            command,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        raise FailoverError(f"{' '.join(args[:2])} failed: {e.stderr.strip()}")
+    return json.loads(output) if output.strip() else {}
+
+
+class AwsCliEc2:
+    def __init__(self, endpoint_url=None):
+        self.endpoint_url = endpoint_url
+
+    def get_route_targets(self, route_table_id):
+        """
+        Returns a dict of destination CIDR to the instance ID it routes to (or None)
+        """
+        response = aws(
+            "ec2",
+            "describe-route-tables",
+            "--route-table-ids",
+            route_table_id,
+            endpoint_url=self.endpoint_url,
+        )
+        return {
+            route["DestinationCidrBlock"]: route.get("InstanceId")
+            for route in response["RouteTables"][0]["Routes"]
+            if "DestinationCidrBlock" in route
+        }
+
+    def get_private_ip(self, instance_id):
+        response = aws(
+            "ec2",
+            "describe-instances",
+            "--instance-ids",
+            instance_id,
+            endpoint_url=self.endpoint_url,
+        )
+        return response["Reservations"][0]["Instances"][0]["PrivateIpAddress"]
+
+    def replace_route(self, route_table_id, cidr, instance_id):
+        aws(
+            "ec2",
+            "replace-route",
+            "--route-table-id",
+            route_table_id,
+            "--destination-cidr-block",
+            cidr,
+            "--instance-id",
+            instance_id,
+            endpoint_url=self.endpoint_url,
+        )
+
+
+def send_nudge(address):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # Sent a few times, since UDP datagrams can be lost
+        for _ in range(3):
+            sock.sendto(b"nudge", (address, NUDGE_PORT))
+
+
+def wait_for_nudge(sock, timeout):
+    """
+    Waits up to timeout seconds for a nudge on sock. Returns whether one arrived
+    """
+    sock.settimeout(timeout)
+    try:
+        sock.recvfrom(64)
+        return True
+    except socket.timeout:
+        return False
+
+
+def ping(target):
+    return (
+        subprocess.run(
+            ["ping", "-c", "1", "-W", "1", target],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+        == 0
+    )
+
+
+class FailoverController:
+    """
+    The failover state machine. ec2 is anything with get_route_targets() and replace_route()
+    (like AwsCliEc2), and health_check is a function returning whether the mesh is reachable via
+    the active router. notify_demoted, if given, is called with the instance ID of each router
+    this one takes the routes over from
+    """
+
+    def __init__(
+        self,
+        ec2,
+        route_table_ids,
+        mesh_cidrs,
+        instance_id,
+        health_check,
+        role=STANDBY,
+        on_role_change=None,
+        notify_demoted=None,
+        failure_threshold=3,
+        hold_down=60,
+        max_hold_down=3600,
+        route_poll_interval=0,
+        clock=time.monotonic,
+    ):
+        self.ec2 = ec2
+        self.route_table_ids = route_table_ids
+        self.mesh_cidrs = mesh_cidrs
+        self.instance_id = instance_id
+        self.health_check = health_check
+        self.role = role
+        self.on_role_change = on_role_change
+        self.notify_demoted = notify_demoted
+        self.failure_threshold = failure_threshold
+        self.hold_down = hold_down
+        self.max_hold_down = max_hold_down
+        self.route_poll_interval = route_poll_interval
+        self.clock = clock
+
+        self.failures = 0
+        self.owner = None
+        # Don't take over straight after starting (e.g. while the other router is still booting)
+        self.owner_changed_at = clock()
+        # Take overs by either router since the mesh was last reachable
+        self.unhealthy_takeovers = 0
+        self.owners = None
+        self.owners_read_at = None
+
+    def _set_role(self, role):
+        if role != self.role:
+            print(f"Changing role from {self.role} to {role}")
+            self.role = role
+            if self.on_role_change:
+                self.on_role_change(role)
+
+    def current_hold_down(self):
+        # The exponent is capped so it can't overflow, however long the mesh is down
+        backoff = 2 ** min(self.unhealthy_takeovers, 32)
+        return min(self.hold_down * backoff, self.max_hold_down)
+
+    def read_owners(self):
+        """
+        Returns the set of instances the mesh routes point at, in every route table
+        """
+        owners = set()
+        for route_table_id in self.route_table_ids:
+            targets = self.ec2.get_route_targets(route_table_id)
+            owners |= {targets.get(cidr) for cidr in self.mesh_cidrs} - {None}
+        self.owners = owners
+        self.owners_read_at = self.clock()
+        return owners
+
+    def nudge(self):
+        """
+        Reads the route tables at the next step, e.g. when the other router says it took over
+        """
+        self.owners = None
+
+    def take_over(self):
+        previous_owners = (self.owners or set()) - {self.instance_id}
+        for route_table_id in self.route_table_ids:
+            print(f"Pointing mesh routes in {route_table_id} at {self.instance_id}")
+            for cidr in self.mesh_cidrs:
+                self.ec2.replace_route(route_table_id, cidr, self.instance_id)
+        self.owner = self.instance_id
+        self.owners = {self.instance_id}
+        self.owners_read_at = self.clock()
+        self.owner_changed_at = self.clock()
+        self.failures = 0
+        self.unhealthy_takeovers += 1
+
+        if self.notify_demoted:
+            for instance_id in previous_owners:
+                try:
+                    self.notify_demoted(instance_id)
+                except (FailoverError, OSError) as e:
+                    # It still sees the change at its next read of the route tables
+                    print(f"Couldn't nudge {instance_id}: {e}")
+
+    def step(self):
+        if (
+            self.owners is None
+            or self.clock() - self.owners_read_at >= self.route_poll_interval
+        ):
+            self.read_owners()
+        owners = self.owners
+
+        # The mesh routes don't exist yet while the stack is being created
+        if not owners:
+            return self.role
+
+        owner = next(iter(owners)) if len(owners) == 1 else None
+        if owner != self.owner:
+            self.owner = owner
+            self.owner_changed_at = self.clock()
+
+        if owner == self.instance_id:
+            self.failures = 0
+            self._set_role(ACTIVE)
+            return self.role
+
+        # A previous take over may have been interrupted part way through
+        if self.instance_id in owners:
+            self.take_over()
+            self._set_role(ACTIVE)
+            return self.role
+
+        if self.role == ACTIVE:
+            # The other router took over from this one
+            self.unhealthy_takeovers += 1
+        self._set_role(STANDBY)
+        if self.health_check():
+            self.failures = 0
+            self.unhealthy_takeovers = 0
+        else:
+            self.failures += 1
+            print(f"Mesh unreachable via {owner} ({self.failures} in a row)")
+
+        # The hold down gives a router which just took over time to bring up its tunnels, and
+        # backs off while take overs aren't restoring the mesh. The routes are read again
+        # first, in case they've changed since they were last polled
+        if (
+            self.failures >= self.failure_threshold
+            and self.clock() - self.owner_changed_at >= self.current_hold_down()
+            and self.read_owners() == owners
+        ):
+            self.take_over()
+            self._set_role(ACTIVE)
+
+        return self.role
+
+
+def get_instance_id():
+    token_request = urllib.request.Request(
+        f"{IMDS_URL}/api/token",
+        method="PUT",
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "60"},
+    )
+    with urllib.request.urlopen(token_request, timeout=2) as response:
+        token = response.read().decode("utf-8")
+
+    request = urllib.request.Request(
+        f"{IMDS_URL}/meta-data/instance-id",
+        headers={"X-aws-ec2-metadata-token": token},
+    )
+    with urllib.request.urlopen(request, timeout=2) as response:
+        return response.read().decode("utf-8")
+
+
+def fetch_config(parameter):
+    response = aws("ssm", "get-parameter", "--name", parameter)
+    return json.loads(response["Parameter"]["Value"])
+
+
+def read_role(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ACTIVE
+
+
+def read_zone(path):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return 1
+
+
+def write_role(path, role):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(role + "\n")
+
+
+def write_shared_key(path):
+    """
+    Both routers in the pair use the same WireGuard key, so that the mesh side doesn't need to
+    know which one is active. The first router to boot generates it
+    """
+    try:
+        response = aws(
+            "ssm", "get-parameter", "--name", SHARED_KEY_PARAMETER, "--with-decryption"
+        )
+        private_key = response["Parameter"]["Value"]
+    except FailoverError as e:
+        if "ParameterNotFound" not in str(e):
+            raise
+        private_key = subprocess.run(
+            ["wg", "genkey"],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.strip()
+        try:
+            aws(
+                "ssm",
+                "put-parameter",
+                "--name",
+                SHARED_KEY_PARAMETER,
+                "--description",
+                "The WireGuard private key shared by the mesh router pair",
+                "--type",
+                "SecureString",
+                "--value",
+                private_key,
+            )
+        except FailoverError as e:
+            # The other router got there first
+            if "ParameterAlreadyExists" not in str(e):
+                raise
+            return write_shared_key(path)
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(private_key + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Keep the VPC's mesh routes pointed at a healthy router"
+    )
+    parser.add_argument("--config-parameter", default=DEFAULT_CONFIG_PARAMETER)
+    parser.add_argument(
+        "--config-file",
+        help="Read the failover config from this JSON file instead of SSM (for testing)",
+    )
+    parser.add_argument(
+        "--endpoint-url", help="Call this EC2 API endpoint (e.g. a local stand-in)"
+    )
+    parser.add_argument("--instance-id", help="Defaults to this instance's ID")
+    parser.add_argument("--role-path", default=ROLE_PATH)
+    parser.add_argument("--zone-path", default=ZONE_PATH)
+    parser.add_argument(
+        "--no-reconfigure",
+        action="store_true",
+        help="Don't run mesh-router-config when the role changes",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=2, help="Seconds between health checks"
+    )
+    parser.add_argument(
+        "--route-poll-interval",
+        type=float,
+        default=30,
+        help="Seconds between reads of the route tables",
+    )
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--hold-down", type=float, default=60)
+    parser.add_argument(
+        "--max-hold-down",
+        type=float,
+        default=3600,
+        help="The most the hold down backs off to, while take overs don't restore the mesh",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("run")
+    subparsers.add_parser("step")
+    shared_key_parser = subparsers.add_parser("shared-key")
+    shared_key_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "shared-key":
+            # This runs early in the first boot, so the instance profile credentials may not
+            # be available yet
+            deadline = time.monotonic() + 300
+            while True:
+                try:
+                    write_shared_key(args.path)
+                    return 0
+                except FailoverError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(2)
+
+        if args.config_file:
+            with open(args.config_file, "r") as f:
+                config = json.load(f)
+        else:
+            config = fetch_config(args.config_parameter)
+    except (FailoverError, KeyError, ValueError) as e:
+        print(f"Can't start failover: {e!r}", file=sys.stderr)
+        return 1
+
+    def on_role_change(role):
+        write_role(args.role_path, role)
+        if not args.no_reconfigure:
+            # Brings the tunnels up or down to match the new role
+            subprocess.run(["systemctl", "start", "mesh-router-config.service"])
+
+    ec2 = AwsCliEc2(args.endpoint_url)
+    controller = FailoverController(
+        ec2,
+        # The route tables are listed per zone. The stack repeats route tables in place of
+        # zones which don't exist
+        route_table_ids=list(
+            dict.fromkeys(config["route_table_ids"][read_zone(args.zone_path) - 1])
+        ),
+        mesh_cidrs=config["mesh_cidrs"],
+        instance_id=args.instance_id or get_instance_id(),
+        health_check=lambda: ping(config["health_check_target"]),
+        role=read_role(args.role_path),
+        on_role_change=on_role_change,
+        notify_demoted=lambda instance_id: send_nudge(ec2.get_private_ip(instance_id)),
+        failure_threshold=args.failure_threshold,
+        hold_down=args.hold_down,
+        max_hold_down=args.max_hold_down,
+        route_poll_interval=args.route_poll_interval,
+    )
+
+    if args.command == "run":
+        nudge_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        nudge_socket.bind(("", NUDGE_PORT))
+
+    while True:
+        try:
+            role = controller.step()
+        except FailoverError as e:
+            print(f"Failover step failed: {e}", file=sys.stderr)
+            if args.command == "step":
+                return 1
+        if args.command == "step":
+            print(role)
+            return 0
+
+        # A nudge doesn't cut the wait short, so the routes are still read at most once per
+        # interval however often this is nudged
+        next_step_at = time.monotonic() + args.interval
+        while True:
+            remaining = next_step_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if wait_for_nudge(nudge_socket, remaining):
+                controller.nudge()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
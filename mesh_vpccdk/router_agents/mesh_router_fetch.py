@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Downloads the router's agents and config templates (ROUTER_FILES in cloud_config.py) on first
+boot, from the bundle in S3 (the stack's CDK asset, or the copy upload.py publishes alongside
+the clean templates). Its bucket, key and SHA-256 hash are read from the global router config
+in SSM parameter store, so a stack update which changes the files doesn't change the user data
+(and so replace the router).
+
+This is the only file embedded in the user data, so it's kept small, and does nothing else.
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+AGENT_ENV_PATH = "/etc/mesh-vpc/agent.env"
+
+# Must match GLOBAL_CONFIG_PARAMETER_NAME in router_config.py
+GLOBAL_CONFIG_PARAMETER_SUFFIX = "/Global"
+
+TIMEOUT_SECONDS = 300
+RETRY_INTERVAL_SECONDS = 2
+
+
+def load_agent_env():
+    # runcmd doesn't get the environment the systemd units load, so read it ourselves
+    with open(AGENT_ENV_PATH, "r") as f:
+        for line in f:
+            key, _, value = line.strip().partition("=")
+            if key and not key.startswith("#"):
+                os.environ.setdefault(key, value)
+
+
+def fetch():
+    value = subprocess.run(
+        [
+            "aws",
+            "ssm",
+            "get-parameter",
+            "--name",
+            os.environ["MESH_VPC_CONFIG_PATH"] + GLOBAL_CONFIG_PARAMETER_SUFFIX,
+            "--query",
+            "Parameter.Value",
+            "--output",
+            "text",
+        ],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    config = json.loads(value)
+
+    url = f"s3://{config['router_files_bucket']}/{config['router_files_key']}"
+    bundle = subprocess.run(
+        ["aws", "s3", "cp", url, "-"], stdout=subprocess.PIPE, check=True
+    ).stdout
+    if hashlib.sha256(bundle).hexdigest() != config["router_files_sha256"]:
+        raise ValueError(f"{url} doesn't match its hash")
+
+    for path, file in json.loads(gzip.decompress(bundle)).items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.mesh-router-fetch"
+        with open(temp_path, "w") as f:
+            f.write(file["content"])
+        os.chmod(temp_path, int(file["mode"], 8))
+        os.replace(temp_path, path)
+
+
+def main():
+    load_agent_env()
+
+    # This fails until SSM is reachable and the instance profile credentials are available
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    while True:
+        try:
+            fetch()
+            return 0
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            if time.monotonic() > deadline:
+                print(f"Couldn't fetch the router files: {e}", file=sys.stderr)
+                return 1
+        time.sleep(RETRY_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/bin/sh
+# The router's first boot, run by cloud-init once mesh-router-fetch has downloaded this along
+# with the rest of ROUTER_FILES (see cloud_config.py). Keeping the steps here rather than in the
+# cloud-config keeps the user data small, and means changing them doesn't replace the router.
+#
+# Each step is gated on mesh-router-boot readiness checks rather than fixed sleeps. Each phase is
+# timestamped (as seconds since kernel boot) in /var/log/mesh-router-boot.log, and published to
+# the /MeshVPC/RouterBootTimings SSM parameter. Like cloud-init's runcmd, a failed step doesn't
+# stop the steps after it.
+
+. /etc/mesh-vpc/agent.env
+export AWS_DEFAULT_REGION
+
+mesh-router-boot mark router_files
+mesh-router-boot role
+mesh-router-boot zone
+mesh-router-boot wait packages_installed
+systemctl daemon-reload
+
+# RPS/XPS, IRQ affinity, net.core buffers and the fq qdisc, sized for the RouterProfile stack
+# parameter. This is reapplied on every boot, since most of it doesn't persist
+systemctl enable --now mesh-router-tune.service
+mesh-router-boot mark tuning_applied
+
+echo "net.ipv4.ip_forward = 1" >> /etc/sysctl.conf
+sysctl -p
+
+# A high availability router pair shares one WireGuard key, so the mesh side needn't know which
+# is active. So do the routers of each availability zone, which bring up different tunnels but
+# publish one public key
+if [ "$MESH_VPC_HIGH_AVAILABILITY" = enabled ] || [ "$MESH_VPC_SUBNET_LAYOUT" = multi-az ]; then
+    mesh-router-failover shared-key /etc/wireguard/private.key
+else
+    wg genkey > /etc/wireguard/private.key
+fi
+chmod 755 /etc/wireguard/
+chmod 644 /etc/wireguard/private.key
+wg pubkey < /etc/wireguard/private.key > /etc/wireguard/public.key
+
+mesh-router-boot wait default_route
+mesh-router-boot wait router_config --interval 2
+systemctl enable --now mesh-router-config.timer
+systemctl enable --now mesh-router-telemetry.service
+if [ "$MESH_VPC_HIGH_AVAILABILITY" = enabled ]; then
+    systemctl enable --now mesh-router-failover.service
+fi
+
+aws ssm put-parameter --name /MeshVPC/RouterInstancePublicKey \
+    --description 'The public key of the WG server running on the router EC2 instance' \
+    --type String --overwrite --value "$(cat /etc/wireguard/public.key)"
+mesh-router-boot mark public_key_published
+
+mesh-router-boot wait tunnels_up
+mesh-router-boot wait routes_present
+mesh-router-boot wait bird_running --publish
+
+# The mesh side can only complete the handshake once it has been given the public key above, so
+# the routing phases are waited for in the background (for up to a day) rather than blocking boot
+systemd-run --unit mesh-router-boot-routing sh -c 'mesh-router-boot wait first_handshake --timeout 86400 --interval 5; mesh-router-boot wait ospf_full --timeout 86400 --interval 5 --publish'
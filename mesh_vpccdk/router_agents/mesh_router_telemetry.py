@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Samples the router's tunnel, routing and CPU state, and pushes it in batches to CloudWatch as
+custom metrics, so saturated or flapping tunnels can be alarmed on, and routers sized from real
+load. Every sample interval it records:
+
+    TunnelBytesIn/Out, TunnelHandshakeAge   Per tunnel (Interface dimension), from wg show
+    TunnelOSPFFull                          Per tunnel, 1 if its OSPF adjacency is Full
+    OSPFNeighborsFull, BirdRoutes           From birdc
+    CPUUtilization, SoftirqUtilization      Across all cores, from /proc/stat
+    MaxCoreSoftirqUtilization               The busiest core's softirq share, which is where
+                                            forwarding hits a single core ceiling
+
+Installed to /usr/local/bin/mesh-router-telemetry by mesh-router-boot, and run by
+mesh-router-telemetry.service. Pass --file to append each batch to a local JSON lines file
+instead of CloudWatch (e.g. for testing), and --once to take a single sample and exit.
+
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# Must match ROUTER_METRICS_NAMESPACE in constants.py, which the router's IAM policy allows
+DEFAULT_NAMESPACE = "MeshVPC/Router"
+INSTANCE_ID_PATH = "/var/lib/cloud/data/instance-id"
+
+# PutMetricData's limit on the number of datums per request
+MAX_METRICS_PER_REQUEST = 1000
+# Samples are held while CloudWatch is unreachable, up to this many datums
+MAX_BUFFERED_METRICS = 10 * MAX_METRICS_PER_REQUEST
+
+ROUTE_COUNT_REGEX = re.compile(r"(\d+) of \d+ routes")
+
+
+class TelemetryError(Exception):
+    pass
+
+
+class SinkWriteError(TelemetryError):
+    """
+    Raised when a sink sent some (or none) of a batch. unsent is the datums it didn't send, to
+    be retried with the next batch
+    """
+
+    def __init__(self, message, unsent):
+        super().__init__(message)
+        self.unsent = unsent
+
+
+def run(command):
+    try:
+        return subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout
+    except OSError:
+        # e.g. bird isn't installed yet. The metrics which depend on it are just left out
+        return ""
+
+
+def read_cpu_times():
+    """
+    Returns a dict of each line of /proc/stat's cpu lines ("cpu" for the total, then "cpu0",
+    "cpu1", etc.) to its (busy, softirq, total) jiffies
+    """
+    times = {}
+    with open("/proc/stat", "r") as f:
+        for line in f:
+            if not line.startswith("cpu"):
+                continue
+            name, *fields = line.split()
+            user, nice, system, idle, iowait, irq, softirq, steal = map(int, fields[:8])
+            total = user + nice + system + idle + iowait + irq + softirq + steal
+            times[name] = (total - idle - iowait, softirq, total)
+    return times
+
+
+def wireguard_counters():
+    """
+    Returns a dict of each tunnel interface to its (received bytes, sent bytes, latest
+    handshake time)
+    """
+    transfer = {}
+    for line in run(["wg", "show", "all", "transfer"]).splitlines():
+        fields = line.split()
+        if len(fields) == 4:
+            transfer[fields[0]] = (int(fields[2]), int(fields[3]))
+
+    handshakes = {}
+    for line in run(["wg", "show", "all", "latest-handshakes"]).splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            handshakes[fields[0]] = int(fields[2])
+
+    return {
+        interface: (*counters, handshakes.get(interface, 0))
+        for interface, counters in transfer.items()
+    }
+
+
+def ospf_full_interfaces():
+    """
+    Returns the interfaces with a Full OSPF adjacency, or None if bird isn't running
+    """
+    output = run(["birdc", "show", "ospf", "neighbors"])
+    if not output:
+        return None
+    full = set()
+    for line in output.splitlines():
+        # Router ID, Pri, State, DTime, Interface, Router IP
+        fields = line.split()
+        if len(fields) == 6 and fields[2].startswith("Full"):
+            full.add(fields[4])
+    return full
+
+
+def bird_route_count():
+    match = ROUTE_COUNT_REGEX.search(run(["birdc", "show", "route", "count"]))
+    return int(match.group(1)) if match else None
+
+
+def percent(part, total):
+    return round(100 * part / total, 2) if total else 0.0
+
+
+class Sampler:
+    """
+    Turns successive readings of the router's counters into CloudWatch metric datums. The
+    counters are cumulative, so the first sample only records a baseline for them
+    """
+
+    def __init__(self, instance_id):
+        self.instance_id = instance_id
+        self.previous_cpu_times = None
+        self.previous_wireguard = {}
+
+    def datum(self, name, value, unit, timestamp, interface=None):
+        dimensions = [{"Name": "InstanceId", "Value": self.instance_id}]
+        if interface:
+            dimensions.append({"Name": "Interface", "Value": interface})
+        return {
+            "MetricName": name,
+            "Dimensions": dimensions,
+            "Timestamp": timestamp,
+            "Value": value,
+            "Unit": unit,
+        }
+
+    def sample_cpu(self, timestamp):
+        cpu_times = read_cpu_times()
+        previous, self.previous_cpu_times = self.previous_cpu_times, cpu_times
+        if previous is None:
+            return []
+
+        deltas = {
+            name: [now - before for now, before in zip(cpu_times[name], previous[name])]
+            for name in cpu_times
+            if name in previous
+        }
+        busy, softirq, total = deltas["cpu"]
+        max_core_softirq = max(
+            percent(core_softirq, core_total)
+            for name, (_, core_softirq, core_total) in deltas.items()
+            if name != "cpu"
+        )
+        return [
+            self.datum("CPUUtilization", percent(busy, total), "Percent", timestamp),
+            self.datum(
+                "SoftirqUtilization", percent(softirq, total), "Percent", timestamp
+            ),
+            self.datum(
+                "MaxCoreSoftirqUtilization", max_core_softirq, "Percent", timestamp
+            ),
+        ]
+
+    def sample_tunnels(self, timestamp, now):
+        datums = []
+        counters = wireguard_counters()
+        for interface, (received, sent, handshake) in sorted(counters.items()):
+            if interface in self.previous_wireguard:
+                previous_received, previous_sent, _ = self.previous_wireguard[interface]
+                datums += [
+                    # Counters reset when a tunnel is recreated
+                    self.datum(
+                        "TunnelBytesIn",
+                        max(received - previous_received, 0),
+                        "Bytes",
+                        timestamp,
+                        interface,
+                    ),
+                    self.datum(
+                        "TunnelBytesOut",
+                        max(sent - previous_sent, 0),
+                        "Bytes",
+                        timestamp,
+                        interface,
+                    ),
+                ]
+            # A tunnel which has never completed a handshake has no age to report, and shows
+            # up as missing data
+            if handshake:
+                datums.append(
+                    self.datum(
+                        "TunnelHandshakeAge",
+                        max(int(now) - handshake, 0),
+                        "Seconds",
+                        timestamp,
+                        interface,
+                    )
+                )
+        self.previous_wireguard = counters
+
+        full = ospf_full_interfaces()
+        if full is not None:
+            datums += [
+                self.datum(
+                    "TunnelOSPFFull",
+                    1 if interface in full else 0,
+                    "Count",
+                    timestamp,
+                    interface,
+                )
+                for interface in sorted(counters)
+            ]
+            datums.append(
+                self.datum("OSPFNeighborsFull", len(full), "Count", timestamp)
+            )
+
+        routes = bird_route_count()
+        if routes is not None:
+            datums.append(self.datum("BirdRoutes", routes, "Count", timestamp))
+
+        return datums
+
+    def sample(self):
+        now = time.time()
+        timestamp = (
+            datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+            .replace(microsecond=0)
+            .isoformat()
+        )
+        return self.sample_cpu(timestamp) + self.sample_tunnels(timestamp, now)
+
+
+class CloudWatchSink:
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def write(self, datums):
+        for start in range(0, len(datums), MAX_METRICS_PER_REQUEST):
+            with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+                json.dump(datums[start : start + MAX_METRICS_PER_REQUEST], f)
+                f.flush()
+                result = subprocess.run(
+                    [
+                        "aws",
+                        "cloudwatch",
+                        "put-metric-data",
+                        "--namespace",
+                        self.namespace,
+                        "--metric-data",
+                        f"file://{f.name}",
+                    ],
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                )
+            if result.returncode != 0:
+                # The chunks before this one were sent, so only the rest are retried
+                raise SinkWriteError(
+                    f"put-metric-data failed: {result.stderr.strip()}", datums[start:]
+                )
+
+
+class FileSink:
+    def __init__(self, path, namespace):
+        self.path = path
+        self.namespace = namespace
+
+    def write(self, datums):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"Namespace": self.namespace, "MetricData": datums}))
+            f.write("\n")
+
+
+def read_instance_id():
+    try:
+        with open(INSTANCE_ID_PATH, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return os.uname().nodename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Push the router's tunnel, routing and CPU metrics to CloudWatch"
+    )
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE)
+    parser.add_argument(
+        "--file",
+        help="Append each batch of metrics to this JSON lines file instead of CloudWatch",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=10, help="Seconds between samples"
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=60,
+        help="Seconds between sending batches of samples",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Take a single sample (over one --interval), send it, and exit",
+    )
+    args = parser.parse_args(argv)
+
+    sink = (
+        FileSink(args.file, args.namespace)
+        if args.file
+        else CloudWatchSink(args.namespace)
+    )
+    sampler = Sampler(read_instance_id())
+
+    # Establishes the baseline for the cumulative counters
+    sampler.sample()
+    buffered = []
+    last_flush = time.monotonic()
+    while True:
+        time.sleep(args.interval)
+        buffered += sampler.sample()
+
+        if not args.once and time.monotonic() - last_flush < args.flush_interval:
+            continue
+        last_flush = time.monotonic()
+        try:
+            sink.write(buffered)
+            buffered = []
+        except SinkWriteError as e:
+            print(f"Couldn't send metrics: {e}", file=sys.stderr)
+            buffered = e.unsent[-MAX_BUFFERED_METRICS:]
+
+        if args.once:
+            return 0 if not buffered else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
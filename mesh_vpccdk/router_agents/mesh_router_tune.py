@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Tunes the router's kernel and NIC for forwarding WireGuard traffic, to match its instance type
+(the RouterProfile stack parameter). Out of the box, every packet the NIC receives is processed
+on the CPU its interrupt lands on, so WireGuard decryption and forwarding hit a single core
+ceiling however large the instance is. This spreads receive processing (RPS) and transmit queues
+(XPS) across every core, pins each of the NIC's queue interrupts to its own core, enlarges the
+net.core socket buffers and backlog, and switches to the fq qdisc.
+
+Installed to /usr/local/bin/mesh-router-tune by mesh-router-boot, and run on every boot by
+mesh-router-tune.service, since most of these settings don't persist across reboots. The
+profile is looked up from the instance type rather than passed in, so that resizing the router
+in place picks up the matching tuning on its next boot.
+
+Runs on the router's stock python3, so must only use the standard library.
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import urllib.request
+
+SYSCTL_PATH = "/etc/sysctl.d/62-mesh-router-tuning.conf"
+IMDS_URL = "http://169.254.169.254/latest"
+
+# Must match ROUTER_PROFILES in constants.py, which has the instance types for each architecture
+PROFILES = {
+    "nano": {
+        "instance_types": ["t4g.nano", "t3.nano"],
+        "socket_buffer_bytes": 4 * 1024 * 1024,
+        "netdev_max_backlog": 5000,
+        "netdev_budget": 600,
+        "rps_sock_flow_entries": 32768,
+        "rx_ring_entries": 1024,
+    },
+    "small": {
+        "instance_types": ["t4g.small", "t3.small"],
+        "socket_buffer_bytes": 8 * 1024 * 1024,
+        "netdev_max_backlog": 10000,
+        "netdev_budget": 600,
+        "rps_sock_flow_entries": 32768,
+        "rx_ring_entries": 2048,
+    },
+    "c7gn": {
+        "instance_types": ["c7gn.large"],
+        "socket_buffer_bytes": 32 * 1024 * 1024,
+        "netdev_max_backlog": 30000,
+        "netdev_budget": 1200,
+        "rps_sock_flow_entries": 65536,
+        "rx_ring_entries": 8192,
+    },
+    "c6in": {
+        "instance_types": ["c6in.large"],
+        "socket_buffer_bytes": 32 * 1024 * 1024,
+        "netdev_max_backlog": 30000,
+        "netdev_budget": 1200,
+        "rps_sock_flow_entries": 65536,
+        "rx_ring_entries": 8192,
+    },
+}
+
+DEFAULT_PROFILE = "nano"
+
+
+def run(command, dry_run):
+    print(" ".join(command))
+    if not dry_run:
+        subprocess.run(command)
+
+
+def write(path, content, dry_run):
+    print(f"{path} <- {content}")
+    if dry_run:
+        return
+    try:
+        with open(path, "w") as f:
+            f.write(content)
+    except OSError as e:
+        # Not every NIC exposes every knob (e.g. RPS on a single queue device)
+        print(f"Can't write {path}: {e}", file=sys.stderr)
+
+
+def get_instance_type():
+    token_request = urllib.request.Request(
+        f"{IMDS_URL}/api/token",
+        method="PUT",
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "60"},
+    )
+    with urllib.request.urlopen(token_request, timeout=2) as response:
+        token = response.read().decode("utf-8")
+
+    request = urllib.request.Request(
+        f"{IMDS_URL}/meta-data/instance-type",
+        headers={"X-aws-ec2-metadata-token": token},
+    )
+    with urllib.request.urlopen(request, timeout=2) as response:
+        return response.read().decode("utf-8")
+
+
+def get_profile(instance_type):
+    for name, profile in PROFILES.items():
+        if instance_type in profile["instance_types"]:
+            return name
+    print(
+        f"No tuning profile for {instance_type}, using {DEFAULT_PROFILE}",
+        file=sys.stderr,
+    )
+    return DEFAULT_PROFILE
+
+
+def cpu_mask(cpus):
+    """
+    Formats a set of CPU numbers as a sysfs CPU mask, i.e. comma separated 32 bit hex words
+    """
+    mask = sum(1 << cpu for cpu in cpus)
+    words = []
+    while True:
+        words.insert(0, f"{mask & 0xFFFFFFFF:x}")
+        mask >>= 32
+        if not mask:
+            return ",".join(words)
+
+
+def render_sysctl_conf(profile):
+    settings = PROFILES[profile]
+    buffer_bytes = settings["socket_buffer_bytes"]
+    lines = [
+        f"# Written by mesh-router-tune for the {profile} router profile",
+        "net.core.default_qdisc = fq",
+        f"net.core.rmem_max = {buffer_bytes}",
+        f"net.core.wmem_max = {buffer_bytes}",
+        f"net.core.rmem_default = {buffer_bytes // 4}",
+        f"net.core.wmem_default = {buffer_bytes // 4}",
+        f"net.core.netdev_max_backlog = {settings['netdev_max_backlog']}",
+        f"net.core.netdev_budget = {settings['netdev_budget']}",
+        f"net.core.rps_sock_flow_entries = {settings['rps_sock_flow_entries']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def queue_interrupts(interface):
+    """
+    Returns the IRQ numbers of the interface's queues, in queue order
+    """
+    interrupts = []
+    with open("/proc/interrupts", "r") as f:
+        for line in f:
+            fields = line.split()
+            if fields and fields[-1].startswith(f"{interface}-"):
+                interrupts.append(fields[0].rstrip(":"))
+    return interrupts
+
+
+def tune(profile, interface, cpu_count, dry_run):
+    settings = PROFILES[profile]
+    cpus = range(cpu_count)
+
+    write(SYSCTL_PATH, render_sysctl_conf(profile), dry_run)
+    run(["sysctl", "-p", SYSCTL_PATH], dry_run)
+
+    # Use every queue the NIC offers (ENA exposes one per vCPU), with deeper rings on the
+    # larger profiles to absorb bursts while the CPUs are busy decrypting
+    run(["ethtool", "-L", interface, "combined", str(cpu_count)], dry_run)
+    run(
+        ["ethtool", "-G", interface, "rx", str(settings["rx_ring_entries"])],
+        dry_run,
+    )
+
+    # Replacing the root qdisc recreates the per-queue qdiscs with the new default_qdisc (fq)
+    run(["tc", "qdisc", "replace", "dev", interface, "root", "mq"], dry_run)
+
+    # irqbalance would otherwise move the queue interrupts back onto shared cores
+    run(["systemctl", "disable", "--now", "irqbalance.service"], dry_run)
+    for queue, irq in enumerate(queue_interrupts(interface)):
+        write(f"/proc/irq/{irq}/smp_affinity_list", str(queue % cpu_count), dry_run)
+
+    rx_queues = sorted(glob.glob(f"/sys/class/net/{interface}/queues/rx-*"))
+    for rx_queue in rx_queues:
+        write(f"{rx_queue}/rps_cpus", cpu_mask(cpus), dry_run)
+        write(
+            f"{rx_queue}/rps_flow_cnt",
+            str(settings["rps_sock_flow_entries"] // max(len(rx_queues), 1)),
+            dry_run,
+        )
+
+    tx_queues = sorted(glob.glob(f"/sys/class/net/{interface}/queues/tx-*"))
+    for queue, tx_queue in enumerate(tx_queues):
+        write(f"{tx_queue}/xps_cpus", cpu_mask([queue % cpu_count]), dry_run)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tune the router's kernel and NIC for forwarding WireGuard"
+    )
+    parser.add_argument("--interface", default="ens5")
+    parser.add_argument(
+        "--profile",
+        choices=PROFILES.keys(),
+        help="Defaults to the profile matching this instance's type",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the changes which would be made, without making them",
+    )
+    args = parser.parse_args(argv)
+
+    profile = args.profile or get_profile(get_instance_type())
+    print(f"Tuning {args.interface} for the {profile} router profile")
+    tune(profile, args.interface, os.cpu_count(), args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import json
+
+from mesh_vpccdk.constants import (
+    AMAZON_DNS_SERVER,
+    FAILOVER_HEALTH_CHECK_TARGET,
+    MESH_CIDRS,
+    MESH_DNS_SERVERS,
+    MESH_DNS_ZONES,
+    MULTI_AZ_SUBNETS,
+    ROUTER_CONFIG_PARAMETER_PATH,
+    WG_LISTEN_PORT_BASE,
+)
+from mesh_vpccdk.cloud_config import get_router_files_bundle_digest
+from mesh_vpccdk.parameters import get_wireguard_parameter_specs
+
+# The router config is published as JSON documents in SSM parameter store, and rendered into the
+# netplan and bird config on the router by router_agents/mesh_router_config.py. The keys here
+# are the ${} placeholders used by the router-side templates (bird.conf, bfd.conf,
+# ospf_interface.conf and wg_tunnel_config.yml)
+
+GLOBAL_CONFIG_PARAMETER_NAME = f"{ROUTER_CONFIG_PARAMETER_PATH}/Global"
+
+# Read by router_agents/mesh_router_failover.py, when the stack has a high availability pair
+FAILOVER_CONFIG_PARAMETER_NAME = f"{ROUTER_CONFIG_PARAMETER_PATH}/Failover"
+
+# The Fn::Sub variables the global config and the routers' IAM policy locate the router files
+# bundle with: the CDK asset's, or the copy upload.py publishes in the clean templates (see
+# postprocess.use_published_router_files())
+ROUTER_FILES_BUCKET_VARIABLE = "RouterFilesBucket"
+ROUTER_FILES_KEY_VARIABLE = "RouterFilesKey"
+
+# Maps tunnel config keys to the keys of get_wireguard_parameter_specs()
+TUNNEL_CONFIG_PARAMETERS = {
+    "aws_side_ip": "p2pIPAddressAWSSide",
+    "mesh_side_ip": "p2pIPAddressMeshSide",
+    "server_public_key": "ServerPublicKey",
+    "server_ip": "ServerIP",
+    "server_port": "ServerPort",
+    "ospf_cost": "LinkOSPFCost",
+    "mtu": "LinkMTU",
+}
+
+
+def _fn_sub_reference(parameter_id: str) -> str:
+    return f"${{{parameter_id}}}"
+
+
+def _to_json(config: dict) -> str:
+    return json.dumps(config, separators=(",", ":"))
+
+
+def get_tunnel_config_parameter_name(tunnel_num: int) -> str:
+    return f"{ROUTER_CONFIG_PARAMETER_PATH}/Tunnels/wg{tunnel_num + 1}"
+
+
+def get_router_files_variables(location: dict) -> dict:
+    """
+    Returns the Fn::Sub variables for the router files bundle at location's bucket and key
+    """
+    return {
+        ROUTER_FILES_BUCKET_VARIABLE: location["bucket"],
+        ROUTER_FILES_KEY_VARIABLE: location["key"],
+    }
+
+
+def get_router_files_arn_template() -> str:
+    """
+    Returns the Fn::Sub template string for the ARN of the router files bundle
+    """
+    return (
+        f"arn:aws:s3:::{_fn_sub_reference(ROUTER_FILES_BUCKET_VARIABLE)}/"
+        f"{_fn_sub_reference(ROUTER_FILES_KEY_VARIABLE)}"
+    )
+
+
+def get_global_config_template() -> str:
+    """
+    Returns the Fn::Sub template string for the value of the global config parameter, which
+    needs the router files variables (see get_router_files_variables()) substituting too
+    """
+    return _to_json(
+        {
+            "router_id": _fn_sub_reference(
+                get_wireguard_parameter_specs(0)["p2pIPAddressAWSSide"]["id"]
+            ),
+            "vpc_cidr": _fn_sub_reference("MeshCIDR"),
+            "ecmp": _fn_sub_reference("ECMPMode"),
+            "bfd": _fn_sub_reference("TunnelBFD"),
+            "ospf_hello": _fn_sub_reference("TunnelOSPFHello"),
+            "ospf_dead": _fn_sub_reference("TunnelOSPFDead"),
+            "dynamic_ospf_cost": _fn_sub_reference("DynamicOSPFCost"),
+            "vpc_mtu": _fn_sub_reference("VPCSideMTU"),
+            "fast_path": _fn_sub_reference("ForwardingFastPath"),
+            "route_filtering": _fn_sub_reference("MeshRouteFiltering"),
+            "spoke_cidr": _fn_sub_reference("TransitGatewaySpokeCIDR"),
+            "subnet_layout": _fn_sub_reference("MeshSubnetLayout"),
+            "mesh_cidrs": MESH_CIDRS,
+            "mesh_anchor": FAILOVER_HEALTH_CHECK_TARGET,
+            "dns_resolver": _fn_sub_reference("RouterDNSResolver"),
+            "egress_accounting": _fn_sub_reference("EgressAccounting"),
+            "mesh_dns_servers": MESH_DNS_SERVERS,
+            "mesh_dns_zones": MESH_DNS_ZONES,
+            "upstream_dns_server": AMAZON_DNS_SERVER,
+            # Read by mesh-router-fetch on first boot
+            "router_files_bucket": _fn_sub_reference(ROUTER_FILES_BUCKET_VARIABLE),
+            "router_files_key": _fn_sub_reference(ROUTER_FILES_KEY_VARIABLE),
+            "router_files_sha256": get_router_files_bundle_digest(),
+        }
+    )
+
+
+def get_tunnel_zone(tunnel_num: int) -> int:
+    """
+    Returns the availability zone (numbered from 1) whose router brings up the given tunnel,
+    with the multi-az subnet layout. The tunnels alternate between the zones, so with two, the
+    second zone's router has the even numbered tunnels. Must match tunnel_zone() in
+    router_agents/mesh_router_config.py
+    """
+    return tunnel_num % MULTI_AZ_SUBNETS + 1
+
+
+def get_tunnel_config_template(tunnel_num: int) -> str:
+    """
+    Returns the Fn::Sub template string for the value of the given tunnel's config parameter
+    """
+    specs = get_wireguard_parameter_specs(tunnel_num)
+    return _to_json(
+        {
+            "interface": f"wg{tunnel_num + 1}",
+            "listen_port": WG_LISTEN_PORT_BASE + tunnel_num + 1,
+            **{
+                key: _fn_sub_reference(specs[name]["id"])
+                for key, name in TUNNEL_CONFIG_PARAMETERS.items()
+            },
+        }
+    )
+
+
+def get_failover_config_template() -> str:
+    """
+    Returns the Fn::Sub template string for the value of the failover config parameter. Its
+    route_table_ids lists the route tables each zone's router pair fails over: each zone's own,
+    and for the first zone, those of any zones without a router of their own. So it needs
+    RouteTableId1, RouteTableId2, etc. substituting with the IDs of each zone's route table
+    (repeating the first, when there is only one), and SharedRouteTableId2, etc. with the ID of
+    that zone's route table if the first zone's router serves it, or else the first's
+    """
+    return _to_json(
+        {
+            "route_table_ids": [
+                [
+                    _fn_sub_reference("RouteTableId1"),
+                    *[
+                        _fn_sub_reference(f"SharedRouteTableId{i + 1}")
+                        for i in range(1, MULTI_AZ_SUBNETS)
+                    ],
+                ],
+                *[
+                    [_fn_sub_reference(f"RouteTableId{i + 1}")]
+                    for i in range(1, MULTI_AZ_SUBNETS)
+                ],
+            ],
+            "mesh_cidrs": MESH_CIDRS,
+            "health_check_target": FAILOVER_HEALTH_CHECK_TARGET,
+        }
+    )
@@ -0,0 +1,98 @@
+import aws_cdk as cdk
+from aws_cdk import aws_ec2 as ec2
+
+from constructs import Construct
+
+from mesh_vpccdk.constants import MESH_CIDRS, MULTI_AZ_SUBNET_HOST_BITS
+from mesh_vpccdk.constructs import CoreVPCInfrastructure
+from mesh_vpccdk.parameters import (
+    get_spoke_interface_metadata,
+    get_spoke_parameter_specs,
+)
+from mesh_vpccdk.util import name_tag
+
+
+class MeshSpokeVpcStack(cdk.Stack):
+    """
+    A VPC without a router of its own, which reaches the mesh through the transit gateway of a
+    hub stack (a MeshVpcCDKStack with a TransitGatewaySpokeCIDR)
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        params = {
+            name: cdk.CfnParameter(self, **spec)
+            for name, spec in get_spoke_parameter_specs().items()
+        }
+
+        self.template_options.metadata = get_spoke_interface_metadata()
+
+        conditions = {
+            "MultiAZ": cdk.CfnCondition(
+                self,
+                "MultiAZ",
+                expression=cdk.Fn.condition_equals(
+                    params["MeshSubnetLayout"].value_as_string, "multi-az"
+                ),
+            ),
+            "InUSEast1": cdk.CfnCondition(
+                self,
+                "InUSEast1",
+                expression=cdk.Fn.condition_equals(cdk.Aws.REGION, "us-east-1"),
+            ),
+        }
+
+        multi_az_subnet_sizes = cdk.CfnMapping(
+            self,
+            "MultiAZSubnetSizes",
+            mapping={
+                prefix_length: {"HostBits": str(host_bits)}
+                for prefix_length, host_bits in MULTI_AZ_SUBNET_HOST_BITS.items()
+            },
+        )
+
+        core_vpc_infra = CoreVPCInfrastructure(
+            self,
+            "CoreVPCInfrastructure",
+            vpc_cidr=params["MeshCIDR"].value_as_string,
+            multi_az_subnet_host_bits=multi_az_subnet_sizes.find_in_map(
+                params["MeshSubnetPrefixLength"].value_as_string, "HostBits"
+            ),
+            multi_az_condition=conditions["MultiAZ"],
+            us_east_1_condition=conditions["InUSEast1"],
+        )
+
+        transit_gateway_id = params["TransitGatewayId"].value_as_string
+        route_table_id = params["TransitGatewayRouteTableId"].value_as_string
+
+        # Associated with the hub's route table (which routes the mesh to the hub VPC), and
+        # propagating this VPC's CIDR into it (so the hub VPC routes it back here)
+        attachment = ec2.CfnTransitGatewayAttachment(
+            self,
+            "TransitGatewayAttachment",
+            transit_gateway_id=transit_gateway_id,
+            vpc_id=core_vpc_infra.cfn_vpc.attr_vpc_id,
+            subnet_ids=core_vpc_infra.get_subnet_ids(),
+            tags=[name_tag("MeshTransitGatewaySpokeAttachment")],
+        )
+        ec2.CfnTransitGatewayRouteTableAssociation(
+            self,
+            "TransitGatewayRouteTableAssociation",
+            transit_gateway_attachment_id=attachment.attr_id,
+            transit_gateway_route_table_id=route_table_id,
+        )
+        ec2.CfnTransitGatewayRouteTablePropagation(
+            self,
+            "TransitGatewayRouteTablePropagation",
+            transit_gateway_attachment_id=attachment.attr_id,
+            transit_gateway_route_table_id=route_table_id,
+        )
+
+        core_vpc_infra.add_transit_gateway_routes(
+            "Mesh CIDR",
+            transit_gateway_id,
+            MESH_CIDRS,
+            attachment,
+            [None, conditions["MultiAZ"]],
+        )
@@ -0,0 +1,228 @@
+"""
+A content-addressed cache of synthesized cloud assemblies. app.py hashes everything that can
+affect the synthesized template, and when an entry for that hash exists it restores the cached
+cdk.out contents instead of starting the CDK runtime. The cache also remembers the hash of the
+last upload of each template to S3, so that unchanged templates aren't uploaded again (see
+upload.py):
+
+    python3 -m mesh_vpccdk.synth_cache needs-upload cdk.out/MeshVpcCDKStack.clean.template.json
+    python3 -m mesh_vpccdk.synth_cache mark-uploaded cdk.out/MeshVpcCDKStack.clean.template.json
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+from mesh_vpccdk.postprocess import MINIFY_ENV_VAR
+
+THIS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(THIS_DIRECTORY)
+
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".synth-cache")
+DEFAULT_MAX_ENTRIES = 10
+
+# Set this environment variable (to anything but "" or "0") to bypass the cache
+DISABLE_CACHE_ENV_VAR = "MESH_VPC_NO_SYNTH_CACHE"
+
+# Bump this to invalidate every existing entry if the cache layout or semantics change
+CACHE_FORMAT_VERSION = "1"
+
+INPUT_FILES = ["app.py", "cdk.json", "requirements.txt"]
+INPUT_DIRECTORIES = ["mesh_vpccdk"]
+INPUT_PACKAGES = ["aws-cdk-lib", "constructs"]
+# The cached cdk.out holds the post-processed templates as well as the cloud assembly, so the
+# environment variables which change the post-processing are inputs too
+INPUT_ENV_VARS = ["CDK_CONTEXT_JSON", MINIFY_ENV_VAR]
+
+UPLOADED_MARKERS_DIRECTORY = "uploaded"
+ENTRIES_DIRECTORY = "entries"
+
+
+def cache_enabled() -> bool:
+    return os.environ.get(DISABLE_CACHE_ENV_VAR, "") in ("", "0")
+
+
+def iter_input_files(root: str):
+    for filename in INPUT_FILES:
+        yield filename
+
+    for directory in INPUT_DIRECTORIES:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, directory)):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for filename in sorted(filenames):
+                if not filename.endswith((".pyc", ".pyo")):
+                    yield os.path.relpath(os.path.join(dirpath, filename), root)
+
+
+def _package_version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return "not-installed"
+
+
+def compute_input_hash(root: str = PROJECT_ROOT) -> str:
+    """
+    Hashes the source files, template fragments, library versions, CDK context and
+    post-processing settings which together determine the synthesized templates
+    """
+    digest = hashlib.sha256()
+    digest.update(f"format:{CACHE_FORMAT_VERSION}\n".encode("utf-8"))
+
+    for relative_path in sorted(set(iter_input_files(root))):
+        path = os.path.join(root, relative_path)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            file_digest = hashlib.sha256(f.read()).hexdigest()
+        digest.update(
+            f"file:{relative_path.replace(os.sep, '/')}:{file_digest}\n".encode("utf-8")
+        )
+
+    for package in INPUT_PACKAGES:
+        digest.update(
+            f"package:{package}:{_package_version(package)}\n".encode("utf-8")
+        )
+
+    for env_var in INPUT_ENV_VARS:
+        digest.update(f"env:{env_var}:{os.environ.get(env_var, '')}\n".encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class SynthCache:
+    def __init__(
+        self, cache_dir: str = DEFAULT_CACHE_DIR, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def _entry_path(self, input_hash: str) -> str:
+        return os.path.join(self.cache_dir, ENTRIES_DIRECTORY, input_hash)
+
+    def restore(self, input_hash: str, outdir: str) -> bool:
+        """
+        Copies the cached cloud assembly for input_hash into outdir. Returns False on a miss
+        """
+        entry_path = self._entry_path(input_hash)
+        if not os.path.isdir(entry_path):
+            return False
+
+        shutil.copytree(entry_path, outdir, dirs_exist_ok=True)
+
+        # Touch the entry so eviction is least-recently-used rather than oldest-first
+        now = time.time()
+        os.utime(entry_path, (now, now))
+        return True
+
+    def store(self, input_hash: str, outdir: str):
+        entries_dir = os.path.join(self.cache_dir, ENTRIES_DIRECTORY)
+        os.makedirs(entries_dir, exist_ok=True)
+
+        entry_path = self._entry_path(input_hash)
+        if os.path.isdir(entry_path):
+            return
+
+        # Copy into a temporary directory and rename into place, so a build that is killed
+        # part way through can't leave behind a partial entry which later gets restored
+        staging_path = tempfile.mkdtemp(dir=entries_dir, prefix=".staging-")
+        try:
+            shutil.copytree(outdir, staging_path, dirs_exist_ok=True)
+            os.rename(staging_path, entry_path)
+        except OSError:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            if not os.path.isdir(entry_path):
+                raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries beyond max_entries
+        """
+        entries_dir = os.path.join(self.cache_dir, ENTRIES_DIRECTORY)
+        if not os.path.isdir(entries_dir):
+            return
+
+        entries = [
+            os.path.join(entries_dir, name)
+            for name in os.listdir(entries_dir)
+            if not name.startswith(".")
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry_path in entries[self.max_entries :]:
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+    def _uploaded_marker_path(self, template_path: str) -> str:
+        return os.path.join(
+            self.cache_dir,
+            UPLOADED_MARKERS_DIRECTORY,
+            f"{os.path.basename(template_path)}.sha256",
+        )
+
+    def needs_upload(self, template_path: str) -> bool:
+        marker_path = self._uploaded_marker_path(template_path)
+        if not os.path.isfile(marker_path):
+            return True
+
+        with open(marker_path, "r") as f:
+            return f.read().strip() != hash_file(template_path)
+
+    def mark_uploaded(self, template_path: str):
+        marker_path = self._uploaded_marker_path(template_path)
+        os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+        with open(marker_path, "w") as f:
+            f.write(hash_file(template_path) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Query the synth cache, and record uploaded templates"
+    )
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    needs_upload_parser = subparsers.add_parser(
+        "needs-upload",
+        help="Exit 0 if the template differs from the last one uploaded, 1 otherwise",
+    )
+    needs_upload_parser.add_argument("template_path")
+
+    mark_uploaded_parser = subparsers.add_parser(
+        "mark-uploaded", help="Record the template as the last one uploaded"
+    )
+    mark_uploaded_parser.add_argument("template_path")
+
+    subparsers.add_parser("hash", help="Print the hash of the current synth inputs")
+
+    args = parser.parse_args(argv)
+    cache = SynthCache(args.cache_dir)
+
+    if args.command == "needs-upload":
+        if cache.needs_upload(args.template_path):
+            return 0
+        print(
+            f"{args.template_path} is unchanged since the last upload", file=sys.stderr
+        )
+        return 1
+
+    if args.command == "mark-uploaded":
+        cache.mark_uploaded(args.template_path)
+        return 0
+
+    print(compute_input_hash())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+A long-lived synth server, which keeps the Python process and the CDK/jsii runtime warm between
+synths. Run it in a second terminal alongside `cdk watch`:
+
+    python3 -m mesh_vpccdk.synth_server
+
+It polls the synth inputs (mesh_vpccdk/, including the template fragments, see
+synth_cache.py) and re-synthesizes the default template variant as soon as any of them
+change, reloading the stack's modules rather than restarting the runtime. While it's running,
+app.py hands its synth to the server over a socket in .synth-cache/, so each `cdk watch` (or
+`cdk synth`) cycle takes well under a second. The server only builds the default variant (and
+lists only it in the variants manifest, so upload.py uploads only it); run app.py with no server
+to build them all.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from mesh_vpccdk.profiling import StageTimer
+from mesh_vpccdk.synth_cache import DEFAULT_CACHE_DIR, PROJECT_ROOT, iter_input_files
+
+SOCKET_PATH = os.path.join(DEFAULT_CACHE_DIR, "synth-server.sock")
+
+DEFAULT_OUTDIR = "cdk.out"
+POLL_INTERVAL_SECONDS = 0.25
+
+# How long app.py waits for the server to synthesize, before giving up on it
+REQUEST_TIMEOUT_SECONDS = 120
+
+
+class SynthServerError(Exception):
+    pass
+
+
+def get_input_snapshot(root: str = PROJECT_ROOT) -> dict:
+    """
+    Returns the modification time of each synth input, which is much cheaper to compare between
+    polls than synth_cache.compute_input_hash()
+    """
+    snapshot = {}
+    for relative_path in iter_input_files(root):
+        try:
+            snapshot[relative_path] = os.stat(
+                os.path.join(root, relative_path)
+            ).st_mtime_ns
+        except FileNotFoundError:
+            continue
+    return snapshot
+
+
+def get_default_context(root: str = PROJECT_ROOT) -> dict:
+    """
+    The CDK CLI passes app.py the context from cdk.json (in CDK_CONTEXT_JSON). Synths the server
+    starts itself use the same context, so they match the CLI's
+    """
+    with open(os.path.join(root, "cdk.json"), "r") as f:
+        return json.load(f).get("context", {})
+
+
+def reload_stack_modules():
+    """
+    Drops the project's modules (besides this one, and the package itself) from the import
+    cache, so the next synth imports them fresh. The CDK library's modules are left loaded,
+    which keeps the jsii runtime running
+    """
+    for name in list(sys.modules):
+        if name.startswith("mesh_vpccdk.") and name != __name__:
+            del sys.modules[name]
+
+
+def synthesize(outdir: str, context: dict, timer: StageTimer) -> str:
+    """
+    Synthesizes the default variant into outdir like app.py does, along with the variants
+    manifest (and, as part of the stack, the router files bundle), and returns its budget report
+    """
+    with timer.stage("reload"):
+        reload_stack_modules()
+        constants = importlib.import_module("mesh_vpccdk.constants")
+        postprocess = importlib.import_module("mesh_vpccdk.postprocess")
+        variants = importlib.import_module("mesh_vpccdk.variants")
+        stack = importlib.import_module("mesh_vpccdk.mesh_vpc_cdk_stack")
+
+    import aws_cdk as cdk
+
+    default_variant = variants.get_template_variants()[0]
+    with timer.stage("stack"):
+        # The context is passed explicitly, since the jsii runtime (which reads CDK_CONTEXT_JSON)
+        # only ever sees the environment the server was started with
+        app = cdk.App(outdir=outdir, context=context)
+        stack.MeshVpcCDKStack(
+            app,
+            constants.STACK_NAME,
+            max_wg_tunnels=default_variant["max_wg_tunnels"],
+            architecture=default_variant["architecture"],
+        )
+    with timer.stage("synth"):
+        app.synth()
+
+    with timer.stage("postprocess"):
+        with open(f"{outdir}/{constants.STACK_NAME}.template.json", "r") as f:
+            template_json = postprocess.clean_template(json.load(f))
+        report = postprocess.write_clean_template(
+            template_json,
+            variants.get_clean_template_path(outdir, default_variant["name"]),
+            direct_upload=default_variant["direct_upload"],
+        )
+        variants.write_variants_manifest([default_variant], outdir)
+        return report
+
+
+class SynthServer:
+    """
+    Synthesizes on the main thread whenever the inputs, outdir or CDK context change, either
+    when noticed by polling or when asked by app.py. The CDK runtime is only ever called from
+    the main thread; the socket's handler threads queue their requests for it
+    """
+
+    def __init__(self, outdir: str, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.default_request = {
+            "outdir": os.path.abspath(outdir),
+            "context": get_default_context(),
+        }
+        self.requests = queue.Queue()
+        self.last_key = None
+        self.last_response = None
+
+    def synthesize_if_changed(self, request: dict) -> dict:
+        key = (
+            get_input_snapshot(),
+            request["outdir"],
+            json.dumps(request["context"], sort_keys=True),
+        )
+        if key == self.last_key:
+            return self.last_response
+
+        timer = StageTimer()
+        try:
+            report = synthesize(request["outdir"], request["context"], timer)
+            response = {"report": report}
+            print(f"{report}\n{timer.format()}", file=sys.stderr)
+        except Exception:
+            # The failure is remembered along with the inputs, so the same broken inputs aren't
+            # synthesized again on every poll
+            response = {"error": traceback.format_exc()}
+            print(response["error"], file=sys.stderr)
+
+        print(
+            f"Synthesized into {request['outdir']} at {time.strftime('%H:%M:%S')}",
+            file=sys.stderr,
+        )
+        self.last_key = key
+        self.last_response = response
+        return response
+
+    def serve_forever(self):
+        while True:
+            try:
+                request, reply_queue = self.requests.get(timeout=self.poll_interval)
+            except queue.Empty:
+                request, reply_queue = self.default_request, None
+            else:
+                # Later polls synthesize into the same outdir, with the same context, as the
+                # latest request, so its output stays current
+                self.default_request = request
+
+            response = self.synthesize_if_changed(request)
+            if reply_queue is not None:
+                reply_queue.put(response)
+
+
+def _make_handler(server: SynthServer):
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            reply_queue = queue.Queue(maxsize=1)
+            server.requests.put((request, reply_queue))
+            self.wfile.write(json.dumps(reply_queue.get()).encode("utf-8") + b"\n")
+
+    return RequestHandler
+
+
+def request_synth(outdir: str, socket_path: str = SOCKET_PATH):
+    """
+    Asks a running synth server to synthesize into outdir, with this process's CDK context.
+    Returns the budget report, or None if no server is running. Raises SynthServerError if the
+    synth failed
+    """
+    if not os.path.exists(socket_path):
+        return None
+
+    request = {
+        "outdir": os.path.abspath(outdir),
+        "context": json.loads(os.environ.get("CDK_CONTEXT_JSON") or "{}"),
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(REQUEST_TIMEOUT_SECONDS)
+            client.connect(socket_path)
+            client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            response = json.loads(client.makefile("rb").readline())
+    except (OSError, ValueError):
+        # A socket left behind by a server which has since exited
+        return None
+
+    if "error" in response:
+        raise SynthServerError(response["error"])
+    return response["report"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-synthesize the default template whenever its inputs change"
+    )
+    parser.add_argument(
+        "--outdir", default=os.environ.get("CDK_OUTDIR", DEFAULT_OUTDIR)
+    )
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=POLL_INTERVAL_SECONDS,
+        help="Seconds between checks of the synth inputs for changes",
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    import aws_cdk  # noqa: F401 (imported once here, so every synth finds it warm)
+
+    print(
+        f"Started the CDK runtime in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+    server = SynthServer(args.outdir, args.poll_interval)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    socket_server = socketserver.ThreadingUnixStreamServer(
+        args.socket, _make_handler(server)
+    )
+    socket_server.daemon_threads = True
+    threading.Thread(target=socket_server.serve_forever, daemon=True).start()
+    print(f"Listening on {args.socket}", file=sys.stderr)
+
+    # Stopped the same way on SIGTERM as on Ctrl-C, so the socket is always removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        socket_server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Uploads the clean template of every variant app.py built (listed in cdk.out/
+template-variants.json) to S3, as <prefix>/<template filename>. Templates which haven't changed
+since their last upload are skipped (see synth_cache.py), and the rest are uploaded
+concurrently, each with the AWS CLI:
+
+    python3 -m mesh_vpccdk.upload
+
+The router files bundle the templates point the routers at (see cloud_config.py) is uploaded
+first, so a template is never published before the files it needs.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from mesh_vpccdk.cloud_config import (
+    ROUTER_FILES_BUNDLE_FILENAME,
+    get_router_files_bundle_key,
+)
+from mesh_vpccdk.constants import STACK_NAME, TEMPLATE_BUCKET
+from mesh_vpccdk.fast_synth import DEFAULT_OUTDIR
+from mesh_vpccdk.synth_cache import SynthCache
+from mesh_vpccdk.variants import VARIANTS_MANIFEST_FILENAME
+
+DEFAULT_CONCURRENCY = 8
+
+
+def read_template_paths(outdir: str) -> list:
+    with open(os.path.join(outdir, VARIANTS_MANIFEST_FILENAME), "r") as f:
+        return [os.path.join(outdir, variant["template"]) for variant in json.load(f)]
+
+
+def upload_file(path: str, bucket: str, key: str):
+    subprocess.run(
+        ["aws", "s3", "cp", "--only-show-errors", path, f"s3://{bucket}/{key}"],
+        check=True,
+    )
+
+
+def upload_template(template_path: str, bucket: str, prefix: str):
+    upload_file(template_path, bucket, f"{prefix}/{os.path.basename(template_path)}")
+
+
+def upload_router_files_bundle(outdir: str, bucket: str, cache: SynthCache):
+    bundle_path = os.path.join(outdir, ROUTER_FILES_BUNDLE_FILENAME)
+    if not cache.needs_upload(bundle_path):
+        return
+
+    # Keyed by the hash of the bundle that was built, as the clean templates beside it expect
+    # (see cloud_config.get_published_router_files_location())
+    with open(bundle_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    upload_file(bundle_path, bucket, get_router_files_bundle_key(digest))
+    cache.mark_uploaded(bundle_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Upload the router files and every changed template to S3"
+    )
+    parser.add_argument("--outdir", default=DEFAULT_OUTDIR)
+    parser.add_argument(
+        "--bucket",
+        default=TEMPLATE_BUCKET,
+        help="Must be TEMPLATE_BUCKET in constants.py, which the routers fetch their files from",
+    )
+    parser.add_argument("--prefix", default=STACK_NAME)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="How many templates to upload at once",
+    )
+    args = parser.parse_args(argv)
+
+    cache = SynthCache()
+    try:
+        upload_router_files_bundle(args.outdir, args.bucket, cache)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Couldn't upload the router files bundle: {e}", file=sys.stderr)
+        return 1
+
+    template_paths = read_template_paths(args.outdir)
+    pending = [path for path in template_paths if cache.needs_upload(path)]
+    print(
+        f"Uploading {len(pending)} of {len(template_paths)} templates "
+        f"({len(template_paths) - len(pending)} unchanged)",
+        file=sys.stderr,
+    )
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {
+            path: executor.submit(upload_template, path, args.bucket, args.prefix)
+            for path in pending
+        }
+        for path, future in futures.items():
+            try:
+                future.result()
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f"Couldn't upload {path}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            # Only recorded once the upload succeeds, so a failed upload is retried next build
+            cache.mark_uploaded(path)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
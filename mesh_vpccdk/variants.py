@@ -0,0 +1,157 @@
+"""
+The matrix of template variants app.py builds, by WireGuard tunnel count and router architecture
+(see TEMPLATE_VARIANT_WG_TUNNELS and TEMPLATE_VARIANT_ARCHITECTURES in constants.py). Nearly all
+of the time synthesizing a variant takes is spent in the CDK/jsii runtime, which is single
+threaded, so the variants are synthesized side by side in a pool of worker processes, each
+with its own runtime. On a multi-core build machine, adding variants then costs little extra
+build time.
+
+The spoke VPC stack's template (see spoke_vpc_stack.py) is built alongside them, as one more
+variant, which has no tunnels or router.
+
+The templates don't vary by region: the router image and availability zones are looked up in
+whichever region the stack is created in, so each variant's template deploys anywhere.
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from mesh_vpccdk.constants import (
+    DIRECT_UPLOAD_MAX_WG_TUNNELS,
+    SPOKE_STACK_NAME,
+    STACK_NAME,
+    TEMPLATE_VARIANT_ARCHITECTURES,
+    TEMPLATE_VARIANT_WG_TUNNELS,
+)
+from mesh_vpccdk.postprocess import clean_template, write_clean_template
+
+# Lists each variant and its clean template, for upload.py
+VARIANTS_MANIFEST_FILENAME = "template-variants.json"
+
+# The cloud assemblies of the variants other than the default are synthesized in here, since
+# the CDK CLI expects the default variant's assembly at the top level of cdk.out
+VARIANT_ASSEMBLIES_DIRECTORY = "variants"
+
+
+def get_variant_name(max_wg_tunnels: int, architecture: str) -> str:
+    if (max_wg_tunnels, architecture) == (
+        TEMPLATE_VARIANT_WG_TUNNELS[0],
+        TEMPLATE_VARIANT_ARCHITECTURES[0],
+    ):
+        # The default variant keeps the original template name, and so its published URL
+        return STACK_NAME
+    return f"{STACK_NAME}-{architecture}-{max_wg_tunnels}Tunnels"
+
+
+def get_template_variants() -> list:
+    """
+    Returns a dict of each variant's name and stack, whether it must fit the direct upload
+    limit, and the max_wg_tunnels and architecture of the router stack's variants. The first is
+    the default variant
+    """
+    return [
+        *[
+            {
+                "name": get_variant_name(max_wg_tunnels, architecture),
+                "stack": STACK_NAME,
+                "direct_upload": max_wg_tunnels <= DIRECT_UPLOAD_MAX_WG_TUNNELS,
+                "max_wg_tunnels": max_wg_tunnels,
+                "architecture": architecture,
+            }
+            for architecture in TEMPLATE_VARIANT_ARCHITECTURES
+            for max_wg_tunnels in TEMPLATE_VARIANT_WG_TUNNELS
+        ],
+        {"name": SPOKE_STACK_NAME, "stack": SPOKE_STACK_NAME, "direct_upload": True},
+    ]
+
+
+def get_clean_template_path(outdir: str, variant_name: str) -> str:
+    return os.path.join(outdir, f"{variant_name}.clean.template.json")
+
+
+def synthesize_variant(variant: dict, outdir: str) -> str:
+    """
+    Synthesizes the variant's stack, and writes its clean template into outdir. Returns the
+    budget report (see budget.check_template_budget()). Runs in a worker process
+    """
+    import aws_cdk as cdk
+
+    from mesh_vpccdk.mesh_vpc_cdk_stack import MeshVpcCDKStack
+    from mesh_vpccdk.spoke_vpc_stack import MeshSpokeVpcStack
+
+    assembly_dir = os.path.join(outdir, VARIANT_ASSEMBLIES_DIRECTORY, variant["name"])
+    app = cdk.App(outdir=assembly_dir)
+    if variant["stack"] == SPOKE_STACK_NAME:
+        MeshSpokeVpcStack(app, SPOKE_STACK_NAME)
+    else:
+        MeshVpcCDKStack(
+            app,
+            STACK_NAME,
+            max_wg_tunnels=variant["max_wg_tunnels"],
+            architecture=variant["architecture"],
+        )
+    app.synth()
+
+    template_path = os.path.join(assembly_dir, f"{variant['stack']}.template.json")
+    with open(template_path, "r") as f:
+        template_json = clean_template(json.load(f))
+
+    return write_clean_template(
+        template_json,
+        get_clean_template_path(outdir, variant["name"]),
+        direct_upload=variant["direct_upload"],
+    )
+
+
+class VariantPool:
+    """
+    Synthesizes variants in worker processes, in the background of the caller, which is free to
+    synthesize another variant itself in the meantime
+    """
+
+    def __init__(self, variants: list, outdir: str, max_workers: int = None):
+        self.executor = None
+        self.futures = {}
+        if not variants:
+            return
+
+        # Spawned rather than forked, since the parent may already have started its own CDK
+        # runtime, which a forked child would share
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers or min(len(variants), os.cpu_count()),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.futures = {
+            variant["name"]: self.executor.submit(synthesize_variant, variant, outdir)
+            for variant in variants
+        }
+
+    def wait(self) -> dict:
+        """
+        Waits for every variant to be synthesized, and returns each one's budget report by
+        name. Raises the first variant's error, if any fail
+        """
+        try:
+            return {name: future.result() for name, future in self.futures.items()}
+        finally:
+            if self.executor:
+                self.executor.shutdown(cancel_futures=True)
+
+
+def write_variants_manifest(variants: list, outdir: str):
+    with open(os.path.join(outdir, VARIANTS_MANIFEST_FILENAME), "w") as f:
+        json.dump(
+            [
+                {
+                    **variant,
+                    "template": os.path.basename(
+                        get_clean_template_path(outdir, variant["name"])
+                    ),
+                }
+                for variant in variants
+            ],
+            f,
+            indent=2,
+        )
@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from mesh_vpccdk.budget import (
+    DIRECT_UPLOAD_HEADROOM_BYTES,
+    DIRECT_UPLOAD_LIMIT_BYTES,
+    MAX_RESOURCES,
+    PSEUDO_PARAMETER_MAX_LENGTHS,
+    USER_DATA_LIMIT_BYTES,
+    TemplateBudgetError,
+    check_template_budget,
+    max_substituted_bytes,
+)
+
+PARAMETERS = {
+    "MeshCIDR": {"Type": "String", "MaxLength": 18},
+    "RouterProfile": {"Type": "String", "AllowedValues": ["nano", "standard"]},
+    "Unbounded": {"Type": "String"},
+}
+
+
+def check(template_json, direct_upload=False):
+    return check_template_budget(
+        template_json,
+        json.dumps(template_json, indent=2),
+        direct_upload,
+    )
+
+
+def make_padded_template(minified_bytes):
+    """
+    A template which is minified_bytes long once minified
+    """
+    template_json = {"Description": "", "Resources": {}}
+    padding = minified_bytes - len(json.dumps(template_json, separators=(",", ":")))
+    template_json["Description"] = "x" * padding
+    return template_json
+
+
+def make_user_data_template(user_data):
+    return {
+        "Parameters": PARAMETERS,
+        "Resources": {
+            "Router": {
+                "Type": "AWS::EC2::LaunchTemplate",
+                "Properties": {
+                    "LaunchTemplateData": {"UserData": {"Fn::Base64": user_data}}
+                },
+            }
+        },
+    }
+
+
+def test_max_substituted_bytes():
+    body = "cidr=${MeshCIDR} profile=${RouterProfile} region=${AWS::Region} ${!Literal}"
+    literal_bytes = len("cidr= profile= region= ${Literal}")
+
+    assert max_substituted_bytes({"Fn::Sub": body}, PARAMETERS, "test") == (
+        literal_bytes
+        + 18
+        + len("standard")
+        + PSEUDO_PARAMETER_MAX_LENGTHS["AWS::Region"]
+    )
+
+
+def test_max_substituted_bytes_sub_variables():
+    value = {
+        "Fn::Sub": [
+            "${Profile}",
+            {"Profile": {"Fn::If": ["Small", "nano", {"Ref": "MeshCIDR"}]}},
+        ]
+    }
+
+    assert max_substituted_bytes(value, PARAMETERS, "test") == 18
+
+
+def test_max_substituted_bytes_unbounded_parameter():
+    with pytest.raises(TemplateBudgetError, match="Unbounded"):
+        max_substituted_bytes({"Fn::Sub": "${Unbounded}"}, PARAMETERS, "test")
+
+
+def test_direct_upload_headroom():
+    limit = DIRECT_UPLOAD_LIMIT_BYTES - DIRECT_UPLOAD_HEADROOM_BYTES
+    check(make_padded_template(limit), direct_upload=True)
+
+    # Under the hard limit, but within the headroom
+    with pytest.raises(TemplateBudgetError, match="direct upload"):
+        check(make_padded_template(limit + 1), direct_upload=True)
+
+
+def test_direct_upload_only_reported_unless_enforced():
+    report = check(make_padded_template(DIRECT_UPLOAD_LIMIT_BYTES + 1))
+
+    assert f"{DIRECT_UPLOAD_LIMIT_BYTES + 1:,} / " in report
+
+
+def test_user_data_worst_case():
+    check(make_user_data_template({"Fn::Sub": "x" * 1000 + "${MeshCIDR}"}))
+
+    # Only over the limit with the parameter at its MaxLength
+    with pytest.raises(TemplateBudgetError, match="user data"):
+        check(
+            make_user_data_template(
+                {"Fn::Sub": "x" * (USER_DATA_LIMIT_BYTES - 10) + "${MeshCIDR}"}
+            )
+        )
+
+
+def test_oversized_ssm_parameter():
+    template_json = {
+        "Resources": {
+            "Config": {
+                "Type": "AWS::SSM::Parameter",
+                "Properties": {"Type": "String", "Value": "x" * 5000},
+            },
+            # Advanced tier parameters can hold more
+            "Advanced": {
+                "Type": "AWS::SSM::Parameter",
+                "Properties": {
+                    "Type": "String",
+                    "Tier": "Advanced",
+                    "Value": "x" * 5000,
+                },
+            },
+        }
+    }
+
+    with pytest.raises(TemplateBudgetError) as e:
+        check(template_json)
+    assert "Config value" in str(e.value)
+    assert "Advanced value" not in str(e.value)
+
+
+def test_reports_every_exceeded_limit():
+    template_json = make_padded_template(DIRECT_UPLOAD_LIMIT_BYTES)
+    template_json["Resources"] = {
+        f"Topic{i}": {"Type": "AWS::SNS::Topic"} for i in range(MAX_RESOURCES + 1)
+    }
+
+    with pytest.raises(TemplateBudgetError) as e:
+        check(template_json, direct_upload=True)
+    assert "resources" in str(e.value)
+    assert "direct upload" in str(e.value)
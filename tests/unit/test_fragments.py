@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from mesh_vpccdk.fragments import (
+    FragmentSyntaxError,
+    compile_fragment,
+    render_fragment,
+)
+
+
+def render(source, **context):
+    return compile_fragment(source)(context)
+
+
+def test_variables():
+    rendered = render(
+        "{{ name }} at {{ router.ip }}", name="wg1", router={"ip": "10.70.101.1"}
+    )
+    assert rendered == "wg1 at 10.70.101.1"
+
+
+def test_missing_variable():
+    with pytest.raises(KeyError):
+        render("{{ router.ip }}", router={})
+
+
+def test_cloudformation_placeholders_left_alone():
+    assert render("${MeshCIDR} {{ name }}", name="wg1") == "${MeshCIDR} wg1"
+
+
+def test_if_else():
+    source = "{% if baked %}baked{% else %}stock{% endif %}"
+    assert render(source, baked=True) == "baked"
+    assert render(source, baked=False) == "stock"
+    assert render("{% if not baked %}stock{% endif %}", baked=False) == "stock"
+
+
+def test_for():
+    source = "{% for package in packages %}- {{ package }}\n{% endfor %}"
+    assert render(source, packages=["bird2", "wireguard"]) == "- bird2\n- wireguard\n"
+
+
+def test_tag_and_comment_lines_removed():
+    source = (
+        "packages:\n"
+        "  {# Only on the stock image #}\n"
+        "  {% if not baked %}\n"
+        "  - bird2\n"
+        "  {% endif %}\n"
+        "runcmd:\n"
+    )
+    assert render(source, baked=False) == "packages:\n  - bird2\nruncmd:\n"
+    assert render(source, baked=True) == "packages:\nruncmd:\n"
+
+
+def test_inline_comment_stripped():
+    assert render("a{# note #}b") == "ab"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "{% if baked %}",
+        "{% for package in packages %}",
+        "{% endif %}",
+        "{% if baked %}{% endfor %}",
+        "{% for package of packages %}{% endfor %}",
+        "{% if maybe baked %}{% endif %}",
+        "{% include other %}",
+    ],
+)
+def test_syntax_errors(source):
+    with pytest.raises(FragmentSyntaxError):
+        compile_fragment(source)
+
+
+def test_render_fragment_recompiles_changed_file(tmp_path):
+    path = os.path.join(tmp_path, "fragment.yml")
+    with open(path, "w") as f:
+        f.write("{{ name }}\n")
+    assert render_fragment(path, name="wg1") == "wg1\n"
+
+    with open(path, "w") as f:
+        f.write("- {{ name }}\n")
+    # Make sure the modification time changes, however coarse the filesystem's timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert render_fragment(path, name="wg1") == "- wg1\n"
+
+
+def test_render_fragment_names_file_in_errors(tmp_path):
+    path = os.path.join(tmp_path, "broken.yml")
+    with open(path, "w") as f:
+        f.write("{% if baked %}\n")
+
+    with pytest.raises(FragmentSyntaxError, match="broken.yml"):
+        render_fragment(path, baked=True)
@@ -0,0 +1,162 @@
+import json
+
+from mesh_vpccdk.router_agents.mesh_router_accounting import (
+    CounterDeltas,
+    RollupStore,
+    parse_counters,
+    roll_up,
+)
+
+# `nft -j list set inet mesh_vpc egress_accounting`, with two elements
+NFT_SET_OUTPUT = json.dumps(
+    {
+        "nftables": [
+            {"metainfo": {"version": "1.0.2", "json_schema_version": 1}},
+            {
+                "set": {
+                    "family": "inet",
+                    "name": "egress_accounting",
+                    "table": "mesh_vpc",
+                    "type": ["ipv4_addr", "ipv4_addr"],
+                    "handle": 3,
+                    "size": 65536,
+                    "flags": ["timeout", "dynamic"],
+                    "timeout": 600,
+                    "elem": [
+                        {
+                            "elem": {
+                                "val": {"concat": ["10.70.100.10", "10.69.4.20"]},
+                                "timeout": 600,
+                                "expires": 512,
+                                "counter": {"packets": 120, "bytes": 96000},
+                            }
+                        },
+                        {
+                            "elem": {
+                                "val": {"concat": ["10.70.100.11", "10.69.5.1"]},
+                                "timeout": 600,
+                                "expires": 598,
+                                "counter": {"packets": 3, "bytes": 180},
+                            }
+                        },
+                    ],
+                }
+            },
+        ]
+    }
+)
+
+EMPTY_NFT_SET_OUTPUT = json.dumps(
+    {
+        "nftables": [
+            {"metainfo": {"version": "1.0.2", "json_schema_version": 1}},
+            {"set": {"family": "inet", "name": "egress_accounting"}},
+        ]
+    }
+)
+
+
+def test_parse_counters():
+    assert parse_counters(NFT_SET_OUTPUT) == {
+        ("10.70.100.10", "10.69.4.20"): 96000,
+        ("10.70.100.11", "10.69.5.1"): 180,
+    }
+
+
+def test_parse_counters_empty_set():
+    assert parse_counters(EMPTY_NFT_SET_OUTPUT) == {}
+
+
+def test_counter_deltas_first_reading_is_baseline():
+    deltas = CounterDeltas()
+
+    assert deltas.update({("a", "b"): 100}) == {}
+
+
+def test_counter_deltas():
+    deltas = CounterDeltas()
+    deltas.update({("a", "b"): 100, ("a", "c"): 50})
+
+    # Unchanged counters are left out, and new elements counted from zero
+    assert deltas.update({("a", "b"): 150, ("a", "c"): 50, ("d", "b"): 10}) == {
+        ("a", "b"): 50,
+        ("d", "b"): 10,
+    }
+
+
+def test_counter_deltas_reset_counter():
+    deltas = CounterDeltas()
+    deltas.update({("a", "b"): 100})
+
+    # The element expired and was recreated, so counted from zero since
+    assert deltas.update({("a", "b"): 30}) == {("a", "b"): 30}
+
+
+def test_roll_up():
+    assert roll_up(
+        {
+            ("10.70.100.10", "10.69.4.20"): 100,
+            ("10.70.100.10", "10.69.4.99"): 50,
+            ("10.70.100.10", "10.69.5.1"): 10,
+        },
+        24,
+    ) == {"10.70.100.10 10.69.4.0/24": 150, "10.70.100.10 10.69.5.0/24": 10}
+
+
+def test_rollup_store_buckets_by_time():
+    store = RollupStore(bucket_seconds=3600, bucket_count=24, max_pairs=10)
+    store.add(3600 * 10 + 5, {"a x": 100})
+    store.add(3600 * 10 + 3000, {"a x": 50, "b x": 10})
+    store.add(3600 * 11 + 5, {"a x": 1})
+
+    summary = store.summarize(3600 * 11 + 10, window_seconds=3600, top=10)
+
+    # The window overlaps both buckets
+    assert summary["total_bytes"] == 161
+    assert summary["pairs"] == [["a x", 151], ["b x", 10]]
+    assert summary["sources"] == [["a", 151], ["b", 10]]
+    assert summary["destinations"] == [["x", 161]]
+
+    assert store.summarize(3600 * 11 + 10, window_seconds=5, top=10)["total_bytes"] == 1
+
+
+def test_rollup_store_reuses_oldest_bucket():
+    store = RollupStore(bucket_seconds=60, bucket_count=3, max_pairs=10)
+    store.add(0, {"a x": 100})
+    store.add(180, {"a x": 1})
+
+    # The ring wrapped around, so the first bucket was replaced
+    assert len(store.buckets) == 3
+    assert store.summarize(180, window_seconds=3600, top=10)["total_bytes"] == 1
+
+
+def test_rollup_store_folds_smallest_pairs_into_other():
+    store = RollupStore(bucket_seconds=3600, bucket_count=24, max_pairs=2)
+    store.add(0, {"a x": 100, "b x": 50, "c x": 5, "d x": 1})
+
+    (bucket,) = [bucket for bucket in store.buckets if bucket]
+    assert bucket["pairs"] == {"a x": 100, "b x": 50}
+    assert bucket["other"] == 6
+
+    summary = store.summarize(0, window_seconds=3600, top=10)
+    assert summary["total_bytes"] == 156
+    assert summary["other_bytes"] == 6
+
+
+def test_rollup_store_save_and_load(tmp_path):
+    path = str(tmp_path / "rollup.json")
+    store = RollupStore(bucket_seconds=3600, bucket_count=24, max_pairs=10)
+    store.add(100, {"a x": 100})
+    store.save(path)
+
+    loaded = RollupStore.load(path, 3600, 24, 10)
+    assert loaded.summarize(100, 3600, 10) == store.summarize(100, 3600, 10)
+
+    # A store with different bucket lengths is started afresh
+    assert RollupStore.load(path, 60, 24, 10).buckets == [None] * 24
+
+
+def test_rollup_store_load_missing(tmp_path):
+    store = RollupStore.load(str(tmp_path / "missing.json"), 3600, 24, 10)
+
+    assert store.buckets == [None] * 24
@@ -0,0 +1,215 @@
+import os
+
+import pytest
+
+from mesh_vpccdk.cloud_config import ROUTER_TEMPLATE_DIRECTORY, get_router_files
+from mesh_vpccdk.router_agents.mesh_router_config import (
+    RouterConfigError,
+    render_bird_conf,
+    render_nftables_conf,
+    render_static_routes_netplan,
+    render_sysctl_conf,
+    render_wireguard_netplan,
+    select_zone_tunnels,
+    validate_config,
+)
+from mesh_vpccdk.router_config import get_tunnel_zone
+
+
+def make_tunnel(num):
+    return {
+        "interface": f"wg{num}",
+        "listen_port": 51810 + num,
+        "aws_side_ip": f"10.70.101.{2 * num - 1}",
+        "mesh_side_ip": f"10.70.101.{2 * num - 2}",
+        "server_public_key": "FRjRFt/XnSa1tDqnH5g3Y6CikIar/bq3uwUh5vfU/UI=",
+        "server_ip": "199.170.132.4",
+        "server_port": "51820",
+        "ospf_cost": "10",
+        "mtu": "1420",
+    }
+
+
+def make_config(num_tunnels, subnet_layout="multi-az", zone=1):
+    return {
+        "router_id": "10.70.101.1",
+        "vpc_cidr": "10.70.100.0/27",
+        "subnet_layout": subnet_layout,
+        "ospf_hello": "2",
+        "ospf_dead": "8",
+        "tunnels": [make_tunnel(num) for num in range(1, num_tunnels + 1)],
+        "zone": zone,
+    }
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    """
+    The templates as installed on the router
+    """
+    for path, file in get_router_files().items():
+        if path.startswith(ROUTER_TEMPLATE_DIRECTORY):
+            with open(os.path.join(tmp_path, os.path.basename(path)), "w") as f:
+                f.write(file["content"])
+    return str(tmp_path)
+
+
+def make_valid_config(num_tunnels=2, **settings):
+    config = make_config(num_tunnels, subnet_layout="single")
+    config.update(settings)
+    validate_config(config)
+    return config
+
+
+def test_select_zone_tunnels_alternates_zones():
+    config = make_config(4)
+    select_zone_tunnels(config)
+    assert [tunnel["interface"] for tunnel in config["tunnels"]] == ["wg1", "wg3"]
+    assert config["router_id"] == "10.70.101.1"
+
+    config = make_config(4, zone=2)
+    select_zone_tunnels(config)
+    assert [tunnel["interface"] for tunnel in config["tunnels"]] == ["wg2", "wg4"]
+    # The second zone's router can't use the first tunnel's address as its router ID
+    assert config["router_id"] == "10.70.101.3"
+
+
+def test_select_zone_tunnels_matches_stack():
+    for zone in [1, 2]:
+        config = make_config(8, zone=zone)
+        select_zone_tunnels(config)
+        assert {tunnel["interface"] for tunnel in config["tunnels"]} == {
+            f"wg{tunnel_num + 1}"
+            for tunnel_num in range(8)
+            if get_tunnel_zone(tunnel_num) == zone
+        }
+
+
+def test_select_zone_tunnels_single_layout_keeps_every_tunnel():
+    config = make_config(3, subnet_layout="single")
+    select_zone_tunnels(config)
+    assert len(config["tunnels"]) == 3
+
+
+def test_select_zone_tunnels_empty_zone():
+    with pytest.raises(RouterConfigError):
+        select_zone_tunnels(make_config(1, zone=2))
+
+
+def test_validate_config_subnet_layout():
+    validate_config(make_config(2))
+
+    config = make_config(2)
+    config["subnet_layout"] = "three-az"
+    with pytest.raises(RouterConfigError):
+        validate_config(config)
+
+    config = make_config(2)
+    del config["subnet_layout"]
+    with pytest.raises(RouterConfigError):
+        validate_config(config)
+
+
+def test_render_sysctl_conf_hashes_ports_with_ecmp():
+    assert "fib_multipath_hash_policy = 0\n" in render_sysctl_conf(make_valid_config())
+    assert "fib_multipath_hash_policy = 1\n" in render_sysctl_conf(
+        make_valid_config(ecmp="enabled")
+    )
+    assert "rp_filter = 2\n" in render_sysctl_conf(make_valid_config())
+
+
+def test_render_nftables_conf_clamps_mss_to_smallest_tunnel(template_dir):
+    config = make_valid_config(3)
+    config["tunnels"][1]["mtu"] = "1380"
+
+    assert "set 1340\n" in render_nftables_conf(config, template_dir)
+
+
+def test_render_nftables_conf_fast_path(template_dir):
+    disabled = render_nftables_conf(make_valid_config(), template_dir)
+    assert "notrack" not in disabled
+    assert "flowtable" not in disabled
+
+    notrack = render_nftables_conf(make_valid_config(fast_path="notrack"), template_dir)
+    assert "fib daddr type != local notrack" in notrack
+
+    flowtable = render_nftables_conf(
+        make_valid_config(fast_path="flowtable"), template_dir
+    )
+    assert "devices = { ens5, wg1, wg2 };" in flowtable
+    assert "flow add @fastpath" in flowtable
+
+
+def test_render_nftables_conf_flowtable_on_standby(template_dir):
+    config = make_valid_config(fast_path="flowtable", role="standby")
+
+    assert "devices = { ens5 };" in render_nftables_conf(config, template_dir)
+
+
+def test_render_nftables_conf_egress_accounting(template_dir):
+    rendered = render_nftables_conf(
+        make_valid_config(egress_accounting="enabled"), template_dir
+    )
+
+    assert "set egress_accounting {" in rendered
+    assert "update @egress_accounting { ip saddr . ip daddr counter }" in rendered
+
+
+def test_render_bird_conf_interfaces(template_dir):
+    config = make_valid_config(bfd="enabled", cost_overrides={"wg2": "50"})
+    rendered = render_bird_conf(config, template_dir)
+
+    assert 'interface "wg1" {' in rendered
+    assert 'interface "wg2" {' in rendered
+    assert "cost 10;" in rendered
+    assert "cost 50;" in rendered
+    assert "hello 2;" in rendered
+    assert "dead 8;" in rendered
+    assert "bfd yes;" in rendered
+    assert "protocol bfd" in rendered
+
+
+def test_render_bird_conf_aggregate_filtering(template_dir):
+    config = make_valid_config(
+        route_filtering="aggregate",
+        mesh_anchor="10.69.0.0",
+        mesh_cidrs=["10.0.0.0/8", "199.167.59.0/24"],
+    )
+    rendered = render_bird_conf(config, template_dir)
+
+    assert "route 10.0.0.0/8 recursive 10.69.0.0;" in rendered
+    assert "export where net = 10.70.100.0/27" in rendered
+
+
+def test_render_bird_conf_spoke_cidr(template_dir):
+    rendered = render_bird_conf(
+        make_valid_config(spoke_cidr="10.70.200.0/22"), template_dir
+    )
+
+    assert "route 10.70.200.0/22 via 10.70.100.1;" in rendered
+
+
+def test_render_wireguard_netplan(template_dir):
+    rendered = render_wireguard_netplan(make_valid_config(), template_dir)
+
+    assert "    wg1:\n" in rendered
+    assert "    wg2:\n" in rendered
+    assert "port: 51812\n" in rendered
+    assert "endpoint: 199.170.132.4:51820\n" in rendered
+
+
+def test_render_wireguard_netplan_standby_has_no_tunnels(template_dir):
+    rendered = render_wireguard_netplan(make_valid_config(role="standby"), template_dir)
+
+    assert "tunnels: {}\n" in rendered
+    assert "wg1" not in rendered
+
+
+def test_render_static_routes_netplan():
+    config = make_valid_config(vpc_mtu="1500")
+    config["tunnels"][1]["server_ip"] = "199.170.132.5"
+    rendered = render_static_routes_netplan(config)
+
+    assert "mtu: 1500\n" in rendered
+    assert "- to: 199.170.132.4\n        via: 10.70.100.1\n" in rendered
+    assert "- to: 199.170.132.5\n        via: 10.70.100.1\n" in rendered
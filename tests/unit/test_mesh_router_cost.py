@@ -0,0 +1,131 @@
+from mesh_vpccdk.router_agents.mesh_router_cost import (
+    MAX_OSPF_COST,
+    CostController,
+    parse_probe,
+)
+
+TUNNELS = [
+    {"interface": "wg0", "ospf_cost": "10", "mesh_side_ip": "10.71.0.0"},
+    {"interface": "wg1", "ospf_cost": "10", "mesh_side_ip": "10.71.0.2"},
+]
+
+
+def make_controller(applied=None, **kwargs):
+    options = {
+        "smoothing": 1.0,
+        "ms_per_cost": 1.0,
+        "loss_cost": 1000,
+        "hysteresis": 0.2,
+        "min_change": 5,
+        "hold": 3,
+    }
+    options.update(kwargs)
+    return CostController(applied or {}, **options)
+
+
+def run_rounds(controller, rtts, tunnels=TUNNELS):
+    """
+    Feeds the controller one round of probe results per item of rtts, each a dict of interface
+    to RTT (None for 100% loss). Returns whether each round changed an applied cost
+    """
+    return [
+        controller.update(
+            tunnels,
+            {
+                interface: (rtt, 0.0 if rtt is not None else 1.0)
+                for interface, rtt in round_rtts.items()
+            },
+        )
+        for round_rtts in rtts
+    ]
+
+
+def test_parse_probe():
+    output = (
+        "--- 10.71.0.0 ping statistics ---\n"
+        "5 packets transmitted, 4 received, 20% packet loss, time 812ms\n"
+        "rtt min/avg/max/mdev = 11.204/12.500/14.031/1.104 ms\n"
+    )
+    assert parse_probe(output) == (12.5, 0.2)
+
+
+def test_parse_probe_nothing_back():
+    output = (
+        "--- 10.71.0.0 ping statistics ---\n"
+        "5 packets transmitted, 0 received, 100% packet loss, time 4093ms\n"
+    )
+    assert parse_probe(output) == (None, 1.0)
+
+
+def test_applies_cost_after_hold():
+    controller = make_controller()
+
+    changes = run_rounds(controller, [{"wg0": 40, "wg1": 2}] * 3)
+
+    assert changes == [False, False, True]
+    assert controller.applied == {"wg0": 50}
+
+
+def test_small_changes_ignored():
+    controller = make_controller()
+
+    # 10 + 3ms is within min_change of the base cost
+    changes = run_rounds(controller, [{"wg0": 3, "wg1": 4}] * 10)
+
+    assert not any(changes)
+    assert controller.applied == {}
+
+
+def test_hysteresis_scales_with_applied_cost():
+    controller = make_controller(applied={"wg0": 200, "wg1": 10}, min_change=1)
+
+    # 30 is within 20% of 200, but 60 isn't
+    assert not any(run_rounds(controller, [{"wg0": 220, "wg1": 0}] * 5))
+    assert run_rounds(controller, [{"wg0": 250, "wg1": 0}] * 3)[-1]
+    assert controller.applied["wg0"] == 260
+
+
+def test_spike_shorter_than_hold_ignored():
+    controller = make_controller(applied={"wg0": 20, "wg1": 20})
+
+    changes = run_rounds(
+        controller,
+        [{"wg0": 10, "wg1": 10}]
+        + [{"wg0": 500, "wg1": 10}] * 2
+        + [{"wg0": 10, "wg1": 10}] * 3,
+    )
+
+    assert not any(changes)
+
+
+def test_smoothing_weights_new_samples():
+    controller = make_controller(smoothing=0.3)
+
+    run_rounds(controller, [{"wg0": 20, "wg1": 20}] * 5 + [{"wg0": 300, "wg1": 20}])
+
+    # The first sample is taken as is, then each one only moves the average by 30%
+    assert controller.rtt == {"wg0": 0.3 * 300 + 0.7 * 20, "wg1": 20}
+
+
+def test_dead_tunnel_gets_max_cost():
+    controller = make_controller()
+
+    run_rounds(controller, [{"wg0": None, "wg1": 10}] * 3)
+
+    assert controller.applied["wg0"] == MAX_OSPF_COST
+
+
+def test_loss_adds_cost():
+    controller = make_controller()
+
+    for _ in range(3):
+        controller.update(TUNNELS, {"wg0": (10, 0.2), "wg1": (10, 0.0)})
+
+    assert controller.applied == {"wg0": 10 + 10 + 200, "wg1": 20}
+
+
+def test_removed_tunnel_forgotten():
+    controller = make_controller(applied={"wg0": 50, "wg1": 50})
+
+    assert controller.update(TUNNELS[:1], {"wg0": (40, 0.0)})
+    assert set(controller.applied) == {"wg0"}
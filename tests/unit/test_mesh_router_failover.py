@@ -0,0 +1,265 @@
+import pytest
+
+from mesh_vpccdk.router_agents.mesh_router_failover import (
+    ACTIVE,
+    STANDBY,
+    FailoverController,
+    FailoverError,
+)
+
+ROUTE_TABLE_IDS = ["rtb-a", "rtb-b"]
+MESH_CIDRS = ["10.0.0.0/8", "199.167.59.0/24"]
+
+
+class FakeEc2:
+    def __init__(self, owner):
+        self.routes = {
+            route_table_id: {cidr: owner for cidr in MESH_CIDRS}
+            for route_table_id in ROUTE_TABLE_IDS
+        }
+        self.describe_calls = 0
+
+    def get_route_targets(self, route_table_id):
+        self.describe_calls += 1
+        return dict(self.routes[route_table_id])
+
+    def replace_route(self, route_table_id, cidr, instance_id):
+        self.routes[route_table_id][cidr] = instance_id
+
+    def owners(self):
+        return {owner for routes in self.routes.values() for owner in routes.values()}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_controller(ec2, clock, instance_id="i-standby", role=STANDBY, **kwargs):
+    health = {"reachable": True}
+    roles = []
+    controller = FailoverController(
+        ec2,
+        ROUTE_TABLE_IDS,
+        MESH_CIDRS,
+        instance_id,
+        health_check=lambda: health["reachable"],
+        role=role,
+        on_role_change=roles.append,
+        clock=clock,
+        **kwargs,
+    )
+    return controller, health, roles
+
+
+def test_stays_standby_while_mesh_reachable(clock):
+    ec2 = FakeEc2("i-active")
+    controller, _, roles = make_controller(ec2, clock)
+
+    for _ in range(10):
+        clock.now += 100
+        assert controller.step() == STANDBY
+
+    assert ec2.owners() == {"i-active"}
+    assert roles == []
+
+
+def test_takes_over_after_failure_threshold(clock):
+    ec2 = FakeEc2("i-active")
+    controller, health, roles = make_controller(ec2, clock, failure_threshold=3)
+    controller.step()
+    clock.now += 60
+    health["reachable"] = False
+
+    assert controller.step() == STANDBY
+    assert controller.step() == STANDBY
+    assert ec2.owners() == {"i-active"}
+
+    assert controller.step() == ACTIVE
+    assert ec2.owners() == {"i-standby"}
+    assert roles == [ACTIVE]
+
+
+def test_successful_probe_resets_failures(clock):
+    ec2 = FakeEc2("i-active")
+    controller, health, _ = make_controller(ec2, clock, failure_threshold=3)
+    controller.step()
+    clock.now += 60
+
+    for reachable in [False, False, True, False, False]:
+        health["reachable"] = reachable
+        assert controller.step() == STANDBY
+
+    assert ec2.owners() == {"i-active"}
+
+
+def test_hold_down_after_start(clock):
+    ec2 = FakeEc2("i-active")
+    controller, health, _ = make_controller(ec2, clock, hold_down=60)
+    health["reachable"] = False
+
+    assert controller.step() == STANDBY
+    for _ in range(5):
+        clock.now += 10
+        assert controller.step() == STANDBY
+    assert ec2.owners() == {"i-active"}
+
+    clock.now += 10
+    assert controller.step() == ACTIVE
+
+
+def test_hold_down_after_owner_changes(clock):
+    ec2 = FakeEc2("i-active")
+    controller, health, _ = make_controller(ec2, clock, hold_down=60)
+    clock.now += 60
+    controller.step()
+
+    # e.g. a stack update pointed the routes at a replacement router
+    for route_table_id in ROUTE_TABLE_IDS:
+        for cidr in MESH_CIDRS:
+            ec2.replace_route(route_table_id, cidr, "i-replacement")
+    health["reachable"] = False
+
+    assert controller.step() == STANDBY
+    for _ in range(5):
+        clock.now += 10
+        assert controller.step() == STANDBY
+    clock.now += 10
+    assert controller.step() == ACTIVE
+
+
+def test_completes_partial_takeover(clock):
+    ec2 = FakeEc2("i-active")
+    # A previous take over was interrupted after the first route table
+    for cidr in MESH_CIDRS:
+        ec2.replace_route("rtb-a", cidr, "i-standby")
+    controller, _, roles = make_controller(ec2, clock)
+
+    assert controller.step() == ACTIVE
+    assert ec2.owners() == {"i-standby"}
+    assert roles == [ACTIVE]
+
+
+def test_demotes_when_another_router_owns_routes(clock):
+    ec2 = FakeEc2("i-standby")
+    controller, _, roles = make_controller(ec2, clock, role=ACTIVE)
+    assert controller.step() == ACTIVE
+
+    for route_table_id in ROUTE_TABLE_IDS:
+        for cidr in MESH_CIDRS:
+            ec2.replace_route(route_table_id, cidr, "i-active")
+
+    assert controller.step() == STANDBY
+    assert roles == [STANDBY]
+
+
+def test_mesh_down_for_both_routers_backs_off(clock):
+    ec2 = FakeEc2("i-a")
+    routers = [
+        make_controller(ec2, clock, "i-a", ACTIVE, hold_down=60, max_hold_down=600),
+        make_controller(ec2, clock, "i-b", STANDBY, hold_down=60, max_hold_down=600),
+    ]
+    for _, health, _ in routers:
+        health["reachable"] = False
+
+    takeovers = []
+    for _ in range(3600):
+        clock.now += 1
+        owner = ec2.owners()
+        for controller, _, _ in routers:
+            controller.step()
+        if ec2.owners() != owner:
+            takeovers.append(clock.now)
+
+    # Without backing off, the routes would move every minute or so
+    gaps = [later - earlier for earlier, later in zip(takeovers, takeovers[1:])]
+    assert len(takeovers) < 12
+    assert gaps[0] >= 120
+    assert gaps[-1] >= 600
+
+
+def test_route_tables_polled_sparsely(clock):
+    ec2 = FakeEc2("i-active")
+    controller, _, _ = make_controller(ec2, clock, route_poll_interval=30)
+
+    for _ in range(60):
+        clock.now += 1
+        controller.step()
+
+    # Each read describes every route table
+    assert ec2.describe_calls == 2 * len(ROUTE_TABLE_IDS)
+
+
+def test_rereads_routes_before_taking_over(clock):
+    ec2 = FakeEc2("i-active")
+    controller, health, _ = make_controller(
+        ec2, clock, failure_threshold=1, route_poll_interval=3600
+    )
+    controller.step()
+    clock.now += 60
+    health["reachable"] = False
+
+    # Another router took over since the routes were last read
+    for route_table_id in ROUTE_TABLE_IDS:
+        for cidr in MESH_CIDRS:
+            ec2.replace_route(route_table_id, cidr, "i-other")
+
+    assert controller.step() == STANDBY
+    assert ec2.owners() == {"i-other"}
+
+
+def test_take_over_nudges_old_owner(clock):
+    ec2 = FakeEc2("i-active")
+    nudged = []
+    controller, health, _ = make_controller(
+        ec2, clock, failure_threshold=1, notify_demoted=nudged.append
+    )
+    controller.step()
+    clock.now += 60
+    health["reachable"] = False
+
+    assert controller.step() == ACTIVE
+    assert nudged == ["i-active"]
+
+
+def test_take_over_survives_failed_nudge(clock):
+    def notify_demoted(instance_id):
+        raise FailoverError("describe-instances failed")
+
+    ec2 = FakeEc2("i-active")
+    controller, health, _ = make_controller(
+        ec2, clock, failure_threshold=1, notify_demoted=notify_demoted
+    )
+    controller.step()
+    clock.now += 60
+    health["reachable"] = False
+
+    assert controller.step() == ACTIVE
+    assert ec2.owners() == {"i-standby"}
+
+
+def test_nudge_demotes_without_waiting_for_poll(clock):
+    ec2 = FakeEc2("i-active")
+    controller, _, roles = make_controller(
+        ec2, clock, instance_id="i-active", role=ACTIVE, route_poll_interval=30
+    )
+    controller.step()
+
+    for route_table_id in ROUTE_TABLE_IDS:
+        for cidr in MESH_CIDRS:
+            ec2.replace_route(route_table_id, cidr, "i-standby")
+
+    clock.now += 2
+    assert controller.step() == ACTIVE
+    controller.nudge()
+    clock.now += 2
+    assert controller.step() == STANDBY
+    assert roles == [STANDBY]
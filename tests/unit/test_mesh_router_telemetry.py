@@ -0,0 +1,55 @@
+import json
+import subprocess
+
+import pytest
+
+from mesh_vpccdk.router_agents import mesh_router_telemetry
+from mesh_vpccdk.router_agents.mesh_router_telemetry import (
+    MAX_METRICS_PER_REQUEST,
+    CloudWatchSink,
+    SinkWriteError,
+)
+
+
+@pytest.fixture
+def put_metric_data(monkeypatch):
+    """
+    Records the number of datums in each put-metric-data call, failing the calls listed in
+    fail_calls
+    """
+    calls = []
+    fail_calls = set()
+
+    def run(command, **kwargs):
+        with open(command[-1][len("file://") :], "r") as f:
+            calls.append(len(json.load(f)))
+        returncode = 255 if len(calls) - 1 in fail_calls else 0
+        return subprocess.CompletedProcess(command, returncode, stderr="Throttling")
+
+    monkeypatch.setattr(mesh_router_telemetry.subprocess, "run", run)
+    return calls, fail_calls
+
+
+def make_datums(count):
+    return [{"MetricName": "Test", "Value": i} for i in range(count)]
+
+
+def test_sends_in_chunks(put_metric_data):
+    calls, _ = put_metric_data
+
+    CloudWatchSink("Test").write(make_datums(2 * MAX_METRICS_PER_REQUEST + 1))
+
+    assert calls == [MAX_METRICS_PER_REQUEST, MAX_METRICS_PER_REQUEST, 1]
+
+
+def test_failed_chunk_keeps_only_unsent_datums(put_metric_data):
+    calls, fail_calls = put_metric_data
+    fail_calls.add(1)
+    datums = make_datums(3 * MAX_METRICS_PER_REQUEST)
+
+    with pytest.raises(SinkWriteError) as error:
+        CloudWatchSink("Test").write(datums)
+
+    # The first chunk was sent, so isn't sent again
+    assert error.value.unsent == datums[MAX_METRICS_PER_REQUEST:]
+    assert calls == [MAX_METRICS_PER_REQUEST, MAX_METRICS_PER_REQUEST]
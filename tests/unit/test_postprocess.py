@@ -0,0 +1,172 @@
+import copy
+
+from mesh_vpccdk.postprocess import (
+    POSTPROCESS_PASSES,
+    clean_template,
+    remove_bootstrap_rule,
+    resolve_ssm_parameters,
+    use_published_router_files,
+)
+from mesh_vpccdk.cloud_config import get_published_router_files_location
+
+AMI_PARAMETER = (
+    "SsmParameterValueawsservicecanonicalubuntuserverfocalstablecurrentarm64hvmebsgp2amiid"
+    "C96584B6F00A464EAD1953AFF4B05118Parameter"
+)
+AMI_SSM_PARAMETER = (
+    "/aws/service/canonical/ubuntu/server/focal/stable/current/arm64/hvm/ebs-gp2/ami-id"
+)
+
+
+def make_cdk_template():
+    """
+    A minimal template shaped like the CDK's synthesized output
+    """
+    return {
+        "Parameters": {
+            "MeshCIDR": {"Type": "String", "Default": "10.70.100.0/27"},
+            AMI_PARAMETER: {
+                "Type": "AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>",
+                "Default": AMI_SSM_PARAMETER,
+            },
+            "BootstrapVersion": {
+                "Type": "AWS::SSM::Parameter::Value<String>",
+                "Default": "/cdk-bootstrap/hnb659fds/version",
+            },
+        },
+        "Resources": {
+            "Instance": {
+                "Type": "AWS::EC2::Instance",
+                "Properties": {
+                    "ImageId": {
+                        "Fn::If": ["Baked", "ami-0123", {"Ref": AMI_PARAMETER}]
+                    },
+                    "SubnetId": {"Ref": "Subnet"},
+                },
+            },
+            "Subnet": {
+                "Type": "AWS::EC2::Subnet",
+                "Properties": {"CidrBlock": {"Ref": "MeshCIDR"}},
+            },
+        },
+        "Rules": {
+            "CheckBootstrapVersion": {
+                "Assertions": [{"Assert": {"Ref": "BootstrapVersion"}}]
+            }
+        },
+    }
+
+
+def test_passes_registered_in_order():
+    assert POSTPROCESS_PASSES[:2] == [remove_bootstrap_rule, resolve_ssm_parameters]
+
+
+def test_remove_bootstrap_rule():
+    expected = make_cdk_template()
+    del expected["Rules"]
+    del expected["Parameters"]["BootstrapVersion"]
+
+    assert remove_bootstrap_rule(make_cdk_template()) == expected
+
+
+def test_remove_bootstrap_rule_without_rule():
+    template_json = make_cdk_template()
+    del template_json["Rules"]
+    del template_json["Parameters"]["BootstrapVersion"]
+    expected = copy.deepcopy(template_json)
+
+    assert remove_bootstrap_rule(template_json) == expected
+
+
+def test_remove_bootstrap_rule_keeps_other_rules():
+    template_json = make_cdk_template()
+    other_rule = {"Assertions": [{"Assert": {"Fn::Equals": ["a", "a"]}}]}
+    template_json["Rules"]["OtherRule"] = other_rule
+
+    assert remove_bootstrap_rule(template_json)["Rules"] == {"OtherRule": other_rule}
+
+
+def test_resolve_ssm_parameters():
+    expected = make_cdk_template()
+    del expected["Parameters"][AMI_PARAMETER]
+    expected["Resources"]["Instance"]["Properties"]["ImageId"] = {
+        "Fn::If": [
+            "Baked",
+            "ami-0123",
+            f"{{{{resolve:ssm:{AMI_SSM_PARAMETER}}}}}",
+        ]
+    }
+
+    assert resolve_ssm_parameters(make_cdk_template()) == expected
+
+
+def test_resolve_ssm_parameters_leaves_other_refs():
+    template_json = resolve_ssm_parameters(make_cdk_template())
+
+    assert template_json["Resources"]["Subnet"]["Properties"]["CidrBlock"] == {
+        "Ref": "MeshCIDR"
+    }
+    assert template_json["Resources"]["Instance"]["Properties"]["SubnetId"] == {
+        "Ref": "Subnet"
+    }
+
+
+def test_use_published_router_files():
+    asset_variables = {
+        "RouterFilesBucket": {
+            "Fn::Sub": "cdk-hnb659fds-assets-${AWS::AccountId}-${AWS::Region}"
+        },
+        "RouterFilesKey": "0123.gz",
+    }
+    template_json = make_cdk_template()
+    template_json["Resources"]["Parameter"] = {
+        "Type": "AWS::SSM::Parameter",
+        "Properties": {
+            "Value": {
+                "Fn::Sub": [
+                    '{"bucket": "${RouterFilesBucket}", "cidr": "${MeshCIDR}"}',
+                    dict(asset_variables, Other={"Ref": "Subnet"}),
+                ]
+            }
+        },
+    }
+
+    location = get_published_router_files_location()
+    assert use_published_router_files(template_json)["Resources"]["Parameter"][
+        "Properties"
+    ]["Value"]["Fn::Sub"][1] == {
+        "RouterFilesBucket": location["bucket"],
+        "RouterFilesKey": location["key"],
+        "Other": {"Ref": "Subnet"},
+    }
+
+
+def test_clean_template_runs_every_pass():
+    template_json = clean_template(make_cdk_template())
+
+    assert "Rules" not in template_json
+    assert set(template_json["Parameters"]) == {"MeshCIDR"}
+
+
+def test_clean_template_runs_given_passes():
+    template_json = clean_template(make_cdk_template(), passes=[remove_bootstrap_rule])
+
+    assert "Rules" not in template_json
+    assert set(template_json["Parameters"]) == {"MeshCIDR", AMI_PARAMETER}
+
+
+def test_clean_template_uses_each_pass_result():
+    calls = []
+
+    def replace(template_json):
+        calls.append("replace")
+        return {"Resources": {}}
+
+    def record(template_json):
+        calls.append(template_json)
+        return template_json
+
+    assert clean_template(make_cdk_template(), passes=[replace, record]) == {
+        "Resources": {}
+    }
+    assert calls == ["replace", {"Resources": {}}]
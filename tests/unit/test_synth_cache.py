@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from mesh_vpccdk.postprocess import MINIFY_ENV_VAR
+from mesh_vpccdk.synth_cache import SynthCache, compute_input_hash
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """
+    A minimal project tree, with none of the input environment variables set
+    """
+    for env_var in ["CDK_CONTEXT_JSON", MINIFY_ENV_VAR]:
+        monkeypatch.delenv(env_var, raising=False)
+    write_file(os.path.join(tmp_path, "app.py"), "app\n")
+    write_file(os.path.join(tmp_path, "cdk.json"), "{}\n")
+    write_file(os.path.join(tmp_path, "mesh_vpccdk", "stack.py"), "stack\n")
+    return str(tmp_path)
+
+
+def test_input_hash_is_stable(project):
+    assert compute_input_hash(project) == compute_input_hash(project)
+
+
+def test_input_hash_changes_with_source(project):
+    before = compute_input_hash(project)
+    write_file(os.path.join(project, "mesh_vpccdk", "stack.py"), "changed\n")
+
+    assert compute_input_hash(project) != before
+
+
+def test_input_hash_changes_with_new_fragment(project):
+    before = compute_input_hash(project)
+    write_file(os.path.join(project, "mesh_vpccdk", "bird.conf"), "router id\n")
+
+    assert compute_input_hash(project) != before
+
+
+def test_input_hash_ignores_bytecode(project):
+    before = compute_input_hash(project)
+    write_file(
+        os.path.join(project, "mesh_vpccdk", "__pycache__", "stack.cpython-311.pyc"),
+        "bytecode",
+    )
+    write_file(os.path.join(project, "mesh_vpccdk", "stack.pyc"), "bytecode")
+
+    assert compute_input_hash(project) == before
+
+
+def test_input_hash_changes_with_minify(project, monkeypatch):
+    before = compute_input_hash(project)
+    monkeypatch.setenv(MINIFY_ENV_VAR, "1")
+
+    assert compute_input_hash(project) != before
+
+
+def test_input_hash_changes_with_context(project, monkeypatch):
+    before = compute_input_hash(project)
+    monkeypatch.setenv("CDK_CONTEXT_JSON", '{"variant": "baked"}')
+
+    assert compute_input_hash(project) != before
+
+
+def test_store_and_restore(tmp_path):
+    cache = SynthCache(os.path.join(tmp_path, "cache"))
+    outdir = os.path.join(tmp_path, "cdk.out")
+    write_file(os.path.join(outdir, "Stack.template.json"), "{}")
+
+    assert not cache.restore("abc", os.path.join(tmp_path, "restored"))
+    cache.store("abc", outdir)
+    assert cache.restore("abc", os.path.join(tmp_path, "restored"))
+    assert os.path.isfile(os.path.join(tmp_path, "restored", "Stack.template.json"))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = SynthCache(os.path.join(tmp_path, "cache"), max_entries=2)
+    outdir = os.path.join(tmp_path, "cdk.out")
+    write_file(os.path.join(outdir, "Stack.template.json"), "{}")
+    restored = os.path.join(tmp_path, "restored")
+
+    cache.store("first", outdir)
+    cache.store("second", outdir)
+    entries_dir = os.path.join(tmp_path, "cache", "entries")
+    os.utime(os.path.join(entries_dir, "first"), (1000, 1000))
+    os.utime(os.path.join(entries_dir, "second"), (2000, 2000))
+    # Restoring the oldest entry makes it the most recently used
+    assert cache.restore("first", restored)
+    cache.store("third", outdir)
+
+    assert cache.restore("first", restored)
+    assert not cache.restore("second", restored)
+    assert cache.restore("third", restored)
+
+
+def test_needs_upload(tmp_path):
+    cache = SynthCache(os.path.join(tmp_path, "cache"))
+    template_path = os.path.join(tmp_path, "Stack.clean.template.json")
+    write_file(template_path, "{}")
+
+    assert cache.needs_upload(template_path)
+    cache.mark_uploaded(template_path)
+    assert not cache.needs_upload(template_path)
+
+    write_file(template_path, '{"Resources": {}}')
+    assert cache.needs_upload(template_path)